@@ -26,7 +26,7 @@ setuptools.setup(
         "wxPython",
         "opencv-python",
         "numpy",
-        "Pillow",
+        "Pillow>=9.1",
         "six",
     ],
     classifiers=[
@@ -36,6 +36,9 @@ setuptools.setup(
         "Topic :: Utilities",
     ],
     entry_points={
-        "console_scripts": ["story-time=story_time.main:main"],
+        "console_scripts": [
+            "story-time=story_time.main:main",
+            "story-time-migrate=story_time.migrate:main",
+        ],
     },
 )
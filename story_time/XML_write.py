@@ -3,15 +3,46 @@
 """This module contains the XML reading and writing utilities.
 
 All the text is stored in an XML file and the images are referenced
-in the file.
+in the file. The head of each file contains a summary of the year
+(number of entries, earliest and latest date and a checksum), which
+can be read without parsing the whole document, see
+:func:`read_year_summary`. The entries are kept sorted by date and
+time, which is recorded in the head, so readers can stop early.
+
+Dates are passed as ISO strings and compared as integer timestamps,
+see :mod:`story_time.timestamps`, the conversion from and to
+`wx.DateTime` is done by the user interface.
+
+New entries of a year that already has an XML file are appended to a
+journal next to it (`<year>.journal`), one serialized entry per line,
+instead of rewriting the whole file. Readers merge the journal into the
+tree and :func:`compact_journal` folds it back into the XML file.
 """
+import json
 import os
+import uuid
 import xml.etree.cElementTree as elTree
-from typing import Tuple, Optional
-
-import wx
+import zlib
+from bisect import bisect_left, bisect_right
+from typing import (
+    Tuple,
+    Optional,
+    List,
+    Dict,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Collection,
+)
 
 from story_time import util
+from story_time.entry_index import get_entry_index, index_inserted_entry
+from story_time.manifest import year_manifest, YearInfo, year_files
+from story_time.timestamps import iso_to_stamp, isos_to_stamps, stamp_to_iso, stamp_year
+from story_time.year_store import year_store
+
+use_journal = True  #: Whether new entries are appended to the journal of the year.
+max_journal_bytes = 256 * 1024  #: Journals larger than this are compacted on save.
 
 
 def init_XML(comm: str, year: int) -> elTree.ElementTree:
@@ -29,44 +60,405 @@ def init_XML(comm: str, year: int) -> elTree.ElementTree:
     elTree.SubElement(head, "year").text = str(year)
     elTree.SubElement(head, "text").text = comm
     elTree.SubElement(root, "doc")
-    return elTree.ElementTree(root)
+    tree = elTree.ElementTree(root)
+    set_head_summary(tree, YearInfo(0, checksum=0))
+    set_head_value(tree, "sorted", "1")
+    return tree
+
+
+class EntryRecord(NamedTuple):
+    """Lightweight representation of an entry, independent of the XML tree."""
+
+    date_time: str  #: The ISO date and time string.
+    entry_type: str  #: Either "text" or "photo".
+    text: str  #: The text of the entry.
+    photo: Optional[str] = None  #: The image file name of a photo entry.
+
+    @property
+    def stamp(self) -> int:
+        """The integer timestamp of the entry."""
+        return iso_to_stamp(self.date_time)
 
+    @classmethod
+    def from_element(cls, entry: elTree.Element) -> "EntryRecord":
+        """Creates the record from an entry element."""
+        date_time, e_type = entry.get("date_time", ""), entry.get("type", "text")
+        if e_type == "text":
+            return cls(date_time, e_type, entry.text or "")
+        text = entry.findtext("text") or ""
+        return cls(date_time, e_type, text, entry.findtext("photo"))
 
-def insert_text_entry(doc: elTree.Element, date_time: wx.DateTime, text: str) -> None:
+
+def insert_record(doc: elTree.Element, record: EntryRecord) -> elTree.Element:
+    """Inserts an entry element for the record into the doc.
+
+    The entries in the doc are kept sorted by their date and time, the
+    new entry is inserted after all entries that are not newer.
+
+    Args:
+        doc: The doc element. Entry will be inserted as child.
+        record: The entry to insert.
+
+    Returns:
+        The inserted entry element.
+    """
+    attrs = {"date_time": record.date_time, "type": record.entry_type}
+    ent = elTree.Element("entry", attrs)
+    if record.entry_type == "text":
+        ent.text = record.text
+    elif record.entry_type == "photo":
+        elTree.SubElement(ent, "text").text = record.text
+        elTree.SubElement(ent, "photo").text = record.photo
+    else:
+        raise ValueError(f"Entry of type: {record.entry_type} is not supported!")
+    index = get_entry_index(doc)
+    k = bisect_right(index.stamps, record.stamp)
+    pos = index.positions[k] if k < len(index) else len(doc)
+    doc.insert(pos, ent)
+    index_inserted_entry(doc, ent, pos)
+    return ent
+
+
+def insert_text_entry(doc: elTree.Element, date_time: str, text: str) -> elTree.Element:
     """Inserts a text entry into the XML element tree.
 
     Args:
         doc: The doc element. Entry will be inserted as child.
-        date_time: The DateTime of the entry.
+        date_time: The ISO date and time string of the entry.
         text: The text of the entry.
+
+    Returns:
+        The inserted entry element.
     """
-    dt = date_time.FormatISOCombined()
-    elTree.SubElement(doc, "entry", date_time=dt, type="text").text = text
+    return insert_record(doc, EntryRecord(date_time, "text", text))
 
 
 def insert_photo_entry(
-    doc: elTree.Element, date_time: wx.DateTime, img_filename: str, text: str
-) -> None:
+    doc: elTree.Element, date_time: str, img_filename: str, text: str
+) -> elTree.Element:
     """Inserts a photo entry element as a child of the elTree doc.
 
     Args:
         doc: The doc element. Entry will be inserted as child.
-        date_time: The DateTime of the entry.
+        date_time: The ISO date and time string of the entry.
         img_filename: The file name referring to the image.
         text: The text of the entry.
+
+    Returns:
+        The inserted entry element.
     """
     # TODO: Check if file exists?
-    ent = elTree.SubElement(
-        doc, "entry", date_time=date_time.FormatISOCombined(), type="photo"
+    return insert_record(doc, EntryRecord(date_time, "photo", text, img_filename))
+
+
+def _root_child(tree: elTree.ElementTree, tag: str) -> Optional[elTree.Element]:
+    """Returns the child `tag` of the root of the tree, None if missing."""
+    root = tree.getroot()
+    return None if root is None else root.find(tag)
+
+
+def set_head_value(tree: elTree.ElementTree, tag: str, value: str) -> None:
+    """Sets the text of the child `tag` of the head, creates it if missing."""
+    head = _root_child(tree, "head")
+    assert head is not None, "No head found in XML!"
+    el = head.find(tag)
+    if el is None:
+        el = elTree.SubElement(head, tag)
+    el.text = value
+
+
+def get_head_value(tree: elTree.ElementTree, tag: str) -> Optional[str]:
+    """Returns the text of the child `tag` of the head, None if missing."""
+    head = _root_child(tree, "head")
+    el = None if head is None else head.find(tag)
+    return None if el is None else el.text
+
+
+def record_checksum(record: EntryRecord) -> int:
+    """Computes the CRC32 checksum of the content of an entry record."""
+    parts = (
+        record.date_time or "",
+        record.entry_type,
+        record.text or "",
+        record.photo or "",
+    )
+    return zlib.crc32("\x1f".join(parts).encode("utf-8"))
+
+
+def entry_checksum(entry: elTree.Element) -> int:
+    """Computes the CRC32 checksum of the content of an entry."""
+    return record_checksum(EntryRecord.from_element(entry))
+
+
+def summarize_entries(
+    entries: Iterable[elTree.Element], info: YearInfo = YearInfo(0, checksum=0)
+) -> YearInfo:
+    """Adds the entries to the summary `info`.
+
+    The checksum is the sum of the checksums of the entries, so it
+    does not depend on the order of the entries.
+
+    Args:
+        entries: The entries to add.
+        info: The summary of the other entries, empty by default.
+
+    Returns:
+        The updated summary.
+    """
+    count, lo, hi, checksum = info
+    assert checksum is not None, "Summary without checksum!"
+    for ent in entries:
+        stamp = iso_to_stamp(ent.get("date_time", ""))
+        lo = stamp if lo is None or stamp < lo else lo
+        hi = stamp if hi is None or stamp > hi else hi
+        checksum = (checksum + entry_checksum(ent)) & 0xFFFFFFFF
+        count += 1
+    return YearInfo(count, lo, hi, checksum)
+
+
+def _summary_from_values(values: Dict[str, Optional[str]]) -> Optional[YearInfo]:
+    """Converts the values of the head to a summary, None if there is none."""
+    count, checksum = values.get("count"), values.get("checksum")
+    if count is None or checksum is None:
+        return None
+    lo, hi = values.get("min_date_time"), values.get("max_date_time")
+    return YearInfo(
+        int(count),
+        iso_to_stamp(lo) if lo else None,
+        iso_to_stamp(hi) if hi else None,
+        int(checksum, 16),
     )
-    elTree.SubElement(ent, "text").text = text
-    elTree.SubElement(ent, "photo").text = img_filename
+
+
+def get_head_summary(tree: elTree.ElementTree) -> Optional[YearInfo]:
+    """Returns the summary stored in the head, None for old files."""
+    head = _root_child(tree, "head")
+    if head is None:
+        return None
+    return _summary_from_values({el.tag: el.text for el in head})
+
+
+def set_head_summary(tree: elTree.ElementTree, info: YearInfo) -> None:
+    """Stores the summary of the year in the head."""
+    lo, hi = info.min_stamp, info.max_stamp
+    set_head_value(tree, "count", str(info.n_entries))
+    set_head_value(tree, "min_date_time", "" if lo is None else stamp_to_iso(lo))
+    set_head_value(tree, "max_date_time", "" if hi is None else stamp_to_iso(hi))
+    set_head_value(tree, "checksum", f"{info.checksum:08x}")
+
+
+def ensure_head_summary(tree: elTree.ElementTree) -> YearInfo:
+    """Returns the summary of the head, computes it first for old files."""
+    info = get_head_summary(tree)
+    if info is None:
+        doc = _root_child(tree, "doc")
+        assert doc is not None, "Invalid XML!"
+        info = summarize_entries(doc)
+        set_head_summary(tree, info)
+    return info
+
+
+def is_sorted(tree: elTree.ElementTree) -> bool:
+    """Checks whether the head marks the entries as sorted by date and time."""
+    return get_head_value(tree, "sorted") == "1"
+
+
+def sort_entries(tree: elTree.ElementTree) -> bool:
+    """Sorts the entries by date and time and marks the tree as sorted.
+
+    Entries with the same date and time keep their order.
+
+    Returns:
+        Whether the order of the entries changed.
+    """
+    doc = _root_child(tree, "doc")
+    assert doc is not None, "Invalid XML!"
+    entries = list(doc)
+    stamps = isos_to_stamps([ent.get("date_time", "") for ent in entries])
+    order = sorted(range(len(entries)), key=stamps.__getitem__)
+    changed = order != list(range(len(entries)))
+    if changed:
+        doc[:] = [entries[k] for k in order]
+    set_head_value(tree, "sorted", "1")
+    return changed
+
+
+def read_head(xml_file: str) -> Dict[str, Optional[str]]:
+    """Reads the values in the head of an XML file.
+
+    The file is parsed incrementally and only until the end of the head.
+    """
+    with open(xml_file, "rb") as f:
+        for _, el in elTree.iterparse(f, events=("end",)):
+            if el.tag == "head":
+                return {c.tag: c.text for c in el}
+    return {}
+
+
+def read_year_summary(year: int) -> Optional[YearInfo]:
+    """Reads the summary of a year without parsing the whole XML file.
+
+    The entries in the journal of the year are added to the summary
+    in the head.
+
+    Args:
+        year: The year.
+
+    Returns:
+        The summary or None if the year does not exist or the file
+        does not contain a summary.
+    """
+    xml_file, journal_file = year_files(year)
+    values: Dict[str, Optional[str]] = {}
+    info: Optional[YearInfo] = YearInfo(0, checksum=0)
+    if os.path.isfile(xml_file):
+        values = read_head(xml_file)
+        info = _summary_from_values(values)
+    elif not os.path.isfile(journal_file):
+        return None
+    if info is None:
+        return None
+    j_id, entries = read_journal(journal_file)
+    if j_id is None or j_id != values.get("journal_id"):
+        info = summarize_entries(entries, info)
+    return info
+
+
+def get_journal_file(year: int) -> str:
+    """Returns the path of the journal of the given year."""
+    return os.path.join(util.xml_folder, f"{year}.journal")
+
+
+def read_journal(journal_file: str) -> Tuple[Optional[str], List[elTree.Element]]:
+    """Reads the id and the entries of a journal.
+
+    Incomplete lines, e.g. from a crash while writing, are skipped.
+
+    Args:
+        journal_file: The path of the journal.
+
+    Returns:
+        The id of the journal and the list of entry elements.
+    """
+    j_id: Optional[str] = None
+    entries: List[elTree.Element] = []
+    if not os.path.isfile(journal_file):
+        return j_id, entries
+    with open(journal_file, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+                if "journal_id" in rec:
+                    j_id = rec["journal_id"]
+                else:
+                    entries.append(elTree.fromstring(rec["entry"]))
+            except (ValueError, KeyError, elTree.ParseError):
+                continue
+    return j_id, entries
+
+
+def _ends_with_newline(file_name: str) -> bool:
+    """Checks whether a file is empty or ends with a newline."""
+    with open(file_name, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def _read_journal_id(journal_file: str) -> Optional[str]:
+    """Returns the id in the first line of a journal, None if missing."""
+    with open(journal_file, encoding="utf-8") as f:
+        line = f.readline()
+    try:
+        j_id = json.loads(line).get("journal_id")
+    except (ValueError, AttributeError):
+        return None
+    return j_id if isinstance(j_id, str) else None
+
+
+def _append_to_journal(
+    journal_file: str, entry: elTree.Element, compacted_id: Optional[str] = None
+) -> None:
+    """Appends an entry to the journal, creates the journal if needed.
+
+    A journal with the id `compacted_id`, i.e. one that was already
+    compacted but could not be removed, is replaced by a new one,
+    otherwise the entry would be dropped with it when loading.
+    """
+    mode, prefix = "a", ""
+    exists = os.path.isfile(journal_file)
+    j_id = _read_journal_id(journal_file) if exists else None
+    if not exists or (j_id is not None and j_id == compacted_id):
+        mode, prefix = "w", json.dumps({"journal_id": uuid.uuid4().hex}) + "\n"
+    elif not _ends_with_newline(journal_file):
+        # Terminate an incomplete last line so that the entry is not lost
+        prefix = "\n"
+    line = json.dumps({"entry": elTree.tostring(entry, encoding="unicode")})
+    with open(journal_file, mode, encoding="utf-8") as f:
+        f.write(f"{prefix}{line}\n")
+
+
+def _new_year_tree(year: int) -> elTree.ElementTree:
+    """Initializes the tree of a year with the default comment."""
+    return init_XML(f"Das isch es Johr {year}.", year)
+
+
+def _load_year(year: int, xml_file: str, journal_file: str) -> elTree.ElementTree:
+    """Parses the XML file of the year and merges its journal.
+
+    A journal that was already compacted into the XML file, e.g. if the
+    app was interrupted during compaction, is removed. Old files whose
+    entries are not marked as sorted are sorted once and written back.
+    """
+    if os.path.isfile(xml_file):
+        tree = elTree.ElementTree(file=xml_file)
+        if not is_sorted(tree):
+            # Files written before the entries were kept sorted are
+            # sorted once and written back.
+            ensure_head_summary(tree)
+            sort_entries(tree)
+            try:
+                _write_tree(tree, xml_file)
+            except OSError:
+                pass
+    else:
+        tree = _new_year_tree(year)
+    j_id, entries = read_journal(journal_file)
+    if j_id is not None and j_id == get_head_value(tree, "journal_id"):
+        try:
+            os.remove(journal_file)
+        except OSError:
+            # Replaced by the next save, see _append_to_journal
+            pass
+        return tree
+    doc = _root_child(tree, "doc")
+    assert doc is not None, f"No doc found in XML of year {year}."
+    info = get_head_summary(tree)
+    for ent in entries:
+        insert_record(doc, EntryRecord.from_element(ent))
+    if info is None:
+        ensure_head_summary(tree)
+    elif entries:
+        set_head_summary(tree, summarize_entries(entries, info))
+    return tree
+
+
+def _write_tree(tree: elTree.ElementTree, xml_file: str) -> None:
+    """Writes the tree to a temporary file and moves it to `xml_file`."""
+    tmp_file = f"{xml_file}.tmp"
+    tree.write(tmp_file)
+    os.replace(tmp_file, xml_file)
 
 
 def load_XML(year: int, create: bool = True) -> Tuple[elTree.ElementTree, str]:
     """Loads an existing XML file and returns the Element tree.
 
     If it does not exist, a new element tree is initializes.
+    Parsed trees are cached in :data:`story_time.year_store.year_store`,
+    the returned tree is shared and must not be modified without
+    writing it to the file afterwards.
 
     Args:
         year: The year specifying the XML file.
@@ -75,47 +467,319 @@ def load_XML(year: int, create: bool = True) -> Tuple[elTree.ElementTree, str]:
     Returns:
         The element tree and the filename.
     """
-    yearStr = str(year)
-    xml_file = os.path.join(util.xml_folder, f"{yearStr}.xml")
-    if os.path.exists(xml_file):
-        tree = elTree.parse(xml_file)
-    elif create:
-        tree = init_XML("Das isch es Johr " + yearStr + ".", year)
-    else:
-        raise FileNotFoundError("File not found and create == False")
+    xml_file = os.path.join(util.xml_folder, f"{year}.xml")
+    journal_file = get_journal_file(year)
+    tree = year_store.get(
+        xml_file, lambda: _load_year(year, xml_file, journal_file), (journal_file,)
+    )
+    if tree is None:
+        if not create:
+            raise FileNotFoundError("File not found and create == False")
+        tree = _new_year_tree(year)
     return tree, xml_file
 
 
+def create_record(
+    comm: str,
+    date_time: str,
+    entry_type: str = "text",
+    img_filename: str = None,
+) -> EntryRecord:
+    """Creates the record of a new entry, see :func:`save_entry`.
+
+    Raises:
+        ValueError: If the entry type is not supported.
+    """
+    if entry_type == "text":
+        return EntryRecord(date_time, entry_type, comm)
+    elif entry_type == "photo":
+        assert img_filename is not None, "Need to specify image filename!"
+        bn: str = os.path.basename(img_filename)
+        return EntryRecord(date_time, entry_type, comm, bn)
+    raise ValueError(f"Entry of type: {entry_type} is not supported!")
+
+
 def save_entry(
     comm: str,
-    date_time: wx.DateTime,
+    date_time: str,
     entry_type: str = "text",
     img_filename: str = None,
 ) -> None:
     """Reads the XML file and adds an entry element with the specified content.
 
-    Then saves the tree back to the file.
+    Then saves the tree back to the file, see :func:`save_record`.
 
     Args:
         comm: The text for the entry.
-        date_time: The DateTime of the entry.
+        date_time: The ISO date and time string of the entry.
         entry_type: The type of the entry, either "text" or "photo".
         img_filename:
     """
-    year = date_time.GetYear()
+    save_record(create_record(comm, date_time, entry_type, img_filename))
+
+
+def save_record(record: EntryRecord) -> None:
+    """Adds the entry to the XML file of its year.
+
+    If the file exists and `use_journal` is set, the entry is appended
+    to the journal and the journal is compacted if it gets larger than
+    `max_journal_bytes`. Otherwise the whole tree is written to the file.
+
+    Args:
+        record: The entry to save.
+    """
+    year = stamp_year(record.stamp)
     tree, xml_file = load_XML(year)
 
-    doc = tree.getroot().find("doc")
+    doc = _root_child(tree, "doc")
     assert doc is not None, f"No doc found in XML of year {year}."
-    if entry_type == "text":
-        insert_text_entry(doc, date_time, comm)
-    elif entry_type == "photo":
-        assert img_filename is not None, "Need to specify image filename!"
-        bn: str = os.path.basename(img_filename)
-        insert_photo_entry(doc, date_time, bn, comm)
+    info = ensure_head_summary(tree)
+    entry = insert_record(doc, record)
+    set_head_summary(tree, summarize_entries([entry], info))
+
+    journal_file = get_journal_file(year)
+    if use_journal and os.path.isfile(xml_file):
+        try:
+            _append_to_journal(journal_file, entry, get_head_value(tree, "journal_id"))
+        except Exception:
+            # Do not keep the modified tree if it could not be written
+            year_store.invalidate(xml_file)
+            raise
+        year_store.put(xml_file, tree, (journal_file,))
+        update_year_info(year, tree)
+        if os.path.getsize(journal_file) > max_journal_bytes:
+            compact_journal(year)
     else:
-        raise ValueError(f"Entry of type: {entry_type} is not supported!")
-    tree.write(xml_file)
+        _write_year(year, tree, xml_file)
+
+
+def _write_year(year: int, tree: elTree.ElementTree, xml_file: str) -> None:
+    """Writes the modified tree of a year and removes its journal."""
+    journal_file = get_journal_file(year)
+    try:
+        _write_tree(tree, xml_file)
+    except Exception:
+        # Do not keep the modified tree if it could not be written
+        year_store.invalidate(xml_file)
+        raise
+    year_manifest.add_year(year)
+    if os.path.isfile(journal_file):
+        os.remove(journal_file)
+    year_store.put(xml_file, tree, (journal_file,))
+    update_year_info(year, tree)
+
+
+def save_entries(records: Iterable[EntryRecord]) -> List[Optional[str]]:
+    """Saves many entries at once, e.g. when importing.
+
+    The entries are grouped by year and each year is loaded and written
+    only once instead of once per entry. The journal is folded into
+    the written files.
+
+    Args:
+        records: The entries to save.
+
+    Returns:
+        For each entry, None if it was saved or the reason why not.
+    """
+    records = list(records)
+    results: List[Optional[str]] = [None] * len(records)
+    by_year: Dict[int, List[int]] = {}
+    for k, r in enumerate(records):
+        try:
+            by_year.setdefault(stamp_year(r.stamp), []).append(k)
+        except (ValueError, AttributeError) as e:
+            results[k] = f"Invalid date: {r.date_time} ({e})"
+
+    for year, indices in sorted(by_year.items()):
+        tree, xml_file = load_XML(year)
+        doc = _root_child(tree, "doc")
+        assert doc is not None, f"No doc found in XML of year {year}."
+        info = ensure_head_summary(tree)
+        entries: List[elTree.Element] = []
+        for k in indices:
+            try:
+                entries.append(insert_record(doc, records[k]))
+            except ValueError as e:
+                results[k] = str(e)
+        if not entries:
+            continue
+        set_head_summary(tree, summarize_entries(entries, info))
+        try:
+            _write_year(year, tree, xml_file)
+        except OSError as e:
+            for k in indices:
+                results[k] = results[k] or f"Could not write {xml_file}: {e}"
+    return results
+
+
+def iter_year_records(
+    year: int, start: int = None, end: int = None
+) -> Iterator[EntryRecord]:
+    """Streams the entries of a year without building the whole tree.
+
+    The XML file is parsed incrementally and every entry is removed
+    from the partial tree after it was yielded, so the memory usage does
+    not depend on the size of the file. The entries of the journal are
+    yielded after the ones of the XML file, in the order they were saved.
+    If the file is sorted, parsing stops at the first entry after `end`.
+
+    Args:
+        year: The year to read.
+        start: Only entries with timestamp >= `start` are returned if not None.
+        end: Only entries with timestamp < `end` are returned if not None.
+
+    Returns:
+        Iterator over the entry records in file order.
+    """
+
+    def in_range(stamp: int) -> bool:
+        return (start is None or stamp >= start) and (end is None or stamp < end)
+
+    xml_file, journal_file = year_files(year)
+    compacted_id = None
+    if os.path.isfile(xml_file):
+        with open(xml_file, "rb") as f:
+            depth = 0
+            sorted_file = False
+            parents: List[elTree.Element] = []
+            for event, el in elTree.iterparse(f, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+                    parents.append(el)
+                    continue
+                depth -= 1
+                parents.pop()
+                if el.tag == "head" and depth == 1:
+                    compacted_id = el.findtext("journal_id")
+                    sorted_file = el.findtext("sorted") == "1"
+                elif el.tag == "entry" and depth == 2:
+                    stamp = iso_to_stamp(el.get("date_time"))
+                    if sorted_file and end is not None and stamp >= end:
+                        break
+                    if in_range(stamp):
+                        yield EntryRecord.from_element(el)
+                    parents[-1].remove(el)
+    j_id, entries = read_journal(journal_file)
+    if j_id is None or j_id != compacted_id:
+        for ent in entries:
+            if in_range(iso_to_stamp(ent.get("date_time", ""))):
+                yield EntryRecord.from_element(ent)
+
+
+def iter_all_records(newer_first: bool = False) -> Iterator[EntryRecord]:
+    """Streams the entries of all years, year by year.
+
+    Args:
+        newer_first: Whether to start with the most recent year.
+    """
+    years = year_manifest.years()
+    for year in reversed(years) if newer_first else years:
+        yield from iter_year_records(year)
+
+
+def iter_entries(
+    start: int = None,
+    end: int = None,
+    types: Collection[str] = None,
+    newer_first: bool = False,
+) -> Iterator[EntryRecord]:
+    """Streams the entries in a range of time, sorted by their timestamp.
+
+    The start and the end of the range are looked up once per year in
+    the sorted timestamp index of the loaded tree, the entries in
+    between are read sequentially. Years that cannot overlap the range
+    according to the manifest are not loaded.
+
+    Args:
+        start: Only entries with timestamp >= `start` are returned if not None.
+        end: Only entries with timestamp < `end` are returned if not None.
+        types: Only entries with one of these types, e.g. `("photo",)`,
+            are returned if not None.
+        newer_first: Whether to start with the most recent entry.
+
+    Returns:
+        Iterator over the entry records.
+    """
+    years = year_manifest.years()
+    i = 0 if start is None else bisect_left(years, stamp_year(start))
+    i_end = len(years) if end is None else bisect_right(years, stamp_year(end))
+    years = years[i:i_end]
+    for year in reversed(years) if newer_first else years:
+        info = year_manifest.get_info(year)
+        if info is not None and not info.overlaps(start, end):
+            continue
+        doc = _root_child(load_XML(year, False)[0], "doc")
+        assert doc is not None, f"No doc found in XML of year {year}."
+        index = get_entry_index(doc)
+        k = 0 if start is None else bisect_left(index.stamps, start)
+        k_end = len(index) if end is None else bisect_left(index.stamps, end)
+        ks = range(k_end - 1, k - 1, -1) if newer_first else range(k, k_end)
+        # Take the elements first, the tree may change while iterating
+        elements = [doc[index.positions[i]] for i in ks]
+        for el in elements:
+            if types is None or el.get("type", "text") in types:
+                yield EntryRecord.from_element(el)
+
+
+def compact_journal(year: int) -> bool:
+    """Folds the journal of the year back into its XML file.
+
+    The id of the journal is stored in the head of the XML file, so that
+    the journal is not applied twice if it cannot be removed afterwards.
+
+    Args:
+        year: The year to compact.
+
+    Returns:
+        Whether there was a journal to compact.
+    """
+    xml_file = os.path.join(util.xml_folder, f"{year}.xml")
+    journal_file = get_journal_file(year)
+    if not os.path.isfile(journal_file):
+        return False
+    tree, _ = load_XML(year, False)
+    j_id, _ = read_journal(journal_file)
+    if j_id is not None:
+        set_head_value(tree, "journal_id", j_id)
+    try:
+        _write_tree(tree, xml_file)
+        if os.path.isfile(journal_file):
+            try:
+                os.remove(journal_file)
+            except OSError:
+                # Ignored when loading and replaced by the next save
+                pass
+    finally:
+        year_store.put(xml_file, tree, (journal_file,))
+    update_year_info(year, tree)
+    return True
+
+
+def compact_journals() -> List[int]:
+    """Compacts the journals of all years, e.g. when closing the app.
+
+    Returns:
+        The years that were compacted.
+    """
+    if not os.path.isdir(util.xml_folder):
+        return []
+    years = []
+    for f in os.listdir(util.xml_folder):
+        name, ext = os.path.splitext(f)
+        if ext == ".journal" and name.isdigit() and compact_journal(int(name)):
+            years.append(int(name))
+    return sorted(years)
+
+
+def update_year_info(year: int, tree: elTree.ElementTree) -> YearInfo:
+    """Updates the summary of the year in the manifest from its head."""
+    info = ensure_head_summary(tree)
+    year_manifest.set_info(year, info)
+    return info
+
+
+year_manifest.info_loader = read_year_summary
 
 
 def find_next_xml_file(
@@ -125,7 +789,9 @@ def find_next_xml_file(
 
     If there is none, returns None, otherwise, the found year and the tree of the XML
     is returned.
-    If `newer` == True, then it finds the next newer one
+    If `newer` == True, then it finds the next newer one.
+    The available years are taken from
+    :data:`story_time.manifest.year_manifest`.
 
     Args:
         year:
@@ -135,95 +801,63 @@ def find_next_xml_file(
         The year of the closest entry and the element tree of the
         closes XML file.
     """
-    closest_year = 100000 if newer else -100000
-    for f in os.listdir(util.xml_folder):
-        y = int(f.split(".")[0])
-        if not newer and year > y > closest_year:
-            closest_year = y
-        if newer and year < y < closest_year:
-            closest_year = y
-    if abs(closest_year) == 100000:
-        return None
-    return closest_year, load_XML(closest_year, False)[0]
+    years = year_manifest.years()
+    if newer:
+        k = bisect_right(years, year)
+        if k == len(years):
+            return None
+    else:
+        k = bisect_left(years, year) - 1
+        if k < 0:
+            return None
+    return years[k], load_XML(years[k], False)[0]
 
 
 def find_closest_entry_in_tree(
-    tree: elTree.ElementTree, date_time: wx.DateTime, newer: bool = False
-) -> Optional[Tuple[wx.DateTime, elTree.Element]]:
-    """Finds entry closest to `date_time` in doc.
+    tree: elTree.ElementTree, stamp: int, newer: bool = False
+) -> Optional[elTree.Element]:
+    """Finds entry closest to the timestamp `stamp` in doc.
 
-    If there is no earlier entry than 'date_time' returns None.
+    Uses the sorted timestamp index of the doc, see
+    :func:`story_time.entry_index.get_entry_index`.
+    If there is no earlier entry than `stamp` returns None.
     If newer == True, then it finds the next newer one
 
     Args:
         tree: The element tree to search.
-        date_time: The search date and time.
+        stamp: The search timestamp.
         newer: Whether to find the closest newer entry.
 
     Returns:
-        The date of the found entry and the entry element.
+        The found entry element or None.
     """
-    doc = tree.getroot().find("doc")
+    doc = _root_child(tree, "doc")
     assert doc is not None, "Invalid XML!"
-    temp = wx.DateTime(1, 1, 100000 if newer else 0)
-    curr_child = None
-    for child in doc:
-        wxDT = wx.DateTime()
-        wxDT.ParseISOCombined(child.get("date_time"))
-        if (not newer and temp < wxDT < date_time) or (
-            newer and temp > wxDT > date_time
-        ):
-            temp = wxDT
-            curr_child = child
-    if abs(temp.GetYear() - 50000) == 50000:
-        return None
-    return temp, curr_child
+    index = get_entry_index(doc)
+    k = index.find_closest(stamp, newer)
+    return None if k is None else doc[index.positions[k]]
 
 
-def find_closest_entry(
-    dt: wx.DateTime, newer: bool = False
-) -> Optional[Tuple[wx.DateTime, elTree.Element]]:
-    """Finds the latest entry before 'dt', if any.
+def find_closest_entry(stamp: int, newer: bool = False) -> Optional[elTree.Element]:
+    """Finds the entry closest to the timestamp in all XML files.
 
-    Searches all available XML files.
+    Years that cannot contain the entry according to the manifest are
+    skipped.
 
     Args:
-        dt: The search date and time.
+        stamp: The search timestamp.
         newer: Whether to find the closest newer entry.
 
     Returns:
-        The date of the found entry and the entry element.
-        If there is no next entry, None is returned.
+        The found entry element or None if there is none.
     """
-    curr_year = dt.GetYear()
-
-    # Load XML file with specified year
-    tree = None
-    try:
-        tree = load_XML(curr_year, False)
-    except FileNotFoundError:
-        pass
-    date_child = None
-    if tree is not None:
-        tree = tree[0]
-        date_child = find_closest_entry_in_tree(tree, dt, newer)
-        if date_child is None:
-            tree = None
-
-    # Entry not found yet, search next XML files
-    if tree is None:
-        date_child = None
-        while date_child is None:
-            res = find_next_xml_file(curr_year, newer)
-            if res is None:
-                # No next file found, return None
-                return None
-            tree = res[1]
-            curr_year = res[0]
-            assert tree is not None
-            date_child = find_closest_entry_in_tree(tree, dt, newer)
-
-    # Return
-    assert date_child is not None, "Terrible bug is happening!"
-    date, child = date_child
-    return date, child
+    for year in year_manifest.candidate_years(stamp_year(stamp), stamp, newer):
+        try:
+            tree = load_XML(year, False)[0]
+        except FileNotFoundError:
+            continue
+        child = find_closest_entry_in_tree(tree, stamp, newer)
+        update_year_info(year, tree)
+        if child is not None:
+            return child
+    return None
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Lookup of the entries by calendar day.
+
+For every year, the timestamps of the entries are grouped by the day of
+the year, e.g. to show the entries "On this day" in earlier years or to
+mark the days with entries in the calendar. The groups of all years are
+kept in the small file `days.json` in the index folder, so a lookup
+only reads the entries of the requested day from the storage backend,
+see :mod:`story_time.storage`.
+
+Like the shards of the search index, the groups of a year are rebuilt
+from the backend if its number of entries or checksum does not match
+the summary of the year anymore, see
+:meth:`story_time.storage.StorageBackend.year_info`, and saved entries
+are added to them directly through :data:`story_time.storage.save_listeners`.
+"""
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+from story_time import util
+from story_time.XML_write import EntryRecord, record_checksum
+from story_time.search import INDEX_FOLDER
+from story_time.storage import StorageBackend, get_backend, save_listeners
+from story_time.timestamps import (
+    date_to_stamp,
+    days_from_civil,
+    stamp_date,
+    stamp_day_of_year,
+)
+
+DAYS_FILE = "days.json"  #: Name of the file with the day groups in the index folder.
+DAYS_VERSION = 2  #: Files of other versions are rebuilt.
+
+
+class DayCounts:
+    """The timestamps of the entries of a year grouped by day.
+
+    Args:
+        count: The total number of entries.
+        checksum: The sum of the checksums of the entries.
+        days: The timestamps of the entries per day of the year, starting
+            at 0 for January 1st.
+    """
+
+    def __init__(
+        self, count: int = 0, checksum: int = 0, days: Dict[int, List[int]] = None
+    ) -> None:
+        self.count = count
+        self.checksum = checksum
+        self.days: Dict[int, List[int]] = {} if days is None else days
+        #: The number of entries per day of the year.
+        self.counts = [0] * 366
+        #: Bit `d` is set if there are entries on day `d` of the year.
+        self.bitmap = 0
+        for d, stamps in self.days.items():
+            self.counts[d] = len(stamps)
+            self.bitmap |= 1 << d
+
+    def add(self, record: EntryRecord) -> None:
+        """Adds a newly saved entry."""
+        stamp = record.stamp
+        d = stamp_day_of_year(stamp)
+        self.days.setdefault(d, []).append(stamp)
+        self.counts[d] += 1
+        self.bitmap |= 1 << d
+        self.count += 1
+        self.checksum = (self.checksum + record_checksum(record)) & 0xFFFFFFFF
+
+    def stamps_on_day(self, year: int, month: int, day: int) -> List[int]:
+        """Returns the distinct timestamps of the entries of a day, sorted."""
+        d = days_from_civil(year, month, day) - days_from_civil(year, 1, 1)
+        # February 29th does not exist in every year
+        stamps = [s for s in self.days.get(d, []) if stamp_date(s)[1:] == (month, day)]
+        return sorted(set(stamps))
+
+    def days_with_entries(self, year: int, month: int) -> List[int]:
+        """Returns the days of the month with entries, starting at 1."""
+        first = days_from_civil(year, month, 1) - days_from_civil(year, 1, 1)
+        n_days = days_from_civil(year + month // 12, month % 12 + 1, 1) - (
+            days_from_civil(year, month, 1)
+        )
+        bits = self.bitmap >> first
+        return [d + 1 for d in range(n_days) if bits >> d & 1]
+
+
+class DayIndex:
+    """The index of the entries of the current backend by day."""
+
+    def __init__(self) -> None:
+        self._folder: Optional[str] = None
+        self._backend: Optional[StorageBackend] = None
+        self._counts: Dict[int, DayCounts] = {}
+        self._counts_dirty = False
+        self._lock = threading.RLock()
+
+    def _check_backend(self) -> StorageBackend:
+        """Returns the backend of the current data folder.
+
+        The groups of the previous backend are dropped if it changed,
+        e.g. because the data folder was changed.
+        """
+        backend = get_backend()
+        if backend is not self._backend or util.data_path != self._folder:
+            self.flush()
+            self._folder, self._backend = util.data_path, backend
+            self._counts = self._read_counts()
+            self._counts_dirty = False
+        return backend
+
+    def _days_file(self) -> str:
+        assert self._folder is not None, "No data folder set."
+        return os.path.join(self._folder, INDEX_FOLDER, DAYS_FILE)
+
+    def _read_counts(self) -> Dict[int, DayCounts]:
+        try:
+            with open(self._days_file(), encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != DAYS_VERSION:
+                return {}
+            return {
+                int(y): DayCounts(
+                    c["count"],
+                    c["checksum"],
+                    {int(d): stamps for d, stamps in c["days"].items()},
+                )
+                for y, c in data["years"].items()
+            }
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return {}
+
+    def day_counts(self, year: int) -> Optional[DayCounts]:
+        """Returns the up to date groups of a year, None if it does not exist.
+
+        The groups are only rebuilt from the backend if they do not match
+        the summary of the year. This is done without holding the lock,
+        so saving entries meanwhile, see :meth:`on_save`, is not blocked.
+        """
+        while True:
+            with self._lock:
+                backend = self._check_backend()
+                info = backend.year_info(year)
+                if info is None:
+                    return None
+                counts = self._counts.get(year)
+                if counts is not None and (counts.count, counts.checksum) == (
+                    info.n_entries,
+                    info.checksum,
+                ):
+                    return counts
+            counts = DayCounts()
+            start, end = date_to_stamp(year, 1, 1), date_to_stamp(year + 1, 1, 1)
+            for r in backend.range(start, end):
+                counts.add(r)
+            with self._lock:
+                if backend is not self._check_backend():
+                    continue
+                if backend.year_info(year) != info:
+                    # Entries were saved in the meantime
+                    continue
+                self._counts[year] = counts
+                self._counts_dirty = True
+                return counts
+
+    def entries_on_day(self, month: int, day: int) -> List[EntryRecord]:
+        """Returns the entries of a calendar day in all years, newest first.
+
+        Only the entries of that day are read from the backend.
+
+        Args:
+            month: The month, starting at 1.
+            day: The day of the month, starting at 1.
+        """
+        with self._lock:
+            backend = self._check_backend()
+            years = backend.years()
+        stamps: List[int] = []
+        for year in reversed(years):
+            counts = self.day_counts(year)
+            if counts is not None:
+                with self._lock:
+                    on_day = counts.stamps_on_day(year, month, day)
+                stamps.extend(reversed(on_day))
+        found: List[EntryRecord] = []
+        for s in stamps:
+            found.extend(backend.range(s, s + 1))
+        return found
+
+    def days_with_entries(self, year: int, month: int) -> List[int]:
+        """Returns the days of a month with entries, starting at 1."""
+        counts = self.day_counts(year)
+        return [] if counts is None else counts.days_with_entries(year, month)
+
+    def on_save(
+        self, backend: StorageBackend, year: int, records: List[EntryRecord]
+    ) -> None:
+        """Adds newly saved entries to the groups of their year if known.
+
+        Entries saved to another backend than the one of the index are
+        ignored.
+        """
+        with self._lock:
+            if backend is not self._check_backend():
+                return
+            counts = self._counts.get(year)
+            if counts is not None:
+                for r in records:
+                    counts.add(r)
+                self._counts_dirty = True
+
+    def flush(self) -> None:
+        """Writes the groups if they were changed."""
+        with self._lock:
+            if not self._counts_dirty or self._folder is None:
+                return
+            days_file = self._days_file()
+            os.makedirs(os.path.dirname(days_file), exist_ok=True)
+            years = {
+                str(y): {"count": c.count, "checksum": c.checksum, "days": c.days}
+                for y, c in self._counts.items()
+            }
+            data = json.dumps({"version": DAYS_VERSION, "years": years})
+            tmp_file = f"{days_file}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_file, days_file)
+            self._counts_dirty = False
+
+    def on_this_day(self, stamp: int) -> List[EntryRecord]:
+        """Returns the entries of the same day in earlier years, newest first."""
+        year, month, day = stamp_date(stamp)
+        year_start = date_to_stamp(year, 1, 1)
+        return [r for r in self.entries_on_day(month, day) if r.stamp < year_start]
+
+
+day_index = DayIndex()  #: The day index of the current data folder.
+save_listeners.append(day_index.on_save)
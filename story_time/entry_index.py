@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Sorted timestamp index of the entries of a year.
+
+The index stores the timestamps of all entries of a doc element in
+a sorted integer array together with the positions of the entries
+in the doc. Finding the closest older or newer entry is then a binary
+search instead of parsing the date of every entry.
+"""
+import threading
+import weakref
+import xml.etree.cElementTree as elTree
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Optional
+
+import numpy as np
+
+from story_time.timestamps import iso_to_stamp, isos_to_stamps
+
+
+class EntryIndex:
+    """Sorted timestamps and positions of the entries in a doc.
+
+    Entries with the same timestamp are ordered by their position.
+    """
+
+    stamps: array  #: The sorted timestamps.
+    positions: array  #: The positions of the entries in the doc.
+
+    def __init__(self, doc: elTree.Element) -> None:
+        stamps = isos_to_stamps([ent.get("date_time", "") for ent in doc])
+        pairs = sorted(zip(stamps, range(len(stamps))))
+        self.stamps = array("q", (s for s, _ in pairs))
+        self.positions = array("q", (p for _, p in pairs))
+
+    def __len__(self) -> int:
+        return len(self.stamps)
+
+    def add(self, stamp: int, pos: int) -> None:
+        """Adds an entry that was inserted at position `pos` of the doc."""
+        if pos < len(self.positions):
+            # Entries behind the inserted one are shifted, in place
+            positions = np.frombuffer(self.positions, dtype=np.int64)
+            positions[positions >= pos] += 1
+            # Release the buffer, the array cannot grow while it is exported
+            del positions
+        k = bisect_right(self.stamps, stamp)
+        while k > 0 and self.stamps[k - 1] == stamp and self.positions[k - 1] > pos:
+            k -= 1
+        self.stamps.insert(k, stamp)
+        self.positions.insert(k, pos)
+
+    def find_closest(self, stamp: int, newer: bool = False) -> Optional[int]:
+        """Finds the index of the entry closest to `stamp`.
+
+        Only entries strictly older (or newer if `newer` is True) are
+        considered. If there are multiple entries with the found time,
+        the first one in the doc is returned.
+
+        Args:
+            stamp: The search timestamp.
+            newer: Whether to find the closest newer entry.
+
+        Returns:
+            The index into :attr:`stamps` and :attr:`positions` or None
+            if there is no such entry.
+        """
+        if newer:
+            k = bisect_right(self.stamps, stamp)
+            return k if k < len(self.stamps) else None
+        k = bisect_left(self.stamps, stamp) - 1
+        if k < 0:
+            return None
+        return bisect_left(self.stamps, self.stamps[k])
+
+
+_indices: "weakref.WeakKeyDictionary[elTree.Element, EntryIndex]" = (
+    weakref.WeakKeyDictionary()
+)
+_lock = threading.Lock()
+
+
+def get_entry_index(doc: elTree.Element) -> EntryIndex:
+    """Returns the index of the doc, builds it if necessary.
+
+    The index is rebuilt if the doc was modified without updating
+    the index, which is detected by a differing number of entries.
+    """
+    with _lock:
+        index = _indices.get(doc)
+        if index is None or len(index) != len(doc):
+            index = EntryIndex(doc)
+            _indices[doc] = index
+        return index
+
+
+def index_inserted_entry(doc: elTree.Element, entry: elTree.Element, pos: int) -> None:
+    """Updates the index of the doc after `entry` was inserted at `pos`.
+
+    Does nothing if the doc has not been indexed yet.
+    """
+    with _lock:
+        index = _indices.get(doc)
+        if index is not None and len(index) == len(doc) - 1:
+            index.add(iso_to_stamp(entry.get("date_time", "")), pos)
@@ -11,10 +11,7 @@ TODO:
         https://stackoverflow.com/questions/51000320/wxpython-change-the-headers-color
     - Host documentation somewhere. (Write it first!
         (Including automatic screenshot generation!??))
-    - Indicate diary entries in calendar. (Probably need a custom calendar... arghhh)
     - Video Capture: Check for multiple input and add Dialog
-    - Smoother UI changes (e.g. image loading)
-    - Preview: Resolve issue with multiple entries on same Date and time.
     - Center toolbar?
     - Handle image deletion while app is running
     - Add blogpost to personal website
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Cached manifest of the years available in the XML folder.
+
+The list of years is only read from the directory again if the
+modification time of the folder changed. For each year, the number of
+entries and the earliest and latest timestamp are remembered once they
+are known, so that searches across years can skip years that cannot
+contain the searched entry without parsing them.
+"""
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple, Iterator, NamedTuple, Callable
+
+from story_time import util
+from story_time.year_store import (
+    FileSignature,
+    StoreSignature,
+    file_signature,
+    store_signature,
+)
+
+
+class YearInfo(NamedTuple):
+    """Summary of the entries of a year."""
+
+    n_entries: int
+    min_stamp: Optional[int] = None
+    max_stamp: Optional[int] = None
+    checksum: Optional[int] = None
+
+    def may_contain(self, stamp: int, newer: bool = False) -> bool:
+        """Checks if the year may have an entry older / newer than `stamp`."""
+        if self.n_entries == 0:
+            return False
+        if newer:
+            return self.max_stamp is None or self.max_stamp > stamp
+        return self.min_stamp is None or self.min_stamp < stamp
+
+    def overlaps(self, start: int = None, end: int = None) -> bool:
+        """Checks if the year may have an entry with `start` <= stamp < `end`."""
+        if self.n_entries == 0:
+            return False
+        if start is not None and self.max_stamp is not None and self.max_stamp < start:
+            return False
+        return end is None or self.min_stamp is None or self.min_stamp < end
+
+
+def year_files(year: int, folder: str = None) -> Tuple[str, str]:
+    """Returns the paths of the XML file and the journal of a year."""
+    folder = util.xml_folder if folder is None else folder
+    return (
+        os.path.join(folder, f"{year}.xml"),
+        os.path.join(folder, f"{year}.journal"),
+    )
+
+
+def list_years(folder: str) -> List[int]:
+    """Lists the years with an XML file or a journal in `folder`."""
+    years = set()
+    for f in os.listdir(folder):
+        name, ext = os.path.splitext(f)
+        if ext in (".xml", ".journal") and name.isdigit():
+            years.add(int(name))
+    return sorted(years)
+
+
+class YearManifest:
+    """The years in the current XML folder together with their summaries.
+
+    A summary is only used as long as the files of the year did not
+    change since it was set. If it is not known, `info_loader` is used
+    to get it without loading the whole year, if it is set.
+    """
+
+    info_loader: Optional[Callable[[int], Optional[YearInfo]]] = None
+
+    def __init__(self) -> None:
+        self._folder: Optional[str] = None
+        self._dir_sig: Optional[FileSignature] = None
+        self._years: List[int] = []
+        self._infos: Dict[int, Tuple[StoreSignature, YearInfo]] = {}
+        self._lock = threading.RLock()
+
+    def years(self) -> List[int]:
+        """Returns the sorted list of available years."""
+        with self._lock:
+            folder = util.xml_folder
+            if folder != self._folder:
+                self._infos.clear()
+            dir_sig = file_signature(folder)
+            if folder != self._folder or dir_sig != self._dir_sig:
+                self._folder, self._dir_sig = folder, dir_sig
+                self._years = list_years(folder) if dir_sig is not None else []
+            return list(self._years)
+
+    def add_year(self, year: int) -> None:
+        """Adds a year whose files were just created."""
+        with self._lock:
+            self.years()
+            k = bisect_left(self._years, year)
+            if k == len(self._years) or self._years[k] != year:
+                self._years.insert(k, year)
+            self._dir_sig = file_signature(util.xml_folder)
+
+    def get_info(self, year: int) -> Optional[YearInfo]:
+        """Returns the summary of the year if it is known and up to date."""
+        with self._lock:
+            self.years()
+            rec = self._infos.get(year)
+            if rec is not None and rec[0] == store_signature(year_files(year)):
+                return rec[1]
+            self._infos.pop(year, None)
+            if self.info_loader is None:
+                return None
+            info = self.info_loader(year)
+            if info is not None:
+                self.set_info(year, info)
+            return info
+
+    def set_info(self, year: int, info: YearInfo) -> None:
+        """Sets the summary of the year matching its current files."""
+        with self._lock:
+            self.years()
+            sig = store_signature(year_files(year))
+            if sig is not None:
+                self._infos[year] = (sig, info)
+
+    def candidate_years(
+        self, year: int, stamp: int, newer: bool = False
+    ) -> Iterator[int]:
+        """Yields the years that may contain the entry closest to `stamp`.
+
+        Starts with `year` if it exists and continues with the older
+        (or newer) years, years that are known to not contain an older
+        (or newer) entry are skipped.
+
+        Args:
+            year: The year of `stamp`.
+            stamp: The search timestamp.
+            newer: Whether the closest newer entry is searched.
+        """
+        years = self.years()
+        if newer:
+            start = bisect_left(years, year)
+            seq = years[start:]
+        else:
+            end = bisect_right(years, year)
+            seq = years[:end][::-1]
+        for y in seq:
+            info = self.get_info(y)
+            if info is None or info.may_contain(stamp, newer):
+                yield y
+
+
+year_manifest = YearManifest()  #: The manifest of the current XML folder.
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Migration of the XML files of a data folder to the SQLite backend.
+
+The entries are streamed year by year from the XML files (and their
+journals) into the database and inserted in chunks, so at most one chunk
+of entries is kept in memory, see :meth:`SQLiteBackend.replace_range`.
+Each year is written in one transaction and verified afterwards by
+comparing the number of entries and the checksum with the summary of
+the XML file. Verified years are recorded in the database together with
+their summary, so an interrupted migration continues with the years
+that are missing or were changed since.
+
+The database is written to a temporary file next to its final location
+and only renamed once all years are migrated, the app keeps using the
+XML files until then. Before renaming, the summaries of all years are
+checked again and the years changed in the meantime are migrated again.
+The XML files are not modified.
+
+Run it with::
+
+    story-time-migrate [data_folder]
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from story_time import util
+from story_time.XML_write import (
+    EntryRecord,
+    iter_year_records,
+    read_year_summary,
+    record_checksum,
+)
+from story_time.manifest import year_manifest
+from story_time.storage import SQLiteBackend, get_db_file
+from story_time.timestamps import date_to_stamp
+from story_time.year_store import year_store
+
+PARTIAL_EXT = ".partial"  #: Extension of the database while it is migrated.
+
+
+class _Summarizer:
+    """Counts the records and sums their checksums while passing them on."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.checksum = 0
+
+    def add(self, record: EntryRecord) -> None:
+        self.count += 1
+        self.checksum = (self.checksum + record_checksum(record)) & 0xFFFFFFFF
+
+    def wrap(self, records: Iterable[EntryRecord]) -> Iterator[EntryRecord]:
+        for r in records:
+            self.add(r)
+            yield r
+
+
+def _year_range(year: int) -> Tuple[int, int]:
+    """Returns the range of timestamps of the given year."""
+    return date_to_stamp(year, 1, 1), date_to_stamp(year + 1, 1, 1)
+
+
+def _done_key(year: int) -> str:
+    return f"migrated_{year}"
+
+
+def _done_value(count: int, checksum: int) -> str:
+    return f"{count}:{checksum:08x}"
+
+
+def _is_migrated(backend: SQLiteBackend, year: int) -> bool:
+    """Checks whether a year was migrated and not changed since.
+
+    Args:
+        backend: The target database.
+        year: The year to check.
+    """
+    done = backend.get_meta(_done_key(year))
+    if done is None:
+        return False
+    expected = read_year_summary(year)
+    # Files without a summary cannot be checked without parsing them
+    if expected is None or expected.checksum is None:
+        return True
+    return done == _done_value(expected.n_entries, expected.checksum)
+
+
+def migrate_year(backend: SQLiteBackend, year: int) -> int:
+    """Copies the entries of a year into the database and verifies them.
+
+    Entries of that year already in the database, e.g. from an
+    interrupted run, are replaced.
+
+    Args:
+        backend: The target database.
+        year: The year to migrate.
+
+    Returns:
+        The number of migrated entries.
+
+    Raises:
+        ValueError: If the entries in the database do not match the
+            summary of the XML file.
+    """
+    start, end = _year_range(year)
+    source = _Summarizer()
+    backend.replace_range(start, end, source.wrap(iter_year_records(year)))
+
+    expected = read_year_summary(year)
+    if expected is not None and (expected.n_entries, expected.checksum) != (
+        source.count,
+        source.checksum,
+    ):
+        raise ValueError(f"Entries of year {year} do not match the XML summary!")
+    stored = _Summarizer()
+    for r in backend.range(start, end):
+        stored.add(r)
+    if (stored.count, stored.checksum) != (source.count, source.checksum):
+        raise ValueError(f"Verification of year {year} in the database failed!")
+
+    backend.set_meta(_done_key(year), _done_value(source.count, source.checksum))
+    return source.count
+
+
+def migrate(data_path: str, log: Callable[[str], None] = print) -> Optional[str]:
+    """Migrates the XML files of a data folder into an SQLite database.
+
+    Args:
+        data_path: The data folder containing the XML folder.
+        log: Function used to report the progress.
+
+    Returns:
+        The path of the database or None if the migration failed.
+    """
+    util.update_folder(data_path)
+    db_file = get_db_file(data_path)
+    if os.path.isfile(db_file):
+        log(f"Database {db_file} already exists, nothing to migrate.")
+        return db_file
+    partial_file = db_file + PARTIAL_EXT
+    backend = SQLiteBackend(partial_file)
+    n_tot, t_tot = 0, 0.0
+    n_passes = 0
+    try:
+        # Repeated until no year was changed while migrating the others
+        changed = True
+        while changed:
+            changed = False
+            years: List[int] = year_manifest.years()
+            for year in years:
+                if _is_migrated(backend, year):
+                    if n_passes == 0:
+                        log(f"{year}: already migrated, skipping.")
+                    continue
+                t_start = time.perf_counter()
+                n = migrate_year(backend, year)
+                dt = time.perf_counter() - t_start
+                n_tot, t_tot = n_tot + n, t_tot + dt
+                rate = n / max(dt, 1e-9)
+                log(f"{year}: {n} entries in {dt:.2f} s ({rate:.0f} entries/s)")
+                changed = True
+                # Do not keep the trees loaded for the summaries
+                year_store.invalidate()
+            n_passes += 1
+    except ValueError as e:
+        log(f"Migration failed: {e}")
+        return None
+    finally:
+        backend.close()
+    os.replace(partial_file, db_file)
+    log(
+        f"Migrated {n_tot} entries of {len(years)} years in {t_tot:.2f} s "
+        f"({n_tot / max(t_tot, 1e-9):.0f} entries/s) to {db_file}."
+    )
+    return db_file
+
+
+def main(argv: List[str] = None) -> int:
+    """Entry point of `story-time-migrate`.
+
+    Args:
+        argv: The command line arguments, `sys.argv` is used if None.
+
+    Returns:
+        The exit code.
+    """
+    parser = argparse.ArgumentParser(
+        description="Migrate the XML files of a StoryTime data folder to SQLite."
+    )
+    parser.add_argument(
+        "data_folder",
+        nargs="?",
+        help="The data folder, defaults to the one last used by the app.",
+    )
+    args = parser.parse_args(argv)
+    data_path = args.data_folder
+    if data_path is None:
+        try:
+            data_path = util.get_info_from_file(ask=False)
+        except AssertionError:
+            parser.error("No data folder specified and none stored in the info file.")
+    if not os.path.isdir(data_path):
+        parser.error(f"{data_path} is not a directory.")
+    return 0 if migrate(data_path) is not None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
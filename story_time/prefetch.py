@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Background loading of the entries around the one in the preview.
+
+After each navigation step of the preview, a worker thread steps a copy
+of the preview cursor a few entries in both directions and loads the
+images of the photo entries it passes, scaled to the size of the
+preview. When the user steps to one of these entries, its image is
+taken from the prefetched ones instead of being decoded on the UI
+thread. Stepping the cursor also loads the neighbouring years, so
+crossing a year boundary does not have to wait for the XML file.
+
+Only `wx.Image` objects are created in the worker, the conversion to a
+bitmap happens in the main thread.
+"""
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import wx
+
+from story_time import util
+from story_time.XML_write import EntryRecord
+from story_time.storage import EntryCursor
+from story_time.util import getScaledImage, image_loader
+
+_ImgKey = Tuple[str, int]
+
+
+class PreviewPrefetcher:
+    """Prefetches the neighbouring entries of the preview in a worker thread.
+
+    Each request increments the generation, the worker stops working on
+    requests of older generations.
+
+    Args:
+        n: Number of entries prefetched in each direction.
+    """
+
+    def __init__(self, n: int = 3) -> None:
+        self.n = n
+        self._images: Dict[_ImgKey, wx.Image] = {}
+        self._generation = 0
+        self._request: Optional[Tuple[int, EntryCursor, int]] = None
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._stopped = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def request(self, cursor: EntryCursor, height: int) -> None:
+        """Starts prefetching around the position of `cursor`.
+
+        Args:
+            cursor: The cursor of the preview, it is copied and not moved.
+            height: The size of the preview images.
+        """
+        with self._wake:
+            self._generation += 1
+            self._request = (self._generation, cursor.copy(), height)
+            self._wake.notify()
+
+    def show(self, ctrl: wx.StaticBitmap, name: str, height: int = 180) -> None:
+        """Shows the preview image in the control.
+
+        A prefetched image is shown at once, otherwise it is loaded by
+        :data:`story_time.util.image_loader` in the background.
+
+        Args:
+            ctrl: The control showing the image.
+            name: The path of the image.
+            height: The size of the bitmap.
+        """
+        with self._lock:
+            image = self._images.get((name, height))
+        if image is None:
+            image_loader.show(ctrl, name, height)
+            return
+        image_loader.cancel(ctrl)
+        ctrl.SetBitmap(wx.Bitmap(image))
+
+    def clear(self) -> None:
+        """Drops everything prefetched, e.g. when the data folder changes."""
+        with self._wake:
+            self._generation += 1
+            self._request = None
+            self._images = {}
+
+    def stop(self) -> None:
+        """Stops the worker thread."""
+        with self._wake:
+            self._stopped = True
+            self._generation += 1
+            self._wake.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._wake:
+                while self._request is None and not self._stopped:
+                    self._wake.wait()
+                if self._stopped or self._request is None:
+                    return
+                gen, cursor, height = self._request
+                self._request = None
+            self._prefetch(gen, cursor, height)
+
+    def _prefetch(self, gen: int, cursor: EntryCursor, height: int) -> None:
+        """Runs in the worker thread."""
+        older, newer = cursor.copy(), cursor
+        records: List[Optional[EntryRecord]] = []
+        for _ in range(self.n):
+            records.append(older.older())
+            records.append(newer.newer())
+            if gen != self._generation:
+                return
+
+        # Keep the images that are still needed
+        images: Dict[_ImgKey, wx.Image] = {}
+        with self._lock:
+            old_images = self._images
+        for r in records:
+            if r is None or r.entry_type != "photo" or r.photo is None:
+                continue
+            key = (os.path.join(util.img_folder, r.photo), height)
+            image = old_images.get(key)
+            if image is None and os.path.isfile(key[0]):
+                image = getScaledImage(*key)
+            if gen != self._generation:
+                return
+            if image is not None:
+                images[key] = image
+        with self._lock:
+            if gen == self._generation:
+                self._images = images
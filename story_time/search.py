@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Full-text search over the diary entries.
+
+The words of all entries, including the captions of photos, are kept
+in an inverted index that maps each word to the entries it occurs in.
+The index is split into one shard per year, which is stored as JSON
+in the `Index` folder of the data folder together with the number of
+entries and the checksum of the year it was built from. If they do
+not match the summary of the year in the storage backend anymore, see
+:meth:`story_time.storage.StorageBackend.year_info`, the shard is
+rebuilt from the entries of the backend. Entries saved through the
+backend are added to the loaded shards directly, see
+:data:`story_time.storage.save_listeners`, and the changed shards are
+written on :meth:`flush`.
+
+For typo-tolerant search, all words of the loaded shards are indexed
+by their trigrams, see :meth:`SearchIndex.fuzzy_search`.
+"""
+import json
+import os
+import re
+import threading
+from bisect import bisect_left
+from heapq import nlargest
+from itertools import islice
+from typing import Dict, List, Optional, NamedTuple, Iterator, Set, Iterable, Tuple
+
+from story_time import util
+from story_time.XML_write import EntryRecord, record_checksum
+from story_time.storage import StorageBackend, get_backend, save_listeners
+from story_time.timestamps import date_to_stamp, isos_to_stamps, stamp_year
+
+INDEX_FOLDER = "Index"  #: Name of the folder of the index in the data folder.
+INDEX_VERSION = 1  #: Shards of other versions are rebuilt.
+MIN_SIMILARITY = 0.4  #: Minimum trigram similarity of fuzzy matching words.
+PREFIX_SIMILARITY = 0.9  #: Similarity of words starting with a typed prefix.
+MAX_SIMILAR_WORDS = 50  #: Maximum number of similar words used per query word.
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Splits a text into lower case words."""
+    return _WORD_RE.findall(text.casefold())
+
+
+def trigrams(word: str) -> Set[str]:
+    """Returns the trigrams of a word, padded so that short words have some."""
+    padded = f"  {word} "
+    return {a + b + c for a, b, c in zip(padded, padded[1:], padded[2:])}
+
+
+class SearchHit(NamedTuple):
+    """An entry found by :meth:`SearchIndex.fuzzy_search`."""
+
+    score: float  #: The sum of the similarities of the query words.
+    record: EntryRecord  #: The found entry.
+
+
+class Query(NamedTuple):
+    """A parsed search query, all terms and phrases need to match."""
+
+    terms: List[str]  #: Words that need to occur somewhere in the entry.
+    phrases: List[List[str]]  #: Sequences of words that need to occur in order.
+
+    def words(self) -> Set[str]:
+        """Returns all words of the query."""
+        return set(self.terms).union(*self.phrases)
+
+
+def parse_query(query: str) -> Query:
+    """Parses a query, text in double quotes is treated as a phrase."""
+    terms: List[str] = []
+    phrases: List[List[str]] = []
+    for k, part in enumerate(query.split('"')):
+        words = tokenize(part)
+        if k % 2 == 1 and len(words) > 1:
+            phrases.append(words)
+        else:
+            terms.extend(words)
+    return Query(terms, phrases)
+
+
+class YearShard:
+    """The inverted index of the entries of one year.
+
+    The entries are identified by their position in :attr:`records`.
+    """
+
+    records: List[EntryRecord]  #: The indexed entries.
+    stamps: List[int]  #: The timestamps of the indexed entries.
+    postings: Dict[str, List[int]]  #: Word -> sorted ids of the entries.
+    count: int  #: The number of indexed entries.
+    checksum: int  #: The sum of the checksums of the indexed entries.
+
+    def __init__(self) -> None:
+        self.records = []
+        self.stamps = []
+        self.postings = {}
+        self.count = 0
+        self.checksum = 0
+
+    def add(self, record: EntryRecord) -> None:
+        """Adds an entry to the index."""
+        doc_id = len(self.records)
+        self.records.append(record)
+        self.stamps.append(record.stamp)
+        for word in set(tokenize(record.text)):
+            self.postings.setdefault(word, []).append(doc_id)
+        self.count += 1
+        self.checksum = (self.checksum + record_checksum(record)) & 0xFFFFFFFF
+
+    def _has_phrases(self, doc_id: int, phrases: List[List[str]]) -> bool:
+        """Checks the phrases in the text, which contains all their words."""
+        text = f" {' '.join(tokenize(self.records[doc_id].text))} "
+        return all(f" {' '.join(ph)} " in text for ph in phrases)
+
+    def matches(
+        self, query: Query, start: int = None, end: int = None
+    ) -> Iterator[int]:
+        """Yields the ids of the matching entries, newest first.
+
+        Args:
+            query: The parsed query, must contain at least one word.
+            start: Only entries with timestamp >= `start` match if not None.
+            end: Only entries with timestamp < `end` match if not None.
+        """
+        postings = []
+        for w in query.words():
+            p = self.postings.get(w)
+            if p is None:
+                return
+            postings.append(p)
+        postings.sort(key=len)
+        docs = set(postings[0]).intersection(*postings[1:])
+        stamps = self.stamps
+        for d in sorted(docs, key=lambda d: (stamps[d], d), reverse=True):
+            if start is not None and stamps[d] < start:
+                continue
+            if end is not None and stamps[d] >= end:
+                continue
+            if not query.phrases or self._has_phrases(d, query.phrases):
+                yield d
+
+    def to_json(self) -> Dict:
+        """Converts the shard to a JSON serializable dict."""
+        return {
+            "version": INDEX_VERSION,
+            "count": self.count,
+            "checksum": self.checksum,
+            "records": [list(r) for r in self.records],
+            "postings": self.postings,
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict) -> Optional["YearShard"]:
+        """Creates the shard from :meth:`to_json`, None if incompatible."""
+        if data.get("version") != INDEX_VERSION:
+            return None
+        shard = cls()
+        shard.count, shard.checksum = data["count"], data["checksum"]
+        shard.records = [EntryRecord(*r) for r in data["records"]]
+        shard.stamps = isos_to_stamps([r.date_time for r in shard.records])
+        shard.postings = data["postings"]
+        return shard
+
+
+class SearchIndex:
+    """The search index of the current data folder, see the module docs."""
+
+    def __init__(self) -> None:
+        self._folder: Optional[str] = None
+        self._backend: Optional[StorageBackend] = None
+        self._shards: Dict[int, YearShard] = {}
+        self._dirty: Set[int] = set()
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._vocab: Set[str] = set()
+        self._sorted_vocab: Optional[List[str]] = None
+        self._lock = threading.RLock()
+
+    def _check_backend(self) -> StorageBackend:
+        """Returns the backend of the current data folder.
+
+        The shards of the previous backend are dropped if it changed,
+        e.g. because the data folder was changed.
+        """
+        backend = get_backend()
+        if backend is not self._backend or util.data_path != self._folder:
+            self.flush()
+            self._shards.clear()
+            self._trigrams.clear()
+            self._vocab.clear()
+            self._sorted_vocab = None
+            self._folder, self._backend = util.data_path, backend
+        return backend
+
+    def _add_words(self, words: Iterable[str]) -> None:
+        """Adds words to the trigram index of the vocabulary."""
+        for w in words:
+            if w not in self._vocab:
+                self._vocab.add(w)
+                self._sorted_vocab = None
+                for g in trigrams(w):
+                    self._trigrams.setdefault(g, set()).add(w)
+
+    def _shard_file(self, year: int) -> str:
+        assert self._folder is not None, "No data folder!"
+        return os.path.join(self._folder, INDEX_FOLDER, f"{year}.json")
+
+    def _read_shard(self, year: int) -> Optional[YearShard]:
+        try:
+            with open(self._shard_file(year), encoding="utf-8") as f:
+                return YearShard.from_json(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_shard(self, year: int, shard: YearShard) -> None:
+        shard_file = self._shard_file(year)
+        os.makedirs(os.path.dirname(shard_file), exist_ok=True)
+        tmp_file = f"{shard_file}.tmp"
+        data = json.dumps(shard.to_json(), ensure_ascii=False)
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_file, shard_file)
+
+    def get_shard(self, year: int) -> Optional[YearShard]:
+        """Returns the up to date shard of a year, None if it does not exist.
+
+        The shard is read from disk or rebuilt if necessary. This is done
+        without holding the lock, so saving entries meanwhile, see
+        :meth:`on_save`, is not blocked. If the year is changed while the
+        shard is built, it is built again.
+        """
+        while True:
+            with self._lock:
+                backend = self._check_backend()
+                info = backend.year_info(year)
+                if info is None:
+                    return None
+                shard = self._shards.get(year)
+                if shard is not None and (shard.count, shard.checksum) == (
+                    info.n_entries,
+                    info.checksum,
+                ):
+                    return shard
+            shard = self._read_shard(year)
+            if shard is None or (shard.count, shard.checksum) != (
+                info.n_entries,
+                info.checksum,
+            ):
+                shard = YearShard()
+                start, end = date_to_stamp(year, 1, 1), date_to_stamp(year + 1, 1, 1)
+                for r in backend.range(start, end):
+                    shard.add(r)
+                self._write_shard(year, shard)
+            with self._lock:
+                if backend is not self._check_backend():
+                    continue
+                if backend.year_info(year) != info:
+                    # Entries were saved in the meantime
+                    continue
+                current = self._shards.get(year)
+                if current is not None and (current.count, current.checksum) == (
+                    shard.count,
+                    shard.checksum,
+                ):
+                    # Loaded by another thread in the meantime
+                    return current
+                self._shards[year] = shard
+                self._dirty.discard(year)
+                self._add_words(shard.postings)
+                return shard
+
+    def on_save(
+        self, backend: StorageBackend, year: int, records: List[EntryRecord]
+    ) -> None:
+        """Adds newly saved entries to the shard of their year if it is loaded.
+
+        Entries saved to another backend than the one of the index are
+        ignored.
+        """
+        with self._lock:
+            if backend is not self._check_backend():
+                return
+            shard = self._shards.get(year)
+            if shard is not None:
+                for r in records:
+                    shard.add(r)
+                    self._add_words(tokenize(r.text))
+                self._dirty.add(year)
+
+    def iter_search(
+        self, query: str, start: int = None, end: int = None
+    ) -> Iterator[EntryRecord]:
+        """Yields the entries matching the query, newest first.
+
+        The years are searched one after the other, so the first
+        results are available before all years are loaded.
+        See :meth:`search` for the arguments.
+        """
+        q = parse_query(query)
+        if not q.words():
+            return
+        with self._lock:
+            years = self._check_backend().years()
+        for year in reversed(years):
+            if start is not None and year < stamp_year(start):
+                break
+            if end is not None and year > stamp_year(end):
+                continue
+            shard = self.get_shard(year)
+            if shard is None:
+                continue
+            with self._lock:
+                hits = [shard.records[d] for d in shard.matches(q, start, end)]
+            yield from hits
+
+    def search(
+        self, query: str, start: int = None, end: int = None, limit: int = None
+    ) -> List[EntryRecord]:
+        """Finds the entries matching the query, newest first.
+
+        Args:
+            query: Words that all need to occur in an entry, words in
+                double quotes need to occur as a phrase. Case is ignored.
+            start: Only entries with timestamp >= `start` are returned if not None.
+            end: Only entries with timestamp < `end` are returned if not None.
+            limit: The maximum number of returned entries, all if None.
+
+        Returns:
+            The matching entries.
+        """
+        return list(islice(self.iter_search(query, start, end), limit))
+
+    def similar_words(self, word: str, prefix: bool = False) -> Dict[str, float]:
+        """Finds the words in the index similar to `word`.
+
+        The similarity is the Dice coefficient of the trigrams, the word
+        itself has similarity 1.
+
+        Args:
+            word: A lower case word.
+            prefix: Whether words starting with `word` are also similar.
+
+        Returns:
+            The most similar words mapped to their similarity.
+        """
+        with self._lock:
+            grams = trigrams(word)
+            shared: Dict[str, int] = {}
+            for g in grams:
+                for w in self._trigrams.get(g, ()):
+                    shared[w] = shared.get(w, 0) + 1
+            sims = {}
+            for w, n in shared.items():
+                sim = 2 * n / (len(grams) + len(w) + 1)
+                if sim >= MIN_SIMILARITY:
+                    sims[w] = sim
+            if prefix:
+                if self._sorted_vocab is None:
+                    self._sorted_vocab = sorted(self._vocab)
+                vocab = self._sorted_vocab
+                k = bisect_left(vocab, word)
+                while k < len(vocab) and vocab[k].startswith(word):
+                    sims[vocab[k]] = max(sims.get(vocab[k], 0.0), PREFIX_SIMILARITY)
+                    k += 1
+            if word in self._vocab:
+                sims[word] = 1.0
+            best = nlargest(MAX_SIMILAR_WORDS, sims.items(), key=lambda ws: ws[1])
+            return dict(best)
+
+    def fuzzy_search(
+        self, query: str, k: int = 10, prefix: bool = True
+    ) -> List[SearchHit]:
+        """Finds the entries best matching the query, tolerating typos.
+
+        Each query word is matched to similar words in the index, see
+        :meth:`similar_words`. An entry scores the similarity of the
+        best matching word for every query word, entries with the same
+        score are ranked by recency. All years are loaded on first use.
+
+        Args:
+            query: The search text, case is ignored.
+            k: The maximum number of returned entries.
+            prefix: Whether the last word is treated as a prefix, e.g.
+                while the user is typing.
+
+        Returns:
+            The best matching entries, best first.
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+        with self._lock:
+            years = self._check_backend().years()
+        # The shards are built without holding the lock, see get_shard
+        shards: List[Tuple[int, YearShard]] = []
+        for year in years:
+            shard = self.get_shard(year)
+            if shard is not None:
+                shards.append((year, shard))
+        with self._lock:
+            scores: Dict[Tuple[int, int], float] = {}
+            for i, word in enumerate(words):
+                last = prefix and i == len(words) - 1
+                best: Dict[Tuple[int, int], float] = {}
+                for w, sim in self.similar_words(word, last).items():
+                    for year, shard in shards:
+                        for d in shard.postings.get(w, ()):
+                            if best.get((year, d), 0.0) < sim:
+                                best[(year, d)] = sim
+                for key, sim in best.items():
+                    scores[key] = scores.get(key, 0.0) + sim
+            shard_of = dict(shards)
+
+            def rank(item: Tuple[Tuple[int, int], float]) -> Tuple[float, int]:
+                (year, d), score = item
+                return score, shard_of[year].stamps[d]
+
+            top = nlargest(k, scores.items(), key=rank)
+            return [SearchHit(sc, shard_of[y].records[d]) for (y, d), sc in top]
+
+    def flush(self) -> None:
+        """Writes the shards that were changed since they were written."""
+        with self._lock:
+            for year in list(self._dirty):
+                self._write_shard(year, self._shards[year])
+                self._dirty.discard(year)
+
+
+search_index = SearchIndex()  #: The search index of the current data folder.
+save_listeners.append(search_index.on_save)
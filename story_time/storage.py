@@ -0,0 +1,710 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Storage backends for the diary entries.
+
+The default backend stores the entries in one XML file per year, see
+:mod:`story_time.XML_write`. Alternatively, the entries can be stored
+in an SQLite database in the data folder, which keeps navigation
+and range queries fast for diaries spanning decades.
+
+All backends use integer timestamps, see :mod:`story_time.timestamps`,
+and return the entries as :class:`story_time.XML_write.EntryRecord`.
+Indices over the entries, e.g. the search index, are notified of saved
+entries through :data:`save_listeners` and validated against the
+summaries of the years, see :meth:`StorageBackend.year_info`.
+"""
+import os
+import sqlite3
+import threading
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from collections import OrderedDict
+from typing import Iterator, Optional, Iterable, Tuple, List, Dict, Callable
+
+from story_time import util
+from story_time.XML_write import (
+    EntryRecord,
+    save_record,
+    save_entries,
+    find_closest_entry,
+    iter_entries,
+    load_XML,
+    compact_journals,
+    record_checksum,
+    update_year_info,
+)
+from story_time.manifest import YearInfo, year_manifest
+from story_time.timestamps import date_to_stamp, stamp_year
+
+DB_NAME = "story_time.sqlite"  #: Name of the database in the data folder.
+
+#: Functions called with the backend, the year and the records after
+#: entries were saved.
+save_listeners: List[Callable[["StorageBackend", int, List[EntryRecord]], None]] = []
+
+
+class StorageBackend:
+    """Interface of the storage of the diary entries.
+
+    Entries with the same timestamp are returned in the order they
+    were saved.
+    """
+
+    def save(self, record: EntryRecord) -> None:
+        """Saves a new entry."""
+        raise NotImplementedError
+
+    def save_many(self, records: Iterable[EntryRecord]) -> List[Optional[str]]:
+        """Saves many entries at once, e.g. when importing.
+
+        Returns:
+            For each entry, None if it was saved or the reason why not.
+        """
+        results: List[Optional[str]] = []
+        for r in records:
+            try:
+                self.save(r)
+                results.append(None)
+            except ValueError as e:
+                results.append(str(e))
+        return results
+
+    def range(self, start: int = None, end: int = None) -> Iterator[EntryRecord]:
+        """Iterates over the entries with `start` <= timestamp < `end`.
+
+        The entries are returned sorted by their timestamp, if `start`
+        or `end` is None, the range is not bounded on that side.
+        """
+        raise NotImplementedError
+
+    def nearest(self, stamp: int, newer: bool = False) -> Optional[EntryRecord]:
+        """Finds the entry closest to `stamp`.
+
+        Only entries strictly older (or newer if `newer` is True)
+        than `stamp` are considered.
+        """
+        raise NotImplementedError
+
+    def count(self) -> int:
+        """Returns the total number of entries."""
+        raise NotImplementedError
+
+    def year_counts(self) -> Dict[int, int]:
+        """Returns the number of entries of each year that has entries."""
+        counts: Dict[int, int] = {}
+        for r in self.range():
+            year = stamp_year(r.stamp)
+            counts[year] = counts.get(year, 0) + 1
+        return counts
+
+    def years(self) -> List[int]:
+        """Returns the sorted years, all years with entries are included."""
+        return sorted(self.year_counts())
+
+    def year_info(self, year: int) -> Optional[YearInfo]:
+        """Returns the number and the checksum of the entries of a year.
+
+        Indices built from the entries of a year store this summary and
+        are rebuilt if it changed. None is returned if the year has no
+        entries.
+        """
+        count, checksum = 0, 0
+        start, end = date_to_stamp(year, 1, 1), date_to_stamp(year + 1, 1, 1)
+        for r in self.range(start, end):
+            count += 1
+            checksum = (checksum + record_checksum(r)) & 0xFFFFFFFF
+        return YearInfo(count, checksum=checksum) if count > 0 else None
+
+    def _notify_saved(self, records: Iterable[EntryRecord]) -> None:
+        """Calls the functions in `save_listeners` for each year."""
+        by_year: Dict[int, List[EntryRecord]] = {}
+        for r in records:
+            by_year.setdefault(stamp_year(r.stamp), []).append(r)
+        for year, saved in sorted(by_year.items()):
+            for fun in save_listeners:
+                fun(self, year, saved)
+
+    def close(self) -> None:
+        """Writes pending changes, the backend must not be used afterwards."""
+
+    def __iter__(self) -> Iterator[EntryRecord]:
+        return self.range()
+
+
+class XMLBackend(StorageBackend):
+    """Stores the entries in one XML file per year in `util.xml_folder`.
+
+    The loaded trees are shared, so the access is serialized with a lock
+    common to all instances, e.g. the prefetching worker steps through the
+    entries while the main thread saves new ones.
+    """
+
+    _lock = threading.RLock()
+
+    def save(self, record: EntryRecord) -> None:
+        with self._lock:
+            save_record(record)
+        self._notify_saved([record])
+
+    def save_many(self, records: Iterable[EntryRecord]) -> List[Optional[str]]:
+        records = list(records)
+        with self._lock:
+            results = save_entries(records)
+        self._notify_saved(r for r, res in zip(records, results) if res is None)
+        return results
+
+    def range(self, start: int = None, end: int = None) -> Iterator[EntryRecord]:
+        # The entries are taken year by year, the lock is not held while
+        # the caller processes them
+        years = [
+            y
+            for y in self.years()
+            if (start is None or y >= stamp_year(start))
+            and (end is None or y <= stamp_year(end))
+        ]
+        for year in years:
+            y_start, y_end = date_to_stamp(year, 1, 1), date_to_stamp(year + 1, 1, 1)
+            y_start = y_start if start is None else max(start, y_start)
+            y_end = y_end if end is None else min(end, y_end)
+            with self._lock:
+                records = list(iter_entries(y_start, y_end))
+            yield from records
+
+    def nearest(self, stamp: int, newer: bool = False) -> Optional[EntryRecord]:
+        with self._lock:
+            child = find_closest_entry(stamp, newer)
+            return None if child is None else EntryRecord.from_element(child)
+
+    def count(self) -> int:
+        return sum(self.year_counts().values())
+
+    def year_counts(self) -> Dict[int, int]:
+        counts = {}
+        for year in self.years():
+            info = self.year_info(year)
+            if info is not None:
+                counts[year] = info.n_entries
+        return counts
+
+    def years(self) -> List[int]:
+        with self._lock:
+            return year_manifest.years()
+
+    def year_info(self, year: int) -> Optional[YearInfo]:
+        with self._lock:
+            info = year_manifest.get_info(year)
+            if info is None:
+                try:
+                    info = update_year_info(year, load_XML(year, False)[0])
+                except FileNotFoundError:
+                    return None
+        return info if info.n_entries > 0 else None
+
+    def close(self) -> None:
+        with self._lock:
+            compact_journals()
+
+
+class SQLiteBackend(StorageBackend):
+    """Stores the entries in an SQLite database indexed by timestamp.
+
+    The number and the checksum of the entries of each year are kept in
+    the table `years`, which is updated in the same transactions as the
+    entries.
+
+    Args:
+        db_file: The path to the database file, created if it does not exist.
+    """
+
+    _columns = "date_time, type, text, photo"
+    chunk_size = 1000  #: Number of entries inserted at once by :meth:`replace_range`.
+
+    def __init__(self, db_file: str) -> None:
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "id INTEGER PRIMARY KEY, stamp INTEGER NOT NULL, "
+                "date_time TEXT NOT NULL, type TEXT NOT NULL, "
+                "text TEXT NOT NULL, photo TEXT)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS entries_stamp ON entries (stamp, id)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS years (year INTEGER PRIMARY KEY, "
+                "count INTEGER NOT NULL, checksum INTEGER NOT NULL)"
+            )
+            # Databases created before the summaries were kept
+            has_years = self._conn.execute("SELECT 1 FROM years LIMIT 1").fetchone()
+            if not has_years:
+                sums: Dict[int, List[int]] = {}
+                rows = self._conn.execute(f"SELECT stamp, {self._columns} FROM entries")
+                for row in rows:
+                    self._add_to_sums(sums, row, 1)
+                self._update_years(sums)
+
+    def save(self, record: EntryRecord) -> None:
+        self.save_records([record])
+
+    def save_many(self, records: Iterable[EntryRecord]) -> List[Optional[str]]:
+        valid: List[EntryRecord] = []
+        results: List[Optional[str]] = []
+        for r in records:
+            try:
+                self._to_row(r)
+                valid.append(r)
+                results.append(None)
+            except (ValueError, AttributeError) as e:
+                results.append(str(e))
+        self.save_records(valid)
+        return results
+
+    def save_records(self, records: Iterable[EntryRecord]) -> None:
+        """Saves multiple entries in one transaction.
+
+        The functions in `save_listeners` are called once the transaction
+        is committed.
+        """
+        records = list(records)
+        self.replace_range(None, None, records, delete=False)
+        self._notify_saved(records)
+
+    def replace_range(
+        self,
+        start: Optional[int],
+        end: Optional[int],
+        records: Iterable[EntryRecord],
+        delete: bool = True,
+    ) -> None:
+        """Replaces the entries with `start` <= timestamp < `end` by `records`.
+
+        Deleting and inserting happens in one transaction, if it fails,
+        the database is left unchanged. The records are inserted in
+        chunks of :attr:`chunk_size`, only one chunk is kept in memory.
+        The functions in `save_listeners` are not called, this is meant
+        for tools like :mod:`story_time.migrate`.
+
+        Args:
+            start: Start of the range, unbounded if None.
+            end: End of the range, unbounded if None.
+            records: The new entries, may be a generator.
+            delete: Whether to delete the entries in the range first.
+        """
+        rows = (self._to_row(r) for r in records)
+        insert = f"INSERT INTO entries (stamp, {self._columns}) VALUES (?, ?, ?, ?, ?)"
+        sums: Dict[int, List[int]] = {}
+        with self._lock, self._conn:
+            if delete:
+                bounds = self._bounds(start, end)
+                for row in self._conn.execute(
+                    f"SELECT stamp, {self._columns} FROM entries "
+                    "WHERE stamp >= ? AND stamp < ?",
+                    bounds,
+                ):
+                    self._add_to_sums(sums, row, -1)
+                self._conn.execute(
+                    "DELETE FROM entries WHERE stamp >= ? AND stamp < ?", bounds
+                )
+            while True:
+                chunk = list(islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                self._conn.executemany(insert, chunk)
+                for row in chunk:
+                    self._add_to_sums(sums, row, 1)
+            self._update_years(sums)
+
+    @staticmethod
+    def _add_to_sums(sums: Dict[int, List[int]], row: Tuple, sign: int) -> None:
+        """Adds (or subtracts) an entry row to the changes of its year."""
+        year_sums = sums.setdefault(stamp_year(row[0]), [0, 0])
+        year_sums[0] += sign
+        year_sums[1] += sign * record_checksum(EntryRecord(*row[1:]))
+
+    def _update_years(self, sums: Dict[int, List[int]]) -> None:
+        """Applies the changes to the table `years`, in the open transaction."""
+        for year, (n, checksum) in sums.items():
+            row = self._conn.execute(
+                "SELECT count, checksum FROM years WHERE year = ?", (year,)
+            ).fetchone()
+            count, total = (0, 0) if row is None else row
+            count, total = count + n, (total + checksum) & 0xFFFFFFFF
+            if count > 0:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO years (year, count, checksum) "
+                    "VALUES (?, ?, ?)",
+                    (year, count, total),
+                )
+            else:
+                self._conn.execute("DELETE FROM years WHERE year = ?", (year,))
+
+    @staticmethod
+    def _to_row(r: EntryRecord) -> Tuple:
+        if r.entry_type not in ("text", "photo"):
+            raise ValueError(f"Entry of type: {r.entry_type} is not supported!")
+        return r.stamp, r.date_time, r.entry_type, r.text, r.photo
+
+    @staticmethod
+    def _bounds(start: Optional[int], end: Optional[int]) -> Tuple[int, int]:
+        lo = -(2**63) if start is None else start
+        hi = 2**63 - 1 if end is None else end
+        return lo, hi
+
+    def get_meta(self, key: str) -> Optional[str]:
+        """Returns the value stored for `key` or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = ?", (key,)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def set_meta(self, key: str, value: str) -> None:
+        """Stores a value, e.g. for bookkeeping of tools."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    def range(self, start: int = None, end: int = None) -> Iterator[EntryRecord]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {self._columns} FROM entries "
+                "WHERE stamp >= ? AND stamp < ? ORDER BY stamp, id",
+                self._bounds(start, end),
+            ).fetchall()
+        return (EntryRecord(*r) for r in rows)
+
+    def nearest(self, stamp: int, newer: bool = False) -> Optional[EntryRecord]:
+        agg, op = ("MIN", ">") if newer else ("MAX", "<")
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {self._columns} FROM entries WHERE stamp = "
+                f"(SELECT {agg}(stamp) FROM entries WHERE stamp {op} ?) "
+                "ORDER BY id LIMIT 1",
+                (stamp,),
+            ).fetchone()
+        return None if row is None else EntryRecord(*row)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def year_counts(self) -> Dict[int, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT year, count FROM years").fetchall()
+        return dict(rows)
+
+    def years(self) -> List[int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT year FROM years ORDER BY year").fetchall()
+        return [r[0] for r in rows]
+
+    def year_info(self, year: int) -> Optional[YearInfo]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT count, checksum FROM years WHERE year = ?", (year,)
+            ).fetchone()
+        return None if row is None else YearInfo(row[0], checksum=row[1])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class EntryCursor:
+    """A position in the sequence of all entries sorted by timestamp.
+
+    The entries of the year around the position are kept, so stepping
+    to the next older or newer entry is constant time and only reaching
+    the end of the year needs a query of the backend. Entries with the
+    same timestamp are visited one after the other.
+    The cursor can also be before the oldest or after the newest entry.
+
+    Args:
+        backend: The backend containing the entries.
+    """
+
+    def __init__(self, backend: StorageBackend) -> None:
+        self.backend = backend
+        self._records: List[EntryRecord] = []
+        self._stamps: List[int] = []
+        self._k = -1
+        self._stale = False
+
+    @property
+    def current(self) -> Optional[EntryRecord]:
+        """The entry at the position, None if before or after all entries."""
+        if self._stale:
+            self._reload()
+        if 0 <= self._k < len(self._records):
+            return self._records[self._k]
+        return None
+
+    def _load_year(self, year: int) -> None:
+        start, end = date_to_stamp(year, 1, 1), date_to_stamp(year + 1, 1, 1)
+        self._records = list(self.backend.range(start, end))
+        self._stamps = [r.stamp for r in self._records]
+        self._stale = False
+
+    def _reload(self) -> None:
+        """Reloads the entries of the year, keeps the current position."""
+        cur = self._records[self._k] if 0 <= self._k < len(self._records) else None
+        before = self._k < 0
+        if cur is None:
+            stamps = self._stamps
+            if stamps:
+                self._load_year(stamp_year(stamps[0 if before else -1]))
+            else:
+                self._records, self._stamps, self._stale = [], [], False
+            self._k = -1 if before else len(self._records)
+            return
+        self._load_year(stamp_year(cur.stamp))
+        k = self._locate(cur)
+        self._k = bisect_left(self._stamps, cur.stamp) if k is None else k
+
+    def _locate(self, record: EntryRecord) -> Optional[int]:
+        """Returns the position of `record` in the loaded entries.
+
+        If no entry equals `record`, the first one with its timestamp is
+        returned, None if there is none.
+        """
+        k = bisect_left(self._stamps, record.stamp)
+        k_end = bisect_right(self._stamps, record.stamp)
+        for i in range(k, k_end):
+            if self._records[i] == record:
+                return i
+        return k if k < k_end else None
+
+    def seek(self, stamp: int, newer: bool = False) -> Optional[EntryRecord]:
+        """Moves to the entry closest to `stamp`, see :meth:`StorageBackend.nearest`.
+
+        If there is no such entry, the cursor is placed before the oldest
+        (or after the newest if `newer` is True) entry.
+
+        Returns:
+            The found entry or None.
+        """
+        found = self.backend.nearest(stamp, newer)
+        if found is None:
+            # Keep the year of the entries on the other side as window
+            other = self.backend.nearest(stamp, not newer)
+            if other is None:
+                self._records, self._stamps, self._stale = [], [], False
+            else:
+                self._load_year(stamp_year(other.stamp))
+            self._k = len(self._records) if newer else -1
+            return None
+        self._load_year(stamp_year(found.stamp))
+        if newer:
+            self._k = bisect_left(self._stamps, found.stamp)
+        else:
+            self._k = bisect_right(self._stamps, found.stamp) - 1
+        return self.current
+
+    def seek_record(self, record: EntryRecord) -> Optional[EntryRecord]:
+        """Moves to the entry `record`, e.g. one found by the search.
+
+        Of several entries with the same timestamp, the one equal to
+        `record` is chosen. If there is no entry with its timestamp, the
+        cursor moves to the closest older entry, see :meth:`seek`.
+
+        Returns:
+            The entry at the new position or None.
+        """
+        self._load_year(stamp_year(record.stamp))
+        k = self._locate(record)
+        if k is None:
+            return self.seek(record.stamp)
+        self._k = k
+        return self.current
+
+    def older(self) -> Optional[EntryRecord]:
+        """Moves to the next older entry and returns it.
+
+        Returns None and moves before the oldest entry if there is none.
+        """
+        if self._stale:
+            self._reload()
+        if self._k > 0:
+            self._k = min(self._k, len(self._records)) - 1
+            return self._records[self._k]
+        if self._records:
+            first = self._stamps[0]
+            prev = self.backend.nearest(date_to_stamp(stamp_year(first), 1, 1))
+            if prev is not None:
+                self._load_year(stamp_year(prev.stamp))
+                self._k = len(self._records) - 1
+                return self._records[self._k]
+        self._k = -1
+        return None
+
+    def newer(self) -> Optional[EntryRecord]:
+        """Moves to the next newer entry and returns it.
+
+        Returns None and moves after the newest entry if there is none.
+        """
+        if self._stale:
+            self._reload()
+        if self._k < len(self._records) - 1:
+            self._k = max(self._k, -1) + 1
+            return self._records[self._k]
+        if self._records:
+            last = self._stamps[-1]
+            end = date_to_stamp(stamp_year(last) + 1, 1, 1)
+            nxt = self.backend.nearest(end - 1, newer=True)
+            if nxt is not None:
+                self._load_year(stamp_year(nxt.stamp))
+                self._k = 0
+                return self._records[0]
+        self._k = len(self._records)
+        return None
+
+    def copy(self) -> "EntryCursor":
+        """Returns an independent cursor at the same position."""
+        other = EntryCursor(self.backend)
+        other._records, other._stamps = self._records, self._stamps
+        other._k, other._stale = self._k, self._stale
+        return other
+
+    def invalidate(self) -> None:
+        """Marks the entries as changed, e.g. after a new entry was saved.
+
+        The entries around the position are loaded again on the next step.
+        """
+        self._stale = True
+
+
+class EntryTimeline:
+    """All entries as a sequence, newest first, e.g. for a virtual list.
+
+    Only the number of entries per year is read up front, the entries
+    of a year are loaded when one of them is first accessed. At most
+    `max_years` years are kept loaded. If a loaded year has another
+    number of entries than read up front, e.g. because entries were
+    saved in the meantime, the positions of the older years are shifted
+    accordingly, so the length may change when a year is loaded.
+
+    Entries can be accessed from several threads, e.g. a worker loading
+    the years while the main thread uses :meth:`peek`.
+
+    Args:
+        backend: The backend containing the entries.
+        max_years: The number of years kept in memory.
+    """
+
+    def __init__(self, backend: StorageBackend, max_years: int = 4) -> None:
+        self.backend = backend
+        self.max_years = max_years
+        self._years: List[int] = []
+        self._offsets: List[int] = []
+        self._loaded: "OrderedDict[int, List[EntryRecord]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Reads the number of entries again, e.g. after saving."""
+        counts = self.backend.year_counts()
+        with self._lock:
+            self._years = sorted(counts, reverse=True)
+            self._offsets = [0]
+            for y in self._years:
+                self._offsets.append(self._offsets[-1] + counts[y])
+            self._loaded.clear()
+
+    def __len__(self) -> int:
+        return self._offsets[-1]
+
+    def _year_index(self, i: int) -> int:
+        """Returns the position of the year of the i-th entry."""
+        if not 0 <= i < len(self):
+            raise IndexError(f"Entry {i} out of range!")
+        return bisect_right(self._offsets, i) - 1
+
+    def _year_records(self, k: int) -> List[EntryRecord]:
+        """Returns the entries of the k-th year, loads them if necessary."""
+        with self._lock:
+            year = self._years[k]
+            records = self._loaded.get(year)
+            if records is not None:
+                self._loaded.move_to_end(year)
+                return records
+        start, end = date_to_stamp(year, 1, 1), date_to_stamp(year + 1, 1, 1)
+        records = list(self.backend.range(start, end))[::-1]
+        with self._lock:
+            if k >= len(self._years) or self._years[k] != year:
+                # Refreshed in the meantime
+                return records
+            self._loaded[year] = records
+            if len(self._loaded) > self.max_years:
+                self._loaded.popitem(last=False)
+            diff = len(records) - (self._offsets[k + 1] - self._offsets[k])
+            for j in range(k + 1, len(self._offsets)):
+                self._offsets[j] += diff
+        return records
+
+    def __getitem__(self, i: int) -> EntryRecord:
+        while True:
+            with self._lock:
+                k = self._year_index(i)
+            records = self._year_records(k)
+            with self._lock:
+                # Loading the year may have shifted the following ones
+                k_now = self._year_index(i)
+                if k_now == k and self._loaded.get(self._years[k]) is records:
+                    return records[i - self._offsets[k]]
+
+    def peek(self, i: int) -> Optional[EntryRecord]:
+        """Returns the i-th entry if its year is loaded, None otherwise."""
+        with self._lock:
+            k = self._year_index(i)
+            records = self._loaded.get(self._years[k])
+            return None if records is None else records[i - self._offsets[k]]
+
+
+_backend: Optional[StorageBackend] = None
+_backend_path: Optional[str] = None
+
+
+def get_db_file(data_path: str = None) -> str:
+    """Returns the path of the SQLite database in the data folder."""
+    return os.path.join(util.data_path if data_path is None else data_path, DB_NAME)
+
+
+def get_backend() -> StorageBackend:
+    """Returns the backend of the current data folder.
+
+    The SQLite backend is used if the data folder contains a database,
+    the XML backend otherwise.
+    """
+    global _backend
+    global _backend_path
+    if _backend is None or _backend_path != util.data_path:
+        close_backend()
+        db_file = get_db_file()
+        _backend = SQLiteBackend(db_file) if os.path.isfile(db_file) else XMLBackend()
+        _backend_path = util.data_path
+    return _backend
+
+
+def set_backend(backend: Optional[StorageBackend]) -> None:
+    """Uses `backend` for the current data folder, closes the previous one."""
+    global _backend
+    global _backend_path
+    if backend is not _backend:
+        close_backend()
+    _backend = backend
+    _backend_path = util.data_path
+
+
+def close_backend() -> None:
+    """Closes the current backend, e.g. before the data folder is changed."""
+    global _backend
+    if _backend is not None:
+        _backend.close()
+    _backend = None
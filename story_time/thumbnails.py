@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Persistent cache of downscaled versions of the diary photos.
+
+Decoding a photo straight from the camera takes hundreds of milliseconds,
+while the previews and dialogs only show it a few hundred pixels large.
+So each photo is decoded once and stored in a pyramid of sizes in the
+`Thumbs` folder next to the `Img` folder, later views read the smallest
+stored version that is at least as large as needed. The pyramid is
+created in a background thread when a photo is imported, see
+:func:`schedule_thumbnails`, or otherwise the first time it is shown.
+
+The thumbnails are addressed by a hash of the name, the modification
+time and the size of the photo, so the photo itself does not have to be
+read to find them, and a changed photo gets new thumbnails.
+
+JPEG files are decoded at a reduced scale if they are shown smaller
+than their full size, see :func:`open_reduced`.
+"""
+import hashlib
+import os
+import queue
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+from story_time.year_store import file_signature
+
+THUMBS_FOLDER = "Thumbs"  #: Name of the folder of the thumbnails in the data folder.
+THUMB_SIZES = (128, 256, 512, 1024)  #: Sizes of the longer side of the thumbnails.
+THUMB_QUALITY = 90  #: JPEG quality of the thumbnails.
+
+
+def thumb_key(img_path: str) -> Optional[str]:
+    """Returns the key of the thumbnails of an image, None if it does not exist."""
+    sig = file_signature(img_path)
+    if sig is None:
+        return None
+    name = f"{os.path.basename(img_path)}:{sig[0]}:{sig[1]}"
+    return hashlib.sha1(name.encode("utf-8")).hexdigest()
+
+
+def thumb_path(thumbs_folder: str, key: str, size: int) -> str:
+    """Returns the path of the thumbnail with the given key and size."""
+    return os.path.join(thumbs_folder, f"{key}_{size}.jpg")
+
+
+def open_reduced(img_path: str, size: Tuple[int, int]) -> Optional[Image.Image]:
+    """Decodes a JPEG file at the smallest scale covering `size`.
+
+    The JPEG decoder can directly produce the image at 1/2, 1/4 or 1/8
+    of its size, which is much faster and needs less memory than
+    decoding the full image and downscaling it afterwards.
+
+    Args:
+        img_path: The path of the image.
+        size: The width and height the image needs at least.
+
+    Returns:
+        The decoded RGB image or None if the file is not a JPEG.
+
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    with Image.open(img_path) as im:
+        if im.format != "JPEG":
+            return None
+        im.draft("RGB", size)
+        return im.convert("RGB")
+
+
+def create_thumbnails(
+    img_path: str, thumbs_folder: str, sizes: Sequence[int] = THUMB_SIZES
+) -> List[str]:
+    """Decodes the image once and stores the thumbnails of all sizes.
+
+    Args:
+        img_path: The path of the image.
+        thumbs_folder: The folder of the thumbnails, created if necessary.
+        sizes: The sizes of the thumbnails.
+
+    Returns:
+        The paths of the stored thumbnails, largest first.
+
+    Raises:
+        OSError: If the image cannot be read or the thumbnails not written.
+    """
+    key = thumb_key(img_path)
+    if key is None:
+        raise FileNotFoundError(f"Image {img_path} does not exist!")
+    os.makedirs(thumbs_folder, exist_ok=True)
+    paths = []
+    with Image.open(img_path) as src:
+        src.draft("RGB", (max(sizes), max(sizes)))
+        rgb = src.convert("RGB")
+        for size in sorted(sizes, reverse=True):
+            rgb.thumbnail((size, size), Image.Resampling.LANCZOS)
+            path = thumb_path(thumbs_folder, key, size)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            rgb.save(tmp_path, "JPEG", quality=THUMB_QUALITY)
+            os.replace(tmp_path, path)
+            paths.append(path)
+    return paths
+
+
+def get_thumbnail(
+    img_path: str, size: int, thumbs_folder: str, sizes: Sequence[int] = THUMB_SIZES
+) -> Optional[str]:
+    """Returns the smallest thumbnail covering `size` pixels.
+
+    The thumbnails are created if they do not exist yet.
+
+    Args:
+        img_path: The path of the image.
+        size: The size the image is shown at.
+        thumbs_folder: The folder of the thumbnails.
+        sizes: The sizes of the thumbnails.
+
+    Returns:
+        The path of the thumbnail or None if the original image should
+        be used, e.g. because it is shown larger than all thumbnails.
+    """
+    fitting = [s for s in sizes if s >= size]
+    key = thumb_key(img_path)
+    if not fitting or key is None:
+        return None
+    path = thumb_path(thumbs_folder, key, min(fitting))
+    if os.path.isfile(path):
+        return path
+    try:
+        create_thumbnails(img_path, thumbs_folder, sizes)
+    except OSError:
+        return None
+    return path
+
+
+_pending: "queue.Queue[Tuple[str, str]]" = queue.Queue()
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+def _run_worker() -> None:
+    while True:
+        img_path, thumbs_folder = _pending.get()
+        try:
+            create_thumbnails(img_path, thumbs_folder)
+        except OSError:
+            # Not an image that can be read, the original will be shown
+            pass
+        finally:
+            _pending.task_done()
+
+
+def schedule_thumbnails(img_path: str, thumbs_folder: str) -> None:
+    """Creates the thumbnails of an image in a background thread.
+
+    Args:
+        img_path: The path of the image, e.g. just imported.
+        thumbs_folder: The folder of the thumbnails.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_run_worker, daemon=True)
+            _worker.start()
+    _pending.put((img_path, thumbs_folder))
+
+
+def wait_for_thumbnails() -> None:
+    """Blocks until all scheduled thumbnails are created."""
+    _pending.join()
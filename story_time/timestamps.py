@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Compact integer timestamps for the data layer.
+
+The entries store their date and time as ISO strings, e.g.
+"2020-12-02T05:31:00". For searching and sorting they are converted
+to integer seconds since 1970-01-01 (without any timezone handling),
+which is much faster than creating a `wx.DateTime` per entry.
+The conversions work for all years of the proleptic Gregorian
+calendar, also outside of the range supported by `datetime`.
+"""
+import warnings
+from typing import Tuple, Sequence, List
+
+import numpy as np
+
+_DAY = 86400
+_MIN_VECTORIZED = 64  #: Minimum number of strings parsed with numpy.
+
+
+def days_from_civil(year: int, month: int, day: int) -> int:
+    """Returns the number of days since 1970-01-01 of the given date."""
+    year -= month <= 2
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def civil_from_days(days: int) -> Tuple[int, int, int]:
+    """Inverse of :func:`days_from_civil`, returns year, month and day."""
+    days += 719468
+    era = days // 146097
+    doe = days - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = mp + 3 if mp < 10 else mp - 9
+    return yoe + era * 400 + (month <= 2), month, day
+
+
+def date_to_stamp(
+    year: int, month: int, day: int, hour: int = 0, minute: int = 0, second: int = 0
+) -> int:
+    """Converts a date and time to an integer timestamp.
+
+    Months and days start at 1.
+    """
+    return days_from_civil(year, month, day) * _DAY + hour * 3600 + minute * 60 + second
+
+
+def iso_to_stamp(iso: str) -> int:
+    """Converts an ISO date time string to an integer timestamp.
+
+    Args:
+        iso: The string in the format "YYYY-MM-DDTHH:MM:SS".
+
+    Returns:
+        The number of seconds since 1970.
+    """
+    d, t = iso.split("T")
+    y, mon, day = d.rsplit("-", 2)
+    h, m, s = t.split(":")
+    return date_to_stamp(int(y), int(mon), int(day), int(h), int(m), int(s[:2]))
+
+
+def isos_to_stamps(isos: Sequence[str]) -> List[int]:
+    """Converts many ISO date time strings to integer timestamps.
+
+    Longer sequences, e.g. all entries of a year, are parsed at once
+    by numpy. Strings numpy cannot handle, e.g. with years after 9999,
+    fall back to :func:`iso_to_stamp`, as do the strings not exactly in
+    the format "YYYY-MM-DDTHH:MM:SS", which numpy parses more leniently.
+    So the results and the errors do not depend on the number of strings.
+
+    Raises:
+        ValueError: If a string is not a valid ISO date time string.
+    """
+    if len(isos) < _MIN_VECTORIZED:
+        return [iso_to_stamp(s) for s in isos]
+    try:
+        with warnings.catch_warnings():
+            # Time zones are ignored by numpy, these strings are checked below
+            warnings.simplefilter("ignore", UserWarning)
+            arr = np.array(isos, dtype="datetime64[s]")
+    except ValueError:
+        return [iso_to_stamp(s) for s in isos]
+    stamps = arr.astype(np.int64).tolist()
+    # Also catches the empty strings, which numpy turns into NaT
+    exact = np.datetime_as_string(arr, unit="s") == np.asarray(isos)
+    for k in np.flatnonzero(~exact).tolist():
+        stamps[k] = iso_to_stamp(isos[k])
+    return stamps
+
+
+def stamp_to_iso(stamp: int) -> str:
+    """Converts an integer timestamp back to an ISO date time string."""
+    days, secs = divmod(stamp, _DAY)
+    y, mon, d = civil_from_days(days)
+    h, rem = divmod(secs, 3600)
+    m, s = divmod(rem, 60)
+    return f"{y:04d}-{mon:02d}-{d:02d}T{h:02d}:{m:02d}:{s:02d}"
+
+
+def stamp_date(stamp: int) -> Tuple[int, int, int]:
+    """Returns the year, month and day of an integer timestamp."""
+    return civil_from_days(stamp // _DAY)
+
+
+def stamp_day_of_year(stamp: int) -> int:
+    """Returns the day of the year of an integer timestamp, starting at 0."""
+    days = stamp // _DAY
+    year = civil_from_days(days)[0]
+    return days - days_from_civil(year, 1, 1)
+
+
+def stamp_year(stamp: int) -> int:
+    """Returns the year of an integer timestamp."""
+    return civil_from_days(stamp // _DAY)[0]
@@ -5,7 +5,11 @@ Inspired by: ZetCode wxPython tutorial, www.zetcode.com
 
 import os
 import shutil
-from typing import Callable, List, Union, Optional, Tuple, Any
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from typing import Callable, Dict, List, Union, Optional, Tuple, Any, Hashable
 
 import cv2
 import wx
@@ -13,7 +17,18 @@ from pkg_resources import resource_filename
 
 import story_time
 from story_time import util
-from story_time.XML_write import save_entry, find_closest_entry
+from story_time.XML_write import create_record, EntryRecord
+from story_time.day_index import day_index
+from story_time.prefetch import PreviewPrefetcher
+from story_time.search import search_index
+from story_time.storage import (
+    EntryCursor,
+    EntryTimeline,
+    StorageBackend,
+    get_backend,
+    close_backend,
+)
+from story_time.timestamps import date_to_stamp
 from story_time.util import (
     FileDrop,
     icon_path,
@@ -23,6 +38,8 @@ from story_time.util import (
     scale_bitmap,
     format_date_time,
     getImageToShow,
+    getScaledImage,
+    image_loader,
     SelfieDialog,
     get_img_name_from_time,
     temp_folder,
@@ -45,6 +62,26 @@ LR_EXPAND = wx.LEFT | wx.RIGHT | wx.EXPAND
 EXPAND_ALL = wx.ALL | wx.EXPAND
 
 
+def wx_to_stamp(date_time: wx.DateTime) -> int:
+    """Converts a wx.DateTime to an integer timestamp of the data layer."""
+    dt = date_time
+    return date_to_stamp(
+        dt.GetYear(),
+        dt.GetMonth() + 1,
+        dt.GetDay(),
+        dt.GetHour(),
+        dt.GetMinute(),
+        dt.GetSecond(),
+    )
+
+
+def iso_to_wx(iso: str) -> wx.DateTime:
+    """Converts an ISO date time string of the data layer to a wx.DateTime."""
+    date = wx.DateTime()
+    date.ParseISOCombined(iso)
+    return date
+
+
 class TextLinePanel(wx.Panel):
     stat_text: wx.StaticText
 
@@ -179,6 +216,11 @@ class ToolbarPanel(wx.Panel):
             "Selfie",
             "Take a picture with your webcam.",
         ),
+        (
+            "timeline_icon.png",
+            "Timeline",
+            "Show the timeline of all entries.",
+        ),
     ]
     tools: List[wx.ToolBarToolBase]
     photoTool: Union[Any, wx.ToolBarToolBase]
@@ -224,13 +266,462 @@ class ToolbarPanel(wx.Panel):
         self.toolbar.Realize()
 
     def bind_tools(self, met_list: List[Callable]) -> None:
-        assert len(met_list) == 5 == len(self.tools), f"Tools: {self.tools}"
+        assert len(met_list) == 6 == len(self.tools), f"Tools: {self.tools}"
         for met, tool in zip(met_list, self.tools):
             self.Bind(wx.EVT_TOOL, met, tool)
 
     pass
 
 
+class ResultList(wx.ListCtrl):
+    """Virtual list showing the entries found by the search.
+
+    Only the rows that are visible are formatted.
+    """
+
+    records: List[EntryRecord]
+
+    def __init__(self, parent: wx.Window):
+        style = wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_SINGLE_SEL
+        wx.ListCtrl.__init__(self, parent, style=style, size=(-1, 150))
+        self.InsertColumn(0, "Date", width=150)
+        self.InsertColumn(1, "Entry", width=500)
+        self.records = []
+
+    def set_records(self, records: List[EntryRecord]) -> None:
+        self.records = []
+        self.add_records(records)
+
+    def add_records(self, records: List[EntryRecord]) -> None:
+        self.records.extend(records)
+        self.SetItemCount(len(self.records))
+        self.Refresh()
+
+    def OnGetItemText(self, item: int, col: int) -> str:
+        r = self.records[item]
+        if col == 0:
+            return r.date_time.replace("T", ", ")
+        text = r.text if r.entry_type == "text" else "Photo: " + r.text
+        return rep_newlines_with_space(text)
+
+
+class SearchPanel(wx.Panel):
+    """Search box with the list of the found entries.
+
+    The search runs in a worker thread while the user is typing. Each
+    change of the text increments the generation of the search, results
+    of older generations are dropped and the worker stops searching
+    them. The results are added to the list as they are found. If there
+    are no exact matches, the best fuzzy matches are shown instead.
+    If a search fails, e.g. because the index cannot be read, the error
+    is shown below the search box and the next search is run anyway.
+
+    Args:
+        parent: The parent window.
+        on_select: Called with the record of the chosen result.
+        bg_col: The background colour.
+    """
+
+    batch_time = 0.05  #: Minimum seconds between updates of the list.
+    n_fuzzy = 50  #: Number of fuzzy matches shown.
+
+    def __init__(
+        self,
+        parent: wx.Frame,
+        on_select: Callable[[EntryRecord], None],
+        bg_col: wx.Colour = "Green",
+    ):
+        wx.Panel.__init__(self, parent)
+        self.on_select = on_select
+        self.search_ctrl = wx.SearchCtrl(self, style=wx.TE_PROCESS_ENTER)
+        self.search_ctrl.ShowCancelButton(True)
+        self.search_ctrl.SetDescriptiveText("Search entries")
+        self.result_list = ResultList(self)
+        self.result_list.Hide()
+        self.error_text = wx.StaticText(self)
+        self.error_text.Hide()
+
+        box = wx.BoxSizer(wx.VERTICAL)
+        box.Add(self.search_ctrl, 0, EXPAND_ALL, 5)
+        box.Add(self.error_text, 0, LR_EXPAND, 5)
+        box.Add(self.result_list, 1, LR_EXPAND, 5)
+        box.Fit(self)
+        self.SetAutoLayout(True)
+        self.SetSizer(box)
+        self.SetBackgroundColour(bg_col)
+
+        self.search_ctrl.Bind(wx.EVT_TEXT, self.OnText)
+        self.search_ctrl.Bind(wx.EVT_SEARCHCTRL_CANCEL_BTN, self.OnCancel)
+        self.result_list.Bind(wx.EVT_LIST_ITEM_SELECTED, self.OnResult)
+
+        self._generation = 0
+        self._query: Optional[Tuple[int, str]] = None
+        self._wake = threading.Condition()
+        self._stopped = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def OnText(self, _: Any) -> None:
+        """Starts a new search, cancels the running one."""
+        query = self.search_ctrl.GetValue()
+        with self._wake:
+            self._generation += 1
+            self._query = (self._generation, query)
+            self._wake.notify()
+        self.result_list.set_records([])
+        self.result_list.Show(query.strip() != "")
+        self.error_text.Hide()
+        self.GetParent().Layout()
+
+    def OnCancel(self, _: Any) -> None:
+        self.search_ctrl.SetValue("")
+
+    def OnResult(self, e: wx.ListEvent) -> None:
+        self.on_select(self.result_list.records[e.GetIndex()])
+
+    def stop(self) -> None:
+        """Stops the worker thread, must be called before destroying."""
+        with self._wake:
+            self._stopped = True
+            self._generation += 1
+            self._wake.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._wake:
+                while self._query is None and not self._stopped:
+                    self._wake.wait()
+                if self._stopped or self._query is None:
+                    return
+                gen, query = self._query
+                self._query = None
+            try:
+                self._search(gen, query)
+            except Exception as e:
+                # Keep the worker alive for the next query
+                traceback.print_exc()
+                wx.CallAfter(self._show_error, gen, f"Search failed: {e}")
+
+    def _search(self, gen: int, query: str) -> None:
+        """Runs in the worker thread, passes the results to the UI thread."""
+        batch: List[EntryRecord] = []
+        n_found = 0
+        last_post = time.perf_counter()
+        for rec in search_index.iter_search(query):
+            if gen != self._generation:
+                return
+            batch.append(rec)
+            if time.perf_counter() - last_post > self.batch_time:
+                wx.CallAfter(self._add_results, gen, batch)
+                n_found += len(batch)
+                batch, last_post = [], time.perf_counter()
+        n_found += len(batch)
+        if n_found == 0 and gen == self._generation:
+            hits = search_index.fuzzy_search(query, self.n_fuzzy)
+            batch = [h.record for h in hits]
+        if batch and gen == self._generation:
+            wx.CallAfter(self._add_results, gen, batch)
+
+    def _add_results(self, gen: int, records: List[EntryRecord]) -> None:
+        if gen == self._generation:
+            self.result_list.add_records(records)
+
+    def _show_error(self, gen: int, msg: str) -> None:
+        if gen == self._generation:
+            self.error_text.SetLabel(msg)
+            self.error_text.Show()
+            self.GetParent().Layout()
+
+
+class OnThisDayPanel(wx.Panel):
+    """List of the entries of the same calendar day in earlier years.
+
+    The entries are looked up in a worker thread, so the day index is
+    only built once it is needed and does not delay the startup. If the
+    entry changes before the lookup is done, its result is dropped. If a
+    lookup fails, the error is shown in the title.
+
+    Args:
+        parent: The parent window.
+        on_select: Called with the record of the chosen entry.
+        bg_col: The background colour.
+    """
+
+    def __init__(
+        self,
+        parent: wx.Frame,
+        on_select: Callable[[EntryRecord], None],
+        bg_col: wx.Colour = "Green",
+    ):
+        wx.Panel.__init__(self, parent)
+        self.on_select = on_select
+        self.title = wx.StaticText(self, label="On this day")
+        self.result_list = ResultList(self)
+        self.result_list.Hide()
+
+        box = wx.BoxSizer(wx.VERTICAL)
+        box.Add(self.title, 0, EXPAND_ALL, 5)
+        box.Add(self.result_list, 1, LR_EXPAND, 5)
+        box.Fit(self)
+        self.SetAutoLayout(True)
+        self.SetSizer(box)
+        self.SetBackgroundColour(bg_col)
+
+        self.result_list.Bind(wx.EVT_LIST_ITEM_SELECTED, self.OnResult)
+
+        self._generation = 0
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._wake = threading.Condition()
+        self._stopped = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def set_entry(self, record: Optional[EntryRecord]) -> None:
+        """Starts looking up the entries of the day of `record`."""
+        with self._wake:
+            self._generation += 1
+            if record is not None:
+                self._stamp = (self._generation, record.stamp)
+                self._wake.notify()
+            else:
+                self._stamp = None
+        if record is None:
+            self._set_results(self._generation, [])
+
+    def OnResult(self, e: wx.ListEvent) -> None:
+        self.on_select(self.result_list.records[e.GetIndex()])
+
+    def stop(self) -> None:
+        """Stops the worker thread, must be called before destroying."""
+        with self._wake:
+            self._stopped = True
+            self._generation += 1
+            self._wake.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._wake:
+                while self._stamp is None and not self._stopped:
+                    self._wake.wait()
+                if self._stopped or self._stamp is None:
+                    return
+                gen, stamp = self._stamp
+                self._stamp = None
+            try:
+                records = day_index.on_this_day(stamp)
+            except Exception as e:
+                # Keep the worker alive for the next entry
+                traceback.print_exc()
+                wx.CallAfter(self._show_error, gen, f"On this day: lookup failed: {e}")
+                continue
+            if gen == self._generation:
+                wx.CallAfter(self._set_results, gen, records)
+
+    def _set_results(self, gen: int, records: List[EntryRecord]) -> None:
+        if gen != self._generation:
+            return
+        n = len(records)
+        self.title.SetLabel(
+            f"On this day: {n} {'entry' if n == 1 else 'entries'} in earlier years"
+        )
+        self.result_list.set_records(records)
+        if self.result_list.IsShown() != (n > 0):
+            self.result_list.Show(n > 0)
+            self.GetParent().Layout()
+
+    def _show_error(self, gen: int, msg: str) -> None:
+        if gen == self._generation:
+            self.title.SetLabel(msg)
+            self.result_list.set_records([])
+
+
+class TimelineList(wx.ListCtrl):
+    """Virtual list of all entries, newest first, with thumbnails of photos.
+
+    Only the visible rows are formatted. The entries are loaded year by
+    year in a worker thread when they are first shown, see
+    :class:`EntryTimeline`, until then the row shows a placeholder.
+    Thumbnails are decoded in the same thread when their row is shown,
+    the most recently requested ones first, until then the row has no
+    image.
+
+    Args:
+        parent: The parent window.
+        timeline: The entries to show.
+    """
+
+    thumb_size = 64  #: Size of the thumbnails in pixels.
+    max_thumbs = 500  #: Number of thumbnails kept before starting over.
+    snippet_len = 200  #: Number of characters of the text shown.
+
+    def __init__(self, parent: wx.Window, timeline: EntryTimeline):
+        style = wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_SINGLE_SEL
+        wx.ListCtrl.__init__(self, parent, style=style)
+        self.InsertColumn(0, "Date", width=150)
+        self.InsertColumn(1, "Entry", width=500)
+        self.timeline = timeline
+        self.images = wx.ImageList(self.thumb_size, self.thumb_size)
+        self.SetImageList(self.images, wx.IMAGE_LIST_SMALL)
+        self._thumbs: Dict[str, int] = {}
+        # Requested rows and thumbnails, each only once
+        self._pending_rows: "OrderedDict[int, None]" = OrderedDict()
+        self._pending: "OrderedDict[str, None]" = OrderedDict()
+        self._wake = threading.Condition()
+        self._stopped = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+        self.SetItemCount(len(timeline))
+
+    def refresh(self) -> None:
+        """Shows the current entries, e.g. after saving."""
+        with self._wake:
+            self._pending_rows.clear()
+        self.timeline.refresh()
+        self.SetItemCount(len(self.timeline))
+        self.Refresh()
+
+    def _request(self, pending: "OrderedDict", key: Hashable) -> None:
+        """Requests loading a row or a thumbnail in the worker thread."""
+        with self._wake:
+            pending[key] = None
+            pending.move_to_end(key)
+            self._wake.notify()
+
+    def _get_record(self, item: int) -> Optional[EntryRecord]:
+        """Returns the entry of a row, None if it is not loaded yet."""
+        try:
+            r = self.timeline.peek(item)
+        except IndexError:
+            # The year was shorter than expected
+            return None
+        if r is None:
+            self._request(self._pending_rows, item)
+        return r
+
+    def OnGetItemText(self, item: int, col: int) -> str:
+        r = self._get_record(item)
+        if r is None:
+            return "Loading..." if col == 1 else ""
+        if col == 0:
+            return r.date_time.replace("T", ", ")
+        text = r.text if r.entry_type == "text" else "Photo: " + r.text
+        return rep_newlines_with_space(text[: self.snippet_len])
+
+    def OnGetItemImage(self, item: int) -> int:
+        r = self._get_record(item)
+        if r is None or r.entry_type != "photo" or not r.photo:
+            return -1
+        path = os.path.join(util.img_folder, r.photo)
+        k = self._thumbs.get(path)
+        if k is None:
+            self._request(self._pending, path)
+            return -1
+        return k
+
+    def stop(self) -> None:
+        """Stops the worker thread, must be called before destroying."""
+        with self._wake:
+            self._stopped = True
+            self._wake.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._wake:
+                while not (self._pending_rows or self._pending or self._stopped):
+                    self._wake.wait()
+                if self._stopped:
+                    return
+                # The text of the rows first, the most recent requests first
+                row, path = None, None
+                if self._pending_rows:
+                    row = self._pending_rows.popitem()[0]
+                else:
+                    path = self._pending.popitem()[0]
+            try:
+                if row is not None:
+                    self._load_row(row)
+                elif path is not None:
+                    self._load_thumb(path)
+            except Exception:
+                # Keep the worker alive for the next rows
+                traceback.print_exc()
+
+    def _load_row(self, row: int) -> None:
+        """Runs in the worker thread, loads the year of the row."""
+        if row >= len(self.timeline) or self.timeline.peek(row) is not None:
+            return
+        self.timeline[row]  # Loads the year
+        wx.CallAfter(self._on_rows_loaded)
+
+    def _load_thumb(self, path: str) -> None:
+        """Runs in the worker thread."""
+        if path in self._thumbs or not os.path.isfile(path):
+            return
+        image = getScaledImage(path, self.thumb_size, border=0)
+        wx.CallAfter(self._add_thumb, path, image)
+
+    def _on_rows_loaded(self) -> None:
+        if self._stopped:
+            return
+        # Loading a year may have changed the number of entries
+        if self.GetItemCount() != len(self.timeline):
+            self.SetItemCount(len(self.timeline))
+        self._refresh_shown()
+
+    def _add_thumb(self, path: str, image: wx.Image) -> None:
+        if self._stopped or path in self._thumbs:
+            return
+        if len(self._thumbs) >= self.max_thumbs:
+            self.images.RemoveAll()
+            self._thumbs.clear()
+            with self._wake:
+                self._pending.clear()
+        self._thumbs[path] = self.images.Add(wx.Bitmap(image))
+        self._refresh_shown()
+
+    def _refresh_shown(self) -> None:
+        """Redraws the visible rows."""
+        top = self.GetTopItem()
+        bottom = min(top + self.GetCountPerPage(), self.GetItemCount() - 1)
+        if bottom >= top:
+            self.RefreshItems(top, bottom)
+
+
+class TimelineFrame(wx.Frame):
+    """Window with the timeline of all entries.
+
+    Args:
+        parent: The main frame.
+        backend: The backend containing the entries.
+        on_select: Called with the record of the chosen entry.
+    """
+
+    def __init__(
+        self,
+        parent: wx.Frame,
+        backend: StorageBackend,
+        on_select: Callable[[EntryRecord], None],
+    ):
+        wx.Frame.__init__(self, parent, title="Timeline", size=(700, 800))
+        self.on_select = on_select
+        self.timeline_list = TimelineList(self, EntryTimeline(backend))
+        self.timeline_list.SetBackgroundColour(text_bg_col)
+        box = wx.BoxSizer(wx.VERTICAL)
+        box.Add(self.timeline_list, 1, wx.EXPAND)
+        self.SetSizer(box)
+        self.timeline_list.Bind(wx.EVT_LIST_ITEM_SELECTED, self.OnResult)
+        self.Bind(wx.EVT_CLOSE, self.OnClose)
+
+    def OnResult(self, e: wx.ListEvent) -> None:
+        record = self.timeline_list.timeline.peek(e.GetIndex())
+        if record is not None:
+            self.on_select(record)
+
+    def OnClose(self, _: Any) -> None:
+        self.timeline_list.stop()
+        self.Destroy()
+
+
 class StoryTimeApp(wx.Frame):
     """The Story Time App.
 
@@ -258,7 +749,6 @@ class StoryTimeApp(wx.Frame):
     image_drop_space: wx.StaticBitmap
     img_prev: wx.StaticBitmap
     prev_img_space: wx.StaticBitmap
-    bmp_shown: wx.Bitmap
 
     prev_img_name = None
 
@@ -272,6 +762,9 @@ class StoryTimeApp(wx.Frame):
     h_box_4: wx.BoxSizer
 
     next_prev_buttons: TwoButtonPanel
+    search_panel: SearchPanel
+    on_this_day_panel: OnThisDayPanel
+    prefetcher: PreviewPrefetcher
 
     # Data to keep track of the entry in the preview. `prev_dt` contains the
     # wx.DateTime of the previewed entry. If it reaches the end, it is either
@@ -281,6 +774,12 @@ class StoryTimeApp(wx.Frame):
     max_dt: wx.DateTime = wx.DateTime(1, 1, 10000)
     min_dt: wx.DateTime = wx.DateTime(1, 1, 1)
 
+    # Cursor at the previewed entry, only valid while `prev_dt` is `_cursor_dt`.
+    _cursor: Optional[EntryCursor] = None
+    _cursor_dt: Optional[wx.DateTime] = None
+
+    timeline_frame: Optional[TimelineFrame] = None
+
     cdDialog: ChangeDateDialog
     default_img_drop: str
     default_img: str
@@ -305,18 +804,20 @@ class StoryTimeApp(wx.Frame):
 
         Given the path of the image.
         """
-        self.bmp_shown = getImageToShow(name)
-        self.image_drop_space.SetBitmap(self.bmp_shown)
+        image_loader.show(self.image_drop_space, name)
 
     def set_prev_img(self, name: str) -> None:
         """Sets an image in the entry preview panel.
 
         Given the path of the image.
         """
-        self.bmp_shown = getImageToShow(name)
-        self.prev_img_space.SetBitmap(self.bmp_shown)
+        self.prefetcher.show(self.prev_img_space, name, self.prev_img_height())
         self.prev_img_space.Show()
 
+    def prev_img_height(self) -> int:
+        """Returns the size of the image in the entry preview panel."""
+        return 180
+
     def rem_prev_img(self) -> bool:
         """Removes the image by hiding it.
 
@@ -501,9 +1002,14 @@ class StoryTimeApp(wx.Frame):
             # Save image entry
             curr_dat = self.cdDialog.dt
             copied_file_name = copy_img_file_to_imgs(lf, curr_dat)
-            save_entry(textStr, curr_dat, "photo", copied_file_name)
+            iso = curr_dat.FormatISOCombined()
+            rec = create_record(textStr, iso, "photo", copied_file_name)
         else:
-            save_entry(textStr, self.cdDialog.dt)
+            rec = create_record(textStr, self.cdDialog.dt.FormatISOCombined())
+        get_backend().save(rec)
+        self._get_cursor().invalidate()
+        if self.timeline_frame:
+            self.timeline_frame.timeline_list.refresh()
 
         # Clear the contents
         self.removeImg()
@@ -522,6 +1028,7 @@ class StoryTimeApp(wx.Frame):
         now = wx.DateTime.Now()
         self.cdDialog.dt = now
         cal_time = self.cdDialog.get_time()
+        self.cdDialog.mark_days()
         self.cdDialog.ShowModal()
         if self.cdDialog.dt != now and self.cdDialog.dt != cal_time:
             self.update_date()
@@ -536,11 +1043,25 @@ class StoryTimeApp(wx.Frame):
             return
 
         # Update and create data directories if not existing
+        if self.timeline_frame:
+            self.timeline_frame.Close()
+        close_backend()
+        search_index.flush()
+        day_index.flush()
+        self.prefetcher.clear()
         update_folder(files_path)
         self.cwd.SetLabelText(story_time.util.data_path)
         create_xml_and_img_folder(files_path)
         self.set_date_to_now()
 
+    def OnTimeline(self, _: Any) -> None:
+        """Shows the timeline window, or raises it if it is already open."""
+        if self.timeline_frame:
+            self.timeline_frame.Raise()
+            return
+        self.timeline_frame = TimelineFrame(self, get_backend(), self.show_entry)
+        self.timeline_frame.Show()
+
     def OnX(self, _: Any, _deb_fun: Callable = None) -> None:
         """Called when the X is clicked to close.
 
@@ -551,6 +1072,14 @@ class StoryTimeApp(wx.Frame):
     def Cleanup(self, _: Any) -> None:
         """Cleanup, should always be called when app is closed."""
         self.cdDialog.Destroy()
+        if self.timeline_frame:
+            self.timeline_frame.Close()
+        self.search_panel.stop()
+        self.on_this_day_panel.stop()
+        self.prefetcher.stop()
+        close_backend()
+        search_index.flush()
+        day_index.flush()
         write_folder_to_file()
         if os.path.isdir(temp_folder):
             shutil.rmtree(temp_folder)
@@ -576,29 +1105,53 @@ class StoryTimeApp(wx.Frame):
             self.update_preview_text(set_next=False)
             self.Layout()
 
+    def _get_cursor(self) -> EntryCursor:
+        """Returns the cursor for the preview, a new one if the backend changed."""
+        backend = get_backend()
+        if self._cursor is None or self._cursor.backend is not backend:
+            self._cursor = EntryCursor(backend)
+            self._cursor_dt = None
+        return self._cursor
+
     def _get_text_to_put(
-        self, last: bool = True, set_img: bool = False, use_prev_dt: bool = False
+        self,
+        last: bool = True,
+        set_img: bool = False,
+        use_prev_dt: bool = False,
+        record: EntryRecord = None,
     ) -> Tuple[str, bool]:
-        search_dt = self.cdDialog.dt if not use_prev_dt else self.prev_dt
-        ret_val = find_closest_entry(search_dt, not last)
+        cursor = self._get_cursor()
+        if record is not None:
+            ret_val = cursor.seek_record(record)
+        elif use_prev_dt and self._cursor_dt is self.prev_dt:
+            # The previewed entry is the one at the cursor, just step
+            ret_val = cursor.older() if last else cursor.newer()
+        else:
+            search_dt = self.cdDialog.dt if not use_prev_dt else self.prev_dt
+            ret_val = cursor.seek(wx_to_stamp(search_dt), not last)
+        self._cursor_dt = None
         if ret_val is None:
             if use_prev_dt:
                 self.newest_reached = not last
                 self.prev_dt = self.min_dt if last else self.max_dt
+                self._cursor_dt = self.prev_dt
                 self.rem_prev_img()
             return "", True
         self.newest_reached = None
-        child: Any
-        date, child = ret_val
-        is_text = child.get("type") == "text"
-        child_text = child.text if is_text else "Photo: " + child.find("text").text
+        date = iso_to_wx(ret_val.date_time)
+        is_text = ret_val.entry_type == "text"
+        child_text = ret_val.text if is_text else "Photo: " + ret_val.text
         changed_img = False
         if set_img:
             if not is_text:
-                prev_img_name = child.find("photo").text
-                new_p_img_name = os.path.join(
-                    story_time.util.data_path, "Img", prev_img_name
-                )
+                prev_img_name = ret_val.photo
+                if prev_img_name is None:
+                    # Photo entry without an image file
+                    new_p_img_name = self.default_img
+                else:
+                    new_p_img_name = os.path.join(
+                        story_time.util.data_path, "Img", prev_img_name
+                    )
                 if self.prev_img_name != new_p_img_name:
                     self.prev_img_name = new_p_img_name
                     changed_img = True
@@ -608,22 +1161,30 @@ class StoryTimeApp(wx.Frame):
                     r = self.rem_prev_img()
                     changed_img = not r
 
-        self.prev_dt = date
+        self.prev_dt = self._cursor_dt = date
         ret_str = "Last" if last else "Next"
         ret_str += " entry: " + format_date_time(date) + "\n\n"
         ret_str += rep_newlines_with_space(child_text) + "\n\n"
         return ret_str, changed_img
 
-    def update_preview_text(self, set_next: bool = None) -> None:
+    def show_entry(self, record: EntryRecord) -> None:
+        """Shows the entry in the preview, e.g. if chosen in the search."""
+        self.update_preview_text(set_next=False, record=record)
+
+    def update_preview_text(
+        self, set_next: bool = None, record: EntryRecord = None
+    ) -> None:
         """Fills the static datetime text with the most recent entries
         for preview.
+
+        If `record` is specified, that entry is shown.
         """
 
         # Construct the text to put into the preview panel.
         text_to_put = ""
         ch_img = True
         if set_next is not None:
-            nxt, ch_img = self._get_text_to_put(not set_next, True, True)
+            nxt, ch_img = self._get_text_to_put(not set_next, True, True, record)
             text_to_put += nxt
         else:
             prv, ch_img_prv = self._get_text_to_put(True, True)
@@ -654,6 +1215,11 @@ class StoryTimeApp(wx.Frame):
             self.fix_text_box.SetLabel(text_to_put)
             self.v_box.Layout()
 
+        # Load the next entries in both directions in the background
+        cursor = self._get_cursor()
+        self.prefetcher.request(cursor, self.prev_img_height())
+        self.on_this_day_panel.set_entry(cursor.current)
+
     def resized_layout(self) -> None:
         self.Layout()
 
@@ -670,7 +1236,11 @@ class StoryTimeAppUI(StoryTimeApp):
         super(StoryTimeApp, self).__init__(*args, **kwargs)
         self.default_img_drop = os.path.join(icon_path, "default_img_txt.png")
         self.default_img = os.path.join(icon_path, "default_img.png")
-        self.cdDialog = ChangeDateDialog(None, title="Change Date of entry")
+        self.cdDialog = ChangeDateDialog(
+            None,
+            title="Change Date of entry",
+            marked_days=day_index.days_with_entries,
+        )
         icon = wx.Icon()
         icon.CopyFromBitmap(
             wx.Bitmap(os.path.join(icon_path, "Entwurf.jpg"), wx.BITMAP_TYPE_ANY)
@@ -679,6 +1249,7 @@ class StoryTimeAppUI(StoryTimeApp):
         files_path = get_info_from_file()
         update_folder(files_path)
         print("util.img_folder", util.img_folder)
+        self.prefetcher = PreviewPrefetcher()
         self.InitUI()
         self.SetSize((700, 800))
         self.SetTitle("Story Time")
@@ -701,6 +1272,7 @@ class StoryTimeAppUI(StoryTimeApp):
             self.OnChangeDate,
             self.OnChangeDir,
             self.OnSelfie,
+            self.OnTimeline,
         ]
         tool_panel = ToolbarPanel(self, bg_col=header_col)
         tool_panel.bind_tools(met_list)
@@ -743,12 +1315,17 @@ class StoryTimeAppUI(StoryTimeApp):
         self.input_text_sizer = text_edit.GetSizer()
         self.input_text_field = text_edit.text_box
 
+        self.search_panel = SearchPanel(self, self.show_entry, bg_col=header_col)
+
         text_preview = TextAndImgPanel(self, editable=False, bg_col=text_bg_col)
         text_preview.SetMinSize((200, 200))
         self.text_prev_sizer = text_preview.GetSizer()
         self.fix_text_box = text_preview.text_box
         self.prev_img_space = text_preview.img
         self.prev_img_space.Bind(wx.EVT_LEFT_DOWN, self.on_prev_image_clicked)
+        self.on_this_day_panel = OnThisDayPanel(
+            self, self.show_entry, bg_col=header_col
+        )
 
         # Put it all together
         box = wx.BoxSizer(wx.VERTICAL)
@@ -757,7 +1334,9 @@ class StoryTimeAppUI(StoryTimeApp):
         box.Add(time_text, 0, LR_EXPAND)
         box.Add(text_edit, 1, LR_EXPAND)
         box.Add(save_close_buttons, 0, LR_EXPAND)
+        box.Add(self.search_panel, 0, LR_EXPAND)
         box.Add(text_preview, 1, LR_EXPAND)
+        box.Add(self.on_this_day_panel, 0, LR_EXPAND)
         box.Add(self.next_prev_buttons, 0, LR_EXPAND)
         box.Add(path_text, 0, LR_EXPAND)
         box.Fit(self)
@@ -786,13 +1365,13 @@ class StoryTimeAppUI(StoryTimeApp):
             s_min = min(self.input_text_sizer.Size)
             if s_min > 30:
                 set_img = self.default_img_drop if lf is None else lf
-                self.image_drop_space.SetBitmap(getImageToShow(set_img, s_min - 30))
+                image_loader.show(self.image_drop_space, set_img, s_min - 30)
 
             if self.prev_img_name is not None:
                 s_min = min(self.text_prev_sizer.Size)
                 if s_min > 30:
-                    self.prev_img_space.SetBitmap(
-                        getImageToShow(self.prev_img_name, s_min - 30)
+                    self.prefetcher.show(
+                        self.prev_img_space, self.prev_img_name, s_min - 30
                     )
 
             self.Layout()
@@ -802,6 +1381,10 @@ class StoryTimeAppUI(StoryTimeApp):
         self.on_resize(None)
         self.OnIdle(None)
 
+    def prev_img_height(self) -> int:
+        s_min = min(self.text_prev_sizer.Size)
+        return s_min - 30 if s_min > 30 else super().prev_img_height()
+
     def set_prev_img(self, name: str) -> None:
         """Sets an image in the entry preview panel.
 
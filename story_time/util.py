@@ -8,10 +8,14 @@ datetime conversions...
 
 import os
 import re
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from shutil import copy2
-from typing import List, Callable, Sequence, Optional, Any
+from typing import List, Callable, Sequence, Optional, Any, Tuple, Hashable, Dict
 
 import cv2
 import wx
@@ -19,6 +23,16 @@ import wx.adv
 from pkg_resources import resource_filename
 
 import story_time
+from story_time.thumbnails import (
+    THUMBS_FOLDER,
+    THUMB_SIZES,
+    get_thumbnail,
+    open_reduced,
+    schedule_thumbnails,
+    thumb_key,
+    thumb_path,
+)
+from story_time.year_store import file_signature
 
 # Paths to app code and temp folder
 project_path = Path(os.path.dirname(os.path.realpath(__file__))).parent
@@ -37,6 +51,7 @@ img_folder = "if/you/see/this/its/a/bug"  #: The folder where the images are sto
 xml_folder = (
     "if/you/see/this/its/a/bug"  #: The folder where the xml documents are stored.
 )
+thumbs_folder = "if/you/see/this/its/a/bug"  #: The folder of the thumbnails.
 
 # Set colors
 # dark_green = wx.Colour(1, 92, 68)
@@ -59,10 +74,12 @@ def update_folder(new_data_path: str) -> None:
     global data_path
     global img_folder
     global xml_folder
+    global thumbs_folder
 
     data_path = new_data_path
     img_folder = os.path.join(new_data_path, "Img")
     xml_folder = os.path.join(new_data_path, "XML")
+    thumbs_folder = os.path.join(new_data_path, THUMBS_FOLDER)
 
 
 def rep_newlines_with_space(string: str) -> str:
@@ -74,13 +91,16 @@ def rep_newlines_with_space(string: str) -> str:
 
 
 def create_xml_and_img_folder(base_folder: str) -> None:
-    """Create a folder for the XML and the image files in `base_folder`."""
+    """Create a folder for the XML, the image and the thumbnail files in `base_folder`."""
     xml_pth = os.path.join(base_folder, "XML")
     if not os.path.isdir(xml_pth):
         os.mkdir(xml_pth)
     img_pth = os.path.join(base_folder, "Img")
     if not os.path.isdir(img_pth):
         os.mkdir(img_pth)
+    thumbs_pth = os.path.join(base_folder, THUMBS_FOLDER)
+    if not os.path.isdir(thumbs_pth):
+        os.mkdir(thumbs_pth)
     return
 
 
@@ -164,8 +184,8 @@ class PhotoShow(wx.Dialog):
         self.v_box = wx.BoxSizer(wx.VERTICAL)
 
         self.f_name = f_name
-        b = getImageToShow(f_name)
-        self.imageCtrl = wx.StaticBitmap(self, wx.ID_ANY, b)
+        self.imageCtrl = wx.StaticBitmap(self, wx.ID_ANY)
+        image_loader.show(self.imageCtrl, f_name)
         self.v_box.Add(self.imageCtrl, 0, wx.ALL | wx.EXPAND, 0)
 
         self.SetSizer(self.v_box)
@@ -184,7 +204,7 @@ class PhotoShow(wx.Dialog):
             # take action if the dirty flag is set
             self.Layout()
             s = self.v_box.Size
-            self.imageCtrl.SetBitmap(getImageToShow(self.f_name, s[1], width=s[0]))
+            image_loader.show(self.imageCtrl, self.f_name, s[1], width=s[0])
             self.resized = False  # reset the flag
 
 
@@ -288,17 +308,39 @@ class CustomMessageDialog(TwoButtonDialogBase):
         self.Close()
 
 
+def _print_exception(future: Future) -> None:
+    """Prints the exception of a task run in a thread pool, if any."""
+    e = future.exception()
+    if e is not None:
+        traceback.print_exception(type(e), e, e.__traceback__)
+
+
 class ChangeDateDialog(TwoButtonDialogBase):
-    """Date and Time picker dialog"""
+    """Date and Time picker dialog
+
+    If `marked_days` is given, it is called with the year and the month
+    shown in the calendar and the returned days are marked. It is called
+    in a worker thread, so a slow lookup does not block the calendar, the
+    marks are applied in the main thread if the month is still shown.
+    """
 
     start_dt: wx.DateTime
     dt: wx.DateTime
     cal: wx.adv.CalendarCtrl
     timePicker: wx.adv.TimePickerCtrl
 
-    def __init__(self, *args: Any, **kw: Any) -> None:
+    def __init__(
+        self,
+        *args: Any,
+        marked_days: Callable[[int, int], List[int]] = None,
+        **kw: Any,
+    ) -> None:
         super(ChangeDateDialog, self).__init__(*args, **kw)
 
+        self.marked_days = marked_days
+        self._marked: List[int] = []
+        self._mark_gen = 0
+        self._mark_pool = ThreadPoolExecutor(1, thread_name_prefix="marks")
         self.set_time_now()
         self.InitUI()
 
@@ -312,6 +354,7 @@ class ChangeDateDialog(TwoButtonDialogBase):
         top_text = wx.StaticText(self, label="Select Date and Time")
         top_text.SetFont(wx.Font(dialog_f_info))
         self.cal = wx.adv.CalendarCtrl(self)
+        self.cal.Bind(wx.adv.EVT_CALENDAR_PAGE_CHANGED, self.mark_days)
         time_txt = wx.StaticText(self, label="Time: ")
         self.timePicker = wx.adv.TimePickerCtrl(self, dt=self.dt)
 
@@ -334,6 +377,34 @@ class ChangeDateDialog(TwoButtonDialogBase):
 
         self.setup(pnl, "Ok", "Cancel", self.OnOK, self.OnClose)
 
+    def mark_days(self, _: Any = None) -> None:
+        """Marks the days with entries in the month shown by the calendar."""
+        if self.marked_days is None:
+            return
+        shown = self.cal.GetDate()
+        self._mark_gen += 1
+        month = (shown.GetYear(), shown.GetMonth() + 1)
+        future = self._mark_pool.submit(self._load_marks, self._mark_gen, *month)
+        future.add_done_callback(_print_exception)
+
+    def _load_marks(self, gen: int, year: int, month: int) -> None:
+        """Runs in the worker thread, skips the months no longer shown."""
+        assert self.marked_days is not None
+        if gen != self._mark_gen:
+            return
+        days = self.marked_days(year, month)
+        wx.CallAfter(self._set_marks, gen, days)
+
+    def _set_marks(self, gen: int, days: List[int]) -> None:
+        # The dialog may have been destroyed in the meantime
+        if not self or gen != self._mark_gen:
+            return
+        for d in self._marked:
+            self.cal.Mark(d, False)
+        for d in days:
+            self.cal.Mark(d, True)
+        self._marked = list(days)
+
     def set_time_now(self) -> None:
         """Sets the time to now."""
         self.dt = wx.DateTime.Now()
@@ -591,7 +662,8 @@ def copy_img_file_to_imgs(
     the same date and time, a dialog pops up
     to let the user select if he wants to add
     text to an existing image or save the image
-    If he doesn't decide, returns None
+    If he doesn't decide, returns None.
+    The thumbnails of a copied image are created in the background.
     """
     # Get date of image and find all images with same date
     imgDate = get_time_from_file(lf) if img_date is None else img_date
@@ -627,6 +699,7 @@ def copy_img_file_to_imgs(
     imgName = imgName + file_extension
     copied_file_name = os.path.join(img_folder, imgName)
     copy2(lf, copied_file_name)
+    schedule_thumbnails(copied_file_name, thumbs_folder)
     return copied_file_name
 
 
@@ -686,12 +759,129 @@ def format_date_time(date_time: wx.DateTime) -> str:
     return str_out
 
 
+DEFAULT_BITMAP_BYTES = 64 * 1024 * 1024  #: Default memory budget of the bitmaps.
+
+
+class BitmapCache:
+    """LRU cache of the bitmaps rendered by :func:`getImageToShow`.
+
+    The keys contain the modification time and the size of the image
+    file, so a changed file is rendered again. The least recently used
+    bitmaps are evicted if their total size exceeds the budget.
+    """
+
+    hits: int = 0
+    misses: int = 0
+
+    def __init__(self, max_bytes: int = DEFAULT_BITMAP_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._bitmaps: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._n_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def n_bytes(self) -> int:
+        """The memory used by the cached bitmaps."""
+        return self._n_bytes
+
+    def __len__(self) -> int:
+        return len(self._bitmaps)
+
+    def get(self, key: Hashable) -> Optional[wx.Bitmap]:
+        """Returns the cached bitmap or None, counts the hits and misses."""
+        with self._lock:
+            entry = self._bitmaps.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._bitmaps.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, bmp: wx.Bitmap, n_bytes: int = None) -> None:
+        """Adds a bitmap, `n_bytes` is computed from its size if None."""
+        if n_bytes is None:
+            n_bytes = bmp.GetWidth() * bmp.GetHeight() * 4
+        with self._lock:
+            old = self._bitmaps.pop(key, None)
+            if old is not None:
+                self._n_bytes -= old[1]
+            self._bitmaps[key] = (bmp, n_bytes)
+            self._n_bytes += n_bytes
+            while self._n_bytes > self.max_bytes and len(self._bitmaps) > 1:
+                _, (_, n) = self._bitmaps.popitem(last=False)
+                self._n_bytes -= n
+
+    def clear(self) -> None:
+        """Removes all bitmaps."""
+        with self._lock:
+            self._bitmaps.clear()
+            self._n_bytes = 0
+
+
+bitmap_cache = BitmapCache()  #: The bitmaps shared by all windows.
+
+
+def bitmap_key(
+    filename: str, height: int = 180, border: int = 5, width: int = None
+) -> Optional[Hashable]:
+    """Returns the key of the bitmap in :data:`bitmap_cache`.
+
+    None is returned if the file does not exist.
+    """
+    sig = file_signature(filename)
+    if sig is None:
+        return None
+    return os.path.abspath(filename), height, border, width, sig
+
+
 def getImageToShow(
     filename: str, height: int = 180, border: int = 5, width: int = None
 ) -> wx.Bitmap:
     """Converts the specified image to a bitmap of according size.
 
-    Preserves the aspect ratio by padding with a color.
+    The bitmaps are cached in :data:`bitmap_cache`, they must not be
+    modified. See :func:`getScaledImage` for the arguments.
+    """
+    key = bitmap_key(filename, height, border, width)
+    if key is None:
+        return wx.Bitmap(getScaledImage(filename, height, border, width))
+    bmp = bitmap_cache.get(key)
+    if bmp is None:
+        bmp = wx.Bitmap(getScaledImage(filename, height, border, width))
+        bitmap_cache.put(key, bmp)
+    return bmp
+
+
+def load_image(filename: str, width: int, height: int) -> wx.Image:
+    """Loads an image that is shown at most `width` x `height` large.
+
+    JPEG files are decoded with Pillow at the smallest scale still
+    covering that size, other formats are loaded by wx at full size.
+    """
+    try:
+        im = open_reduced(filename, (width, height))
+    except OSError:
+        im = None
+    if im is None:
+        return wx.Image(filename, wx.BITMAP_TYPE_ANY)
+    return wx.Image(im.width, im.height, im.tobytes())
+
+
+def _in_img_folder(filename: str) -> bool:
+    return os.path.dirname(os.path.abspath(filename)) == os.path.abspath(img_folder)
+
+
+def getScaledImage(
+    filename: str, height: int = 180, border: int = 5, width: int = None
+) -> wx.Image:
+    """Loads the specified image and scales it to the according size.
+
+    Preserves the aspect ratio by padding with a color. Does not create
+    any bitmap, so it can also be used outside of the main thread.
+    For the photos in the image folder, the smallest thumbnail that is
+    large enough is loaded instead, see :mod:`story_time.thumbnails`.
+    JPEG files are decoded at a reduced scale if possible.
 
     Args:
         filename: The path to the file.
@@ -700,19 +890,40 @@ def getImageToShow(
         width: The width of the returned image, same as height if not specified.
 
     Returns:
-        The bitmap with the specified size
+        The image with the specified size
     """
     bor_2 = 2 * border
-    border_col = green
-
-    # Load from file and convert to image
-    wxBmp = wx.Bitmap(filename)
-    image = wxBmp.ConvertToImage()
 
     # Handle sizes
     if width is None:
         width = height
 
+    # Load from file
+    if _in_img_folder(filename):
+        thumb = get_thumbnail(filename, max(height, width) - bor_2, thumbs_folder)
+        if thumb is not None:
+            filename = thumb
+    image = load_image(filename, max(width - bor_2, 1), max(height - bor_2, 1))
+    return fit_image(image, height, border, width)
+
+
+def fit_image(
+    image: wx.Image,
+    height: int,
+    border: int = 5,
+    width: int = None,
+    quality: int = wx.IMAGE_QUALITY_HIGH,
+) -> wx.Image:
+    """Scales the image to fit the size and pads it with a border.
+
+    See :func:`getScaledImage` for the arguments, the `quality` is
+    passed to `wx.Image.Rescale`.
+    """
+    bor_2 = 2 * border
+    border_col = green
+    if width is None:
+        width = height
+
     # Reserve space for border
     height -= bor_2
     width -= bor_2
@@ -723,9 +934,7 @@ def getImageToShow(
     fac = height / img_h if too_high else width / img_w
 
     # Rescale image
-    image.Rescale(
-        int(round(fac * img_w)), int(round(fac * img_h)), wx.IMAGE_QUALITY_HIGH
-    )
+    image.Rescale(int(round(fac * img_w)), int(round(fac * img_h)), quality)
     new_img_w, new_img_h = image.GetSize()
 
     # Pad image
@@ -739,10 +948,136 @@ def getImageToShow(
         border_col[1],
         border_col[2],
     )
+    return image
 
-    # Convert to bitmap and return
-    result = wx.Bitmap(image)
-    return result
+
+class ImageLoader:
+    """Loads the images shown in bitmap controls in a thread pool.
+
+    When an image is requested for a control, a bitmap in
+    :data:`bitmap_cache` is shown at once. Otherwise the smallest
+    thumbnail is scaled up as a low resolution placeholder, or the
+    default image is shown if there is no thumbnail, and the image is
+    decoded and scaled in the background. The final bitmap is shown via
+    `wx.CallAfter`. Only the last request of each control is shown,
+    older ones are dropped, if possible before they are decoded. If
+    loading fails, the error is printed and the placeholder is kept.
+
+    Args:
+        max_workers: The number of threads decoding images.
+    """
+
+    #: Shown while loading if there is no thumbnail.
+    default_img = os.path.join(icon_path, "default_img.png")
+
+    def __init__(self, max_workers: int = 2) -> None:
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix="image")
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def _next_generation(self, ctrl: wx.StaticBitmap) -> int:
+        with self._lock:
+            gen = self._generations.get(id(ctrl), 0) + 1
+            self._generations[id(ctrl)] = gen
+            return gen
+
+    def _is_current(self, ctrl: wx.StaticBitmap, gen: int) -> bool:
+        with self._lock:
+            return self._generations.get(id(ctrl)) == gen
+
+    def cancel(self, ctrl: wx.StaticBitmap) -> None:
+        """Drops the pending request of the control, e.g. if set otherwise."""
+        self._next_generation(ctrl)
+
+    def placeholder(
+        self, filename: str, height: int = 180, border: int = 5, width: int = None
+    ) -> Optional[wx.Bitmap]:
+        """Returns the image scaled up from its smallest thumbnail.
+
+        None is returned if there is no thumbnail.
+        """
+        if not _in_img_folder(filename):
+            return None
+        key = thumb_key(filename)
+        if key is None:
+            return None
+        thumb = thumb_path(thumbs_folder, key, min(THUMB_SIZES))
+        if not os.path.isfile(thumb):
+            return None
+        image = wx.Image(thumb, wx.BITMAP_TYPE_ANY)
+        if not image.IsOk():
+            return None
+        return wx.Bitmap(
+            fit_image(image, height, border, width, wx.IMAGE_QUALITY_NORMAL)
+        )
+
+    def show(
+        self,
+        ctrl: wx.StaticBitmap,
+        filename: str,
+        height: int = 180,
+        border: int = 5,
+        width: int = None,
+    ) -> None:
+        """Shows the image in the control, see :func:`getScaledImage`.
+
+        Must be called from the main thread.
+        """
+        gen = self._next_generation(ctrl)
+        key = bitmap_key(filename, height, border, width)
+        bmp = None if key is None else bitmap_cache.get(key)
+        if bmp is not None:
+            self._set_bitmap(ctrl, bmp)
+            return
+        low_res = self.placeholder(filename, height, border, width)
+        if low_res is None:
+            # Do not keep showing the previous image while loading
+            low_res = getImageToShow(self.default_img, height, border, width)
+        self._set_bitmap(ctrl, low_res)
+        args = (filename, height, border, width)
+        future = self._pool.submit(self._load, ctrl, gen, key, *args)
+        future.add_done_callback(_print_exception)
+
+    def _load(
+        self,
+        ctrl: wx.StaticBitmap,
+        gen: int,
+        key: Optional[Hashable],
+        *args: Any,
+    ) -> None:
+        """Runs in a worker thread."""
+        if not self._is_current(ctrl, gen):
+            return
+        image = getScaledImage(*args)
+        if self._is_current(ctrl, gen):
+            wx.CallAfter(self._deliver, ctrl, gen, key, image)
+
+    def _deliver(
+        self,
+        ctrl: wx.StaticBitmap,
+        gen: int,
+        key: Optional[Hashable],
+        image: wx.Image,
+    ) -> None:
+        bmp = wx.Bitmap(image)
+        if key is not None:
+            bitmap_cache.put(key, bmp)
+        if not ctrl:
+            # The control was destroyed in the meantime
+            with self._lock:
+                self._generations.pop(id(ctrl), None)
+        elif self._is_current(ctrl, gen):
+            self._set_bitmap(ctrl, bmp)
+
+    @staticmethod
+    def _set_bitmap(ctrl: wx.StaticBitmap, bmp: wx.Bitmap) -> None:
+        old = ctrl.GetBitmap()
+        ctrl.SetBitmap(bmp)
+        if not old.IsOk() or old.GetSize() != bmp.GetSize():
+            ctrl.GetParent().Layout()
+
+
+image_loader = ImageLoader()  #: Loads the images of all windows.
 
 
 class ShowCapture(wx.Panel):
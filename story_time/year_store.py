@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Process-wide store of parsed XML year trees.
+
+Parsing a complete year file on every click of the Previous / Next
+buttons is slow for large diaries, so the parsed trees are kept in
+memory. Before a tree is handed out again, it is validated against the
+modification time and the size of the file. The least recently used
+years are evicted if the estimated memory usage exceeds the budget.
+"""
+import os
+import threading
+import xml.etree.cElementTree as elTree
+from collections import OrderedDict
+from typing import Optional, Tuple, Callable, Sequence
+
+FileSignature = Tuple[int, int]
+StoreSignature = Tuple[Optional[FileSignature], ...]
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  #: Default memory budget in bytes.
+TREE_SIZE_FACTOR = 8  #: Estimated bytes in memory per byte of XML on disk.
+
+
+def file_signature(path: str) -> Optional[FileSignature]:
+    """Returns the modification time and the size of a file.
+
+    If the file does not exist, None is returned.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def store_signature(files: Sequence[str]) -> Optional[StoreSignature]:
+    """Returns the signatures of all files, None if none of them exists."""
+    sig = tuple(file_signature(f) for f in files)
+    return None if all(s is None for s in sig) else sig
+
+
+class _YearRecord:
+    """A cached tree together with the signature of its files."""
+
+    def __init__(self, tree: elTree.ElementTree, signature: StoreSignature) -> None:
+        self.tree = tree
+        self.signature = signature
+        n = sum(s[1] for s in signature if s is not None)
+        self.n_bytes = n * TREE_SIZE_FACTOR
+
+
+class YearStore:
+    """LRU cache of parsed XML files validated by file signature.
+
+    The trees returned are shared, they must only be modified if
+    the file is written and :meth:`put` is called afterwards.
+    """
+
+    hits: int = 0
+    misses: int = 0
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._records: "OrderedDict[str, _YearRecord]" = OrderedDict()
+        self._n_bytes = 0
+        self._lock = threading.RLock()
+
+    @property
+    def n_bytes(self) -> int:
+        """The estimated memory used by the cached trees."""
+        return self._n_bytes
+
+    def __contains__(self, xml_file: str) -> bool:
+        return os.path.abspath(xml_file) in self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def get(
+        self,
+        xml_file: str,
+        load: Callable[[], elTree.ElementTree] = None,
+        extra_files: Sequence[str] = (),
+    ) -> Optional[elTree.ElementTree]:
+        """Returns the tree of the file, parses it if necessary.
+
+        Args:
+            xml_file: Path to the XML file.
+            load: Function loading the tree, parses `xml_file` if None.
+            extra_files: Other files the tree depends on, e.g. a journal.
+
+        Returns:
+            The element tree or None if none of the files exists.
+        """
+        key = os.path.abspath(xml_file)
+        files = (key, *extra_files)
+        with self._lock:
+            sig = store_signature(files)
+            rec = self._records.get(key)
+            if sig is None:
+                if rec is not None:
+                    self._remove(key)
+                return None
+            if rec is not None and rec.signature == sig:
+                self._records.move_to_end(key)
+                self.hits += 1
+                return rec.tree
+
+            # Not cached or outdated, parse file
+            self.misses += 1
+            tree = elTree.ElementTree(file=key) if load is None else load()
+            sig = store_signature(files)
+            if sig is not None:
+                self._add(key, _YearRecord(tree, sig))
+            return tree
+
+    def put(
+        self, xml_file: str, tree: elTree.ElementTree, extra_files: Sequence[str] = ()
+    ) -> None:
+        """Stores a tree that was just written to `xml_file` or `extra_files`."""
+        key = os.path.abspath(xml_file)
+        with self._lock:
+            sig = store_signature((key, *extra_files))
+            if sig is None:
+                self._remove(key)
+                return
+            self._add(key, _YearRecord(tree, sig))
+
+    def invalidate(self, xml_file: str = None) -> None:
+        """Removes the tree of `xml_file` or all trees if it is None."""
+        with self._lock:
+            if xml_file is None:
+                self._records.clear()
+                self._n_bytes = 0
+            else:
+                self._remove(os.path.abspath(xml_file))
+
+    def set_max_bytes(self, max_bytes: int) -> None:
+        """Changes the memory budget, evicts trees if necessary."""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _add(self, key: str, rec: _YearRecord) -> None:
+        self._remove(key)
+        self._records[key] = rec
+        self._n_bytes += rec.n_bytes
+        self._evict()
+
+    def _remove(self, key: str) -> None:
+        rec = self._records.pop(key, None)
+        if rec is not None:
+            self._n_bytes -= rec.n_bytes
+
+    def _evict(self) -> None:
+        # Keep at least the most recently used tree, even if it is too large
+        while self._n_bytes > self.max_bytes and len(self._records) > 1:
+            _, rec = self._records.popitem(last=False)
+            self._n_bytes -= rec.n_bytes
+
+
+year_store = YearStore()  #: The store used by the XML utilities.
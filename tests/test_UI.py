@@ -5,6 +5,7 @@ import wx
 
 from story_time import util
 from story_time.main import main
+from story_time.search import search_index
 from story_time.user_interface import StoryTimeAppUI
 from tests.test_util import (
     SAMPLE_IMG_DIR,
@@ -78,6 +79,11 @@ class TestMain2(TestCase):
             ex.prev_entry(None)
             ex.prev_entry(None)
 
+            # Search and show the found entry in the preview
+            ex.search_panel.search_ctrl.SetValue("sample tex")
+            ex.show_entry(search_index.search("sample")[0])
+            assert "Sample Text" in ex.fix_text_box.LabelText
+
             ex.OnX(None, self.discard_text)
 
         with change_info_txt(DATA_DIR):
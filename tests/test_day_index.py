@@ -0,0 +1,134 @@
+import os
+import threading
+from unittest import TestCase
+
+import story_time.util
+from story_time.XML_write import EntryRecord
+from story_time.day_index import DayIndex, DAYS_FILE
+from story_time.search import INDEX_FOLDER
+from story_time.storage import (
+    SQLiteBackend,
+    close_backend,
+    get_backend,
+    get_db_file,
+    save_listeners,
+    set_backend,
+)
+from story_time.timestamps import iso_to_stamp
+from tests.test_util import DATA_DIR, create_test_dirs
+
+RECORDS = [
+    EntryRecord("2018-03-14T09:00:00", "text", "Pi day 2018"),
+    EntryRecord("2019-03-14T20:00:00", "text", "Pi day 2019, evening"),
+    EntryRecord("2019-03-14T08:00:00", "text", "Pi day 2019, morning"),
+    EntryRecord("2019-03-15T08:00:00", "text", "The day after"),
+    EntryRecord("2020-02-29T12:00:00", "text", "Leap day"),
+]
+
+
+class TestDayIndex(TestCase):
+    def test_on_this_day(self):
+        with create_test_dirs():
+            story_time.util.update_folder(DATA_DIR)
+            backend = get_backend()
+            backend.save_many(RECORDS)
+            index = DayIndex()
+            assert index.entries_on_day(3, 14) == [RECORDS[1], RECORDS[2], RECORDS[0]]
+            assert index.entries_on_day(2, 29) == RECORDS[4:]
+            assert index.entries_on_day(1, 1) == []
+
+            # Only earlier years, not the earlier entries of the same day
+            stamp = iso_to_stamp("2019-03-14T20:00:00")
+            assert index.on_this_day(stamp) == RECORDS[:1]
+
+            # Saved entries are found without rebuilding
+            counts = index.day_counts(2019)
+            new = EntryRecord("2019-03-14T10:00:00", "text", "Pi day 2019, later")
+            backend.save(new)
+            index.on_save(backend, 2019, [new])
+            assert index.day_counts(2019) is counts
+            stamp = iso_to_stamp("2020-03-14T00:00:00")
+            assert index.on_this_day(stamp) == [RECORDS[1], new, RECORDS[2], RECORDS[0]]
+            backend.close()
+
+    def test_day_counts(self):
+        with create_test_dirs():
+            story_time.util.update_folder(DATA_DIR)
+            backend = get_backend()
+            backend.save_many(RECORDS)
+            index = DayIndex()
+            counts = index.day_counts(2019)
+            assert counts.count == 3 and sum(counts.counts) == 3
+            assert counts.counts[31 + 28 + 13] == 2
+            assert index.days_with_entries(2019, 3) == [14, 15]
+            assert index.days_with_entries(2019, 4) == []
+            assert index.days_with_entries(2020, 2) == [29]
+            assert index.days_with_entries(2017, 1) == []
+
+            # Saving keeps the counts up to date without rebuilding
+            eve = EntryRecord("2019-12-31T23:00:00", "text", "New year's eve")
+            backend.save(eve)
+            index.on_save(backend, 2019, [eve])
+            assert index.day_counts(2019) is counts
+            assert index.days_with_entries(2019, 12) == [31]
+
+            # The counts are stored and used by a new index
+            index.flush()
+            assert os.path.isfile(os.path.join(DATA_DIR, INDEX_FOLDER, DAYS_FILE))
+            other = DayIndex()
+            assert other.days_with_entries(2019, 12) == [31]
+            assert other._counts[2019].counts == counts.counts
+            assert other.entries_on_day(12, 31) == [eve]
+            backend.close()
+
+    def test_save_while_building(self):
+        with create_test_dirs():
+            story_time.util.update_folder(DATA_DIR)
+            backend = get_backend()
+            backend.save_many(RECORDS)
+            index = DayIndex()
+            save_listeners.append(index.on_save)
+            new = EntryRecord("2019-03-14T10:00:00", "text", "Pi day 2019, later")
+            saved = []
+            range_entries = backend.range
+
+            def range_and_save(start=None, end=None):
+                # Save an entry from another thread while the groups are built
+                for r in range_entries(start, end):
+                    yield r
+                    if not saved:
+                        t = threading.Thread(target=backend.save, args=(new,))
+                        t.start()
+                        t.join(5)
+                        saved.append(not t.is_alive())
+
+            backend.range = range_and_save
+            try:
+                assert index.entries_on_day(3, 14)[:3] == [RECORDS[1], new, RECORDS[2]]
+                assert saved == [True]
+            finally:
+                save_listeners.remove(index.on_save)
+                del backend.range
+                backend.close()
+
+    def test_sqlite_day_index(self):
+        with create_test_dirs():
+            story_time.util.update_folder(DATA_DIR)
+            backend = SQLiteBackend(get_db_file())
+            set_backend(backend)
+            index = DayIndex()
+            save_listeners.append(index.on_save)
+            try:
+                backend.save_many(RECORDS[:3])
+                assert index.entries_on_day(3, 14) == RECORDS[1:3] + RECORDS[:1]
+
+                # Entries saved to the database reach the loaded groups
+                counts = index.day_counts(2019)
+                backend.save(RECORDS[3])
+                assert index.day_counts(2019) is counts
+                assert index.days_with_entries(2019, 3) == [14, 15]
+                assert index.entries_on_day(3, 15) == RECORDS[3:4]
+            finally:
+                save_listeners.remove(index.on_save)
+                close_backend()
+                os.remove(get_db_file())
@@ -0,0 +1,85 @@
+import xml.etree.cElementTree as elTree
+from unittest import TestCase
+
+from story_time.XML_write import init_XML, insert_text_entry
+from story_time.entry_index import EntryIndex, get_entry_index, index_inserted_entry
+from story_time.timestamps import (
+    iso_to_stamp,
+    isos_to_stamps,
+    stamp_to_iso,
+    date_to_stamp,
+)
+
+
+def make_doc(times):
+    doc = elTree.Element("doc")
+    for t in times:
+        elTree.SubElement(doc, "entry", date_time=t, type="text")
+    return doc
+
+
+class TestEntryIndex(TestCase):
+    def test_stamps(self):
+        assert iso_to_stamp("1970-01-01T00:00:00") == 0
+        assert iso_to_stamp("1970-01-02T00:00:10") == 86410
+        for iso in [
+            "2020-12-02T05:31:00",
+            "1900-02-28T23:59:59",
+            "0999-01-01T00:00:00",
+        ]:
+            assert stamp_to_iso(iso_to_stamp(iso)) == iso
+        assert date_to_stamp(2020, 3, 1) - date_to_stamp(2020, 2, 28) == 2 * 86400
+        assert stamp_to_iso(date_to_stamp(10000, 2, 1)) == "10000-02-01T00:00:00"
+
+        # Vectorized parsing gives the same results
+        isos = [stamp_to_iso(k * 7777777) for k in range(-300, 300)]
+        assert isos_to_stamps(isos) == [iso_to_stamp(s) for s in isos]
+        isos.append("10000-02-01T00:00:00")
+        assert isos_to_stamps(isos)[-1] == date_to_stamp(10000, 2, 1)
+
+        # Malformed strings are rejected as by the scalar parser
+        for bad in ["", "2020-02-01"]:
+            with self.assertRaises(ValueError):
+                iso_to_stamp(bad)
+            with self.assertRaises(ValueError):
+                isos_to_stamps(isos[:70] + [bad])
+
+    def test_find_closest(self):
+        doc = make_doc(
+            [
+                "2020-03-01T00:00:00",
+                "2020-01-01T00:00:00",
+                "2020-02-01T00:00:00",
+                "2020-02-01T00:00:00",
+            ]
+        )
+        index = EntryIndex(doc)
+        assert list(index.positions) == [1, 2, 3, 0]
+        feb = iso_to_stamp("2020-02-01T00:00:00")
+        assert index.find_closest(feb, newer=False) == 0
+        assert index.find_closest(feb, newer=True) == 3
+        assert index.positions[index.find_closest(feb + 1, newer=False)] == 2
+        assert index.positions[index.find_closest(feb - 1, newer=True)] == 2
+        assert index.find_closest(0, newer=False) is None
+        assert index.find_closest(feb * 2, newer=True) is None
+
+    def test_maintained_on_insert(self):
+        tree = init_XML("Test", 2020)
+        doc = tree.getroot().find("doc")
+        index = get_entry_index(doc)
+        assert len(index) == 0
+        for k in [3, 1, 2]:
+            insert_text_entry(doc, f"2020-12-02T{k:02d}:31:00", f"Test_{k}")
+        assert get_entry_index(doc) is index
+        assert list(index.positions) == [0, 1, 2]
+        assert [ent.text for ent in doc] == ["Test_1", "Test_2", "Test_3"]
+
+        # Insertion in the middle shifts the following positions
+        ent = elTree.Element("entry", date_time="2020-12-02T04:00:00")
+        doc.insert(0, ent)
+        index_inserted_entry(doc, ent, 0)
+        assert list(index.positions) == [1, 2, 3, 0]
+
+        # Changes bypassing the index lead to a rebuild
+        doc.append(elTree.Element("entry", date_time="2020-12-03T00:00:00"))
+        assert len(get_entry_index(doc)) == 5
@@ -0,0 +1,57 @@
+import os
+from unittest import TestCase
+
+import story_time.util
+from story_time.XML_write import save_entry, find_closest_entry, find_next_xml_file
+from story_time.manifest import YearInfo, list_years, year_manifest
+from story_time.timestamps import date_to_stamp
+from tests.test_util import create_test_dirs, xml_dir
+
+
+class TestManifest(TestCase):
+    def test_year_info(self):
+        info = YearInfo(2, 10, 20)
+        assert info.may_contain(11) and not info.may_contain(10)
+        assert info.may_contain(19, newer=True) and not info.may_contain(20, True)
+        assert not YearInfo(0).may_contain(100)
+        assert info.overlaps(20, 30) and info.overlaps(end=11) and info.overlaps()
+        assert not info.overlaps(21) and not info.overlaps(0, 10)
+
+    def test_years_and_infos(self):
+        with create_test_dirs():
+            story_time.util.xml_folder = xml_dir
+            assert year_manifest.years() == []
+            for y in [2018, 2020]:
+                save_entry("Test", f"{y:04d}-12-02T05:31:00")
+                save_entry("Test", f"{y:04d}-12-02T06:31:00")
+            open(os.path.join(xml_dir, "notes.txt"), "w").close()
+            assert list_years(xml_dir) == [2018, 2020]
+            assert year_manifest.years() == [2018, 2020]
+
+            info = year_manifest.get_info(2020)
+            assert info.n_entries == 2
+            assert info.min_stamp == date_to_stamp(2020, 12, 2, 5, 31)
+            assert info.max_stamp == date_to_stamp(2020, 12, 2, 6, 31)
+
+            # Changed files invalidate the info, it is read from the head again
+            with open(os.path.join(xml_dir, "2020.journal"), "a") as f:
+                f.write("\n")
+            assert year_manifest.get_info(2020) == info
+
+            assert find_next_xml_file(2020)[0] == 2018
+            assert find_next_xml_file(2019, newer=True)[0] == 2020
+            assert find_next_xml_file(2018) is None
+
+    def test_candidate_years(self):
+        with create_test_dirs():
+            story_time.util.xml_folder = xml_dir
+            for y in [2016, 2018, 2020]:
+                save_entry("Test", f"{y:04d}-12-02T05:31:00")
+            stamp = date_to_stamp(2018, 1, 1)
+            assert list(year_manifest.candidate_years(2018, stamp)) == [2016]
+            assert list(year_manifest.candidate_years(2018, stamp, True)) == [
+                2018,
+                2020,
+            ]
+            ch = find_closest_entry(stamp, False)
+            assert ch.get("date_time").startswith("2016")
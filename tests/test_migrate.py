@@ -0,0 +1,57 @@
+import os
+from unittest import TestCase
+
+import story_time.util
+from story_time.XML_write import EntryRecord, save_record
+from story_time.migrate import migrate, migrate_year, main, PARTIAL_EXT
+from story_time.storage import SQLiteBackend, get_db_file
+from tests.test_storage import RECORDS
+from tests.test_util import DATA_DIR, create_test_dirs
+
+
+class TestMigrate(TestCase):
+    def test_migrate(self):
+        story_time.util.update_folder(DATA_DIR)
+        db_file = get_db_file(DATA_DIR)
+        with create_test_dirs():
+            for r in RECORDS:
+                save_record(r)
+            messages = []
+            later = EntryRecord("2022-06-01T12:00:00", "text", "Saved later")
+            during = EntryRecord("2019-08-01T12:00:00", "text", "Saved during")
+
+            def log(msg: str) -> None:
+                # The app saves an entry of an already migrated year
+                if msg.startswith("2019:") and during not in saved:
+                    save_record(during)
+                    saved.append(during)
+                messages.append(msg)
+
+            saved = []
+            try:
+                # Interrupted run: two years are already in the partial database
+                partial = SQLiteBackend(db_file + PARTIAL_EXT)
+                migrate_year(partial, 2020)
+                migrate_year(partial, 2022)
+                partial.close()
+                # Saved after the interruption
+                save_record(later)
+
+                assert migrate(DATA_DIR, log) == db_file
+                assert not os.path.isfile(db_file + PARTIAL_EXT)
+                assert "2020: already migrated, skipping." in messages
+                assert "2022: already migrated, skipping." not in messages
+                assert saved == [during]
+                backend = SQLiteBackend(db_file)
+                assert list(backend) == [RECORDS[0], during] + RECORDS[1:] + [later]
+                backend.close()
+
+                # Migrating again does nothing
+                assert migrate(DATA_DIR, messages.append) == db_file
+                assert main([DATA_DIR]) == 0
+                with self.assertRaises(SystemExit):
+                    main([os.path.join(DATA_DIR, "XML", "2020.xml")])
+            finally:
+                for f in (db_file, db_file + PARTIAL_EXT):
+                    if os.path.isfile(f):
+                        os.remove(f)
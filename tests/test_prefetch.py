@@ -0,0 +1,52 @@
+import os
+import shutil
+import time
+from unittest import TestCase
+
+import story_time.util
+from story_time.XML_write import EntryRecord
+from story_time.prefetch import PreviewPrefetcher
+from story_time.storage import XMLBackend, EntryCursor
+from story_time.timestamps import iso_to_stamp
+from tests.test_util import (
+    DATA_DIR,
+    SAMPLE_IMG_DIR,
+    create_test_dirs,
+    img_dir,
+    xml_dir,
+)
+
+RECORDS = [
+    EntryRecord(f"{2015 + i}-03-01T10:00:00", "photo", f"Entry {i}", f"{i}.jpg")
+    for i in range(7)
+]
+
+
+class TestPrefetch(TestCase):
+    def test_neighbours(self):
+        with create_test_dirs():
+            story_time.util.xml_folder = xml_dir
+            story_time.util.img_folder = img_dir
+            story_time.util.thumbs_folder = os.path.join(DATA_DIR, "Thumbs")
+            for r in RECORDS:
+                src = os.path.join(SAMPLE_IMG_DIR, "Entwurf.jpg")
+                shutil.copy(src, os.path.join(img_dir, r.photo))
+            backend = XMLBackend()
+            backend.save_many(RECORDS)
+            cursor = EntryCursor(backend)
+            assert cursor.seek(iso_to_stamp("2018-06-01T00:00:00")) == RECORDS[3]
+
+            prefetcher = PreviewPrefetcher(n=2)
+            prefetcher.request(cursor, 100)
+            t_end = time.time() + 5
+            while not prefetcher._images and time.time() < t_end:
+                time.sleep(0.01)
+            prefetcher.stop()
+            expected = [r.photo for r in RECORDS[1:3] + RECORDS[4:6]]
+            assert sorted(prefetcher._images) == [
+                (os.path.join(img_dir, name), 100) for name in expected
+            ]
+
+            # The cursor of the preview is not moved
+            assert cursor.current == RECORDS[3]
+            backend.close()
@@ -0,0 +1,154 @@
+import json
+import os
+import threading
+from unittest import TestCase
+
+import story_time.util
+from story_time.XML_write import EntryRecord, save_record
+from story_time.search import (
+    SearchIndex,
+    YearShard,
+    parse_query,
+    tokenize,
+    trigrams,
+    INDEX_FOLDER,
+    PREFIX_SIMILARITY,
+)
+from story_time.storage import (
+    SQLiteBackend,
+    close_backend,
+    get_backend,
+    get_db_file,
+    save_listeners,
+    set_backend,
+)
+from story_time.timestamps import date_to_stamp
+from tests.test_util import DATA_DIR, create_test_dirs
+
+RECORDS = [
+    EntryRecord("2019-05-01T10:00:00", "text", "Das isch es Johr 2019."),
+    EntryRecord("2020-12-02T05:31:00", "text", "Went hiking with Anna."),
+    EntryRecord("2020-12-02T05:31:00", "photo", "Anna on the summit", "img.jpg"),
+    EntryRecord("2020-12-24T18:00:00", "text", "Christmas, the summit was cold."),
+]
+
+
+class TestSearch(TestCase):
+    def test_tokenize(self):
+        words = ["das", "isch", "s", "johr", "zürich"]
+        assert tokenize("Das isch's Johr, Zürich!") == words
+        q = parse_query('anna "The  Summit" x')
+        assert q.terms == ["anna", "x"]
+        assert q.phrases == [["the", "summit"]]
+        assert trigrams("ab") == {"  a", " ab", "ab "}
+
+    def test_shard(self):
+        shard = YearShard()
+        for r in RECORDS[1:]:
+            shard.add(r)
+        texts = [shard.records[d].text for d in shard.matches(parse_query("summit"))]
+        assert texts == ["Christmas, the summit was cold.", "Anna on the summit"]
+        assert list(shard.matches(parse_query('"summit the"'))) == []
+        assert list(shard.matches(parse_query('"the summit" anna'))) == [1]
+        assert list(shard.matches(parse_query("nowhere"))) == []
+
+        loaded = YearShard.from_json(json.loads(json.dumps(shard.to_json())))
+        assert loaded.records == shard.records
+        assert loaded.postings == shard.postings
+
+    def test_search_index(self):
+        with create_test_dirs():
+            story_time.util.update_folder(DATA_DIR)
+            index = SearchIndex()
+            for r in RECORDS[:2]:
+                save_record(r)
+            assert index.search("anna") == [RECORDS[1]]
+            assert os.path.isfile(os.path.join(DATA_DIR, INDEX_FOLDER, "2020.json"))
+
+            # Saved entries are added incrementally
+            backend = get_backend()
+            shard = index.get_shard(2020)
+            assert backend.save_many(RECORDS[2:]) == [None, None]
+            index.on_save(backend, 2020, RECORDS[2:])
+            assert index.get_shard(2020) is shard
+            assert index.search("summit") == [RECORDS[3], RECORDS[2]]
+            assert index.search("SUMMIT", limit=1) == [RECORDS[3]]
+            assert index.search('"on the summit"') == [RECORDS[2]]
+            end = date_to_stamp(2020, 12, 24)
+            assert index.search("summit", end=end) == [RECORDS[2]]
+            assert index.search("johr", start=end) == []
+            assert index.search("johr") == [RECORDS[0]]
+            assert index.search("") == []
+            index.flush()
+
+            # A new index reads the shards from disk
+            index_2 = SearchIndex()
+            assert index_2.search("summit") == [RECORDS[3], RECORDS[2]]
+
+            # Shards not matching the year are rebuilt
+            save_record(EntryRecord("2020-12-31T23:00:00", "text", "Summit again"))
+            assert len(index_2.search("summit")) == 3
+
+            # Fuzzy search tolerates typos and completes prefixes
+            hits = index_2.fuzzy_search("sumit")
+            assert hits[0].record.text == "Summit again"
+            assert {h.record for h in hits[1:]} == {RECORDS[2], RECORDS[3]}
+            hits = index_2.fuzzy_search("anna summ", k=1)
+            assert hits[0].record == RECORDS[2]
+            assert hits[0].score == 1.0 + PREFIX_SIMILARITY
+            hits = index_2.fuzzy_search("anna summ", prefix=False)
+            assert 1.0 < hits[0].score < 1.0 + PREFIX_SIMILARITY
+            assert index_2.fuzzy_search("Jor")[0].record == RECORDS[0]
+            assert index_2.fuzzy_search("qqqq") == []
+
+    def test_save_while_building(self):
+        with create_test_dirs():
+            story_time.util.update_folder(DATA_DIR)
+            backend = get_backend()
+            backend.save_many(RECORDS)
+            index = SearchIndex()
+            save_listeners.append(index.on_save)
+            new = EntryRecord("2020-12-31T23:00:00", "text", "Summit again")
+            saved = []
+            range_entries = backend.range
+
+            def range_and_save(start=None, end=None):
+                # Save an entry from another thread while the shard is built
+                for r in range_entries(start, end):
+                    yield r
+                    if not saved:
+                        t = threading.Thread(target=backend.save, args=(new,))
+                        t.start()
+                        t.join(5)
+                        saved.append(not t.is_alive())
+
+            backend.range = range_and_save
+            try:
+                assert len(index.search("summit")) == 3
+                assert saved == [True]
+            finally:
+                save_listeners.remove(index.on_save)
+                del backend.range
+                backend.close()
+
+    def test_sqlite_index(self):
+        with create_test_dirs():
+            story_time.util.update_folder(DATA_DIR)
+            backend = SQLiteBackend(get_db_file())
+            set_backend(backend)
+            index = SearchIndex()
+            save_listeners.append(index.on_save)
+            try:
+                backend.save_many(RECORDS[:2])
+                assert index.search("anna") == [RECORDS[1]]
+
+                # Entries saved to the database reach the loaded shards
+                shard = index.get_shard(2020)
+                backend.save(RECORDS[2])
+                assert index.get_shard(2020) is shard
+                assert index.search("summit") == [RECORDS[2]]
+                assert index.fuzzy_search("sumit")[0].record == RECORDS[2]
+            finally:
+                save_listeners.remove(index.on_save)
+                close_backend()
+                os.remove(get_db_file())
@@ -0,0 +1,174 @@
+import os
+from unittest import TestCase
+
+import story_time.util
+from story_time.XML_write import EntryRecord
+from story_time.storage import (
+    XMLBackend,
+    SQLiteBackend,
+    StorageBackend,
+    EntryCursor,
+    EntryTimeline,
+    get_backend,
+    set_backend,
+    close_backend,
+    get_db_file,
+    save_listeners,
+)
+from story_time.timestamps import iso_to_stamp
+from tests.test_util import DATA_DIR, create_test_dirs, xml_dir
+
+RECORDS = [
+    EntryRecord("2019-05-01T10:00:00", "text", "Old"),
+    EntryRecord("2020-12-02T05:31:00", "text", "First"),
+    EntryRecord("2020-12-02T05:31:00", "photo", "Same time", "img.jpg"),
+    EntryRecord("2020-12-24T18:00:00", "text", "Christmas"),
+    EntryRecord("2022-01-01T00:00:00", "text", "New"),
+]
+
+
+class TestStorage(TestCase):
+    def check_backend(self, backend: StorageBackend):
+        saved = []
+
+        def on_save(b, year, records):
+            assert b is backend
+            saved.append((year, records))
+
+        save_listeners.append(on_save)
+        try:
+            for r in RECORDS:
+                backend.save(r)
+            with self.assertRaises(ValueError):
+                backend.save(EntryRecord("2020-12-02T05:31:00", "blah", "Invalid"))
+        finally:
+            save_listeners.remove(on_save)
+        assert saved == [(int(r.date_time[:4]), [r]) for r in RECORDS]
+        assert backend.count() == len(RECORDS)
+        assert list(backend) == RECORDS
+
+        # Summaries of the years
+        assert backend.years()[-1] == 2022
+        info = backend.year_info(2020)
+        expected = StorageBackend.year_info(backend, 2020)
+        assert info.n_entries == 3
+        assert (info.n_entries, info.checksum) == (
+            expected.n_entries,
+            expected.checksum,
+        )
+        assert backend.year_info(2018) is None
+
+        # Range queries
+        start = iso_to_stamp("2020-01-01T00:00:00")
+        end = iso_to_stamp("2020-12-24T18:00:00")
+        assert list(backend.range(start, end)) == RECORDS[1:3]
+        assert list(backend.range(start)) == RECORDS[1:]
+        assert list(backend.range(end=start)) == RECORDS[:1]
+
+        # Nearest entries
+        s = iso_to_stamp("2020-12-02T05:31:00")
+        assert backend.nearest(s + 1) == RECORDS[1]
+        assert backend.nearest(s - 1, newer=True) == RECORDS[1]
+        assert backend.nearest(s) == RECORDS[0]
+        assert backend.nearest(s, newer=True) == RECORDS[3]
+        assert backend.nearest(0) is None
+        assert backend.nearest(iso_to_stamp("2023-01-01T00:00:00"), True) is None
+
+        # Stepping with a cursor, also across years and equal timestamps
+        cursor = EntryCursor(backend)
+        assert cursor.seek(s + 1) == RECORDS[2]
+        assert cursor.older() == RECORDS[1]
+        assert cursor.older() == RECORDS[0]
+        assert cursor.older() is None and cursor.current is None
+        assert [cursor.newer() for _ in RECORDS] == RECORDS
+        assert cursor.newer() is None
+        assert cursor.older() == RECORDS[-1]
+        assert cursor.seek(0) is None
+        assert cursor.newer() == RECORDS[0]
+        # Exactly the chosen one of the entries with equal timestamps
+        assert cursor.seek_record(RECORDS[1]) == RECORDS[1]
+        assert cursor.older() == RECORDS[0]
+        assert cursor.seek_record(RECORDS[2]) == RECORDS[2]
+        missing = EntryRecord("2020-12-02T05:32:00", "text", "Missing")
+        assert cursor.seek_record(missing) == RECORDS[2]
+        assert cursor.seek(s - 1, newer=True) == RECORDS[1]
+
+        # Timeline, newest first
+        assert backend.year_counts() == {2019: 1, 2020: 3, 2022: 1}
+        timeline = EntryTimeline(backend, max_years=1)
+        assert len(timeline) == len(RECORDS)
+        assert [timeline[i] for i in range(len(timeline))] == RECORDS[::-1]
+        assert timeline[0] == RECORDS[-1]
+        with self.assertRaises(IndexError):
+            timeline[len(RECORDS)]
+        assert timeline.peek(0) == RECORDS[-1] and timeline.peek(1) is None
+
+        # Batch saving
+        batch = [
+            EntryRecord("2021-06-01T12:00:00", "text", "Batch"),
+            EntryRecord("2021-06-01T12:00:00", "blah", "Invalid"),
+        ]
+        results = backend.save_many(batch)
+        assert results[0] is None and results[1] is not None
+        assert backend.count() == len(RECORDS) + 1
+        new_year = iso_to_stamp("2021-01-01T00:00:00")
+        assert list(backend.range(new_year))[0] == batch[0]
+        cursor.invalidate()
+        assert cursor.current == RECORDS[1]
+        assert cursor.seek(new_year) == RECORDS[3]
+        assert cursor.newer() == batch[0]
+
+        # Entries saved after reading the counts shift the older years
+        timeline = EntryTimeline(backend, max_years=1)
+        later = EntryRecord("2020-12-31T12:00:00", "text", "Later")
+        backend.save(later)
+        assert timeline[2] == later
+        assert len(timeline) == len(RECORDS) + 2
+        assert timeline[len(RECORDS) + 1] == RECORDS[0]
+
+    def test_xml_backend(self):
+        with create_test_dirs():
+            story_time.util.xml_folder = xml_dir
+            backend = XMLBackend()
+            self.check_backend(backend)
+            backend.close()
+            assert not os.path.isfile(os.path.join(xml_dir, "2020.journal"))
+
+    def test_sqlite_backend(self):
+        with create_test_dirs():
+            db_file = os.path.join(xml_dir, "test.sqlite")
+            backend = SQLiteBackend(db_file)
+            self.check_backend(backend)
+            backend.close()
+            backend = SQLiteBackend(db_file)
+            assert backend.count() == len(RECORDS) + 2
+
+            # The summaries follow replaced ranges
+            start = iso_to_stamp("2020-01-01T00:00:00")
+            end = iso_to_stamp("2021-01-01T00:00:00")
+            backend.replace_range(start, end, RECORDS[1:2])
+            assert backend.year_info(2020) == StorageBackend.year_info(backend, 2020)
+            assert backend.year_info(2020).n_entries == 1
+            backend.replace_range(start, end, [])
+            assert backend.year_info(2020) is None
+            assert 2020 not in backend.year_counts()
+
+            # Databases without summaries get them when opened
+            with backend._conn:
+                backend._conn.execute("DROP TABLE years")
+            backend.close()
+            backend = SQLiteBackend(db_file)
+            assert backend.year_counts() == {2019: 1, 2021: 1, 2022: 1}
+            backend.close()
+
+    def test_get_backend(self):
+        with create_test_dirs():
+            story_time.util.update_folder(DATA_DIR)
+            assert isinstance(get_backend(), XMLBackend)
+            assert get_backend() is get_backend()
+            set_backend(SQLiteBackend(get_db_file()))
+            assert isinstance(get_backend(), SQLiteBackend)
+            close_backend()
+            assert isinstance(get_backend(), SQLiteBackend)
+            close_backend()
+            os.remove(get_db_file())
@@ -0,0 +1,79 @@
+import os
+import time
+from unittest import TestCase
+
+from PIL import Image
+
+from story_time.thumbnails import (
+    THUMB_SIZES,
+    create_thumbnails,
+    get_thumbnail,
+    open_reduced,
+    schedule_thumbnails,
+    thumb_key,
+    thumb_path,
+    wait_for_thumbnails,
+)
+from tests.test_util import DATA_DIR, create_test_dirs, img_dir
+
+THUMBS_DIR = os.path.join(DATA_DIR, "Thumbs")
+
+
+def write_img(name: str, size=(1200, 800)) -> str:
+    path = os.path.join(img_dir, name)
+    Image.new("RGB", size, (0, 143, 105)).save(path)
+    return path
+
+
+class TestThumbnails(TestCase):
+    def test_create_thumbnails(self):
+        with create_test_dirs():
+            img = write_img("IMG_20201202_053100.jpg")
+            paths = create_thumbnails(img, THUMBS_DIR)
+            assert len(paths) == len(THUMB_SIZES)
+            for p, s in zip(paths, sorted(THUMB_SIZES, reverse=True)):
+                with Image.open(p) as im:
+                    assert im.width == s and abs(im.height - s * 2 / 3) < 1
+            with self.assertRaises(FileNotFoundError):
+                create_thumbnails(os.path.join(img_dir, "missing.jpg"), THUMBS_DIR)
+
+    def test_get_thumbnail(self):
+        with create_test_dirs():
+            img = write_img("IMG_20201202_053100.png")
+            assert get_thumbnail(img, 2000, THUMBS_DIR) is None
+            path = get_thumbnail(img, 200, THUMBS_DIR)
+            assert path.endswith("_256.jpg") and os.path.isfile(path)
+            assert len(os.listdir(THUMBS_DIR)) == len(THUMB_SIZES)
+            assert get_thumbnail(img, 100, THUMBS_DIR).endswith("_128.jpg")
+
+            # A changed image gets new thumbnails
+            key = thumb_key(img)
+            time.sleep(0.01)
+            write_img("IMG_20201202_053100.png", (600, 900))
+            assert thumb_key(img) != key
+            with Image.open(get_thumbnail(img, 200, THUMBS_DIR)) as im:
+                assert im.height == 256 and im.width < 256
+
+            # Unreadable images are shown from the original file
+            bad = os.path.join(img_dir, "bad.jpg")
+            with open(bad, "w") as f:
+                f.write("No image")
+            assert get_thumbnail(bad, 100, THUMBS_DIR) is None
+
+    def test_open_reduced(self):
+        with create_test_dirs():
+            jpg = write_img("large.jpg", (2400, 1600))
+            assert open_reduced(jpg, (300, 200)).size == (300, 200)
+            assert open_reduced(jpg, (400, 100)).size == (600, 400)
+            assert open_reduced(jpg, (3000, 2000)).size == (2400, 1600)
+            assert open_reduced(write_img("large.png"), (300, 200)) is None
+
+    def test_schedule_thumbnails(self):
+        with create_test_dirs():
+            img = write_img("IMG_20201202_053100.jpg", (1600, 1200))
+            schedule_thumbnails(img, THUMBS_DIR)
+            wait_for_thumbnails()
+            key = thumb_key(img)
+            for s in THUMB_SIZES:
+                assert os.path.isfile(thumb_path(THUMBS_DIR, key, s))
+            assert get_thumbnail(img, 600, THUMBS_DIR).endswith("_1024.jpg")
@@ -1,5 +1,6 @@
 import os
 import shutil
+import time
 from contextlib import contextmanager
 from pathlib import Path
 from unittest import TestCase
@@ -33,6 +34,10 @@ from story_time.util import (
     CustomMessageDialog,
     ask_for_dir,
     info_file,
+    BitmapCache,
+    bitmap_cache,
+    getImageToShow,
+    image_loader,
 )
 
 DATA_DIR = os.path.join(Path(__file__).parent, "test_data")
@@ -49,6 +54,8 @@ def create_test_dirs():
     yield
     shutil.rmtree(img_dir)
     shutil.rmtree(xml_dir)
+    shutil.rmtree(os.path.join(DATA_DIR, "Index"), ignore_errors=True)
+    shutil.rmtree(os.path.join(DATA_DIR, "Thumbs"), ignore_errors=True)
 
 
 @contextmanager
@@ -94,6 +101,9 @@ class TestFileSystem(TestCase):
             os.removedirs(img_dir)
             assert os.path.isdir(xml_dir)
             os.removedirs(xml_dir)
+            thumbs_dir = os.path.join(DATA_DIR, "Thumbs")
+            assert os.path.isdir(thumbs_dir)
+            os.removedirs(thumbs_dir)
         assert not os.path.isdir(img_dir)
 
     def test_modified_time(self):
@@ -217,6 +227,18 @@ class TestUtil(TestCase):
         with self.assertRaises(ValueError):
             find_new_name(img_name, img_list, ext, max_n_imgs=3)
 
+    def test_bitmap_cache(self):
+        cache = BitmapCache(max_bytes=100)
+        assert cache.get("a") is None and cache.misses == 1
+        cache.put("a", "bmp_a", 40)
+        cache.put("b", "bmp_b", 40)
+        assert cache.get("a") == "bmp_a" and cache.hits == 1
+        cache.put("c", "bmp_c", 40)
+        assert cache.get("b") is None
+        assert len(cache) == 2 and cache.n_bytes == 80
+        cache.clear()
+        assert len(cache) == 0 and cache.n_bytes == 0
+
     pass
 
 
@@ -240,6 +262,43 @@ class TestGUIElements(TestCase):
             fol = ask_for_dir(dummy_fun, show=False)
             assert fol is None or fol == ""
 
+    def test_cached_image(self):
+        with create_app():
+            f_name = os.path.join(SAMPLE_IMG_DIR, "default_img.png")
+            hits = bitmap_cache.hits
+            bmp = getImageToShow(f_name, 50)
+            assert getImageToShow(f_name, 50) is bmp
+            assert bitmap_cache.hits == hits + 1
+            assert getImageToShow(f_name, 60) is not bmp
+
+    def test_image_loader(self):
+        with create_app() as f:
+            f_name = os.path.join(SAMPLE_IMG_DIR, "default_img.png")
+            bitmap_cache.clear()
+            ctrl = wx.StaticBitmap(f)
+            image_loader.show(ctrl, f_name, 70)
+
+            # The default image is shown at once, the image is delivered
+            # asynchronously
+            assert ctrl.GetBitmap().GetSize() == (70, 70)
+            assert len(bitmap_cache) == 1
+            t_end = time.time() + 10
+            while len(bitmap_cache) < 2 and time.time() < t_end:
+                wx.Yield()
+                time.sleep(0.01)
+            assert ctrl.GetBitmap().GetSize() == (70, 70)
+
+            # Shown at once if cached, the stale request is dropped
+            hits = bitmap_cache.hits
+            image_loader.show(ctrl, f_name, 50)
+            image_loader.show(ctrl, f_name, 70)
+            assert bitmap_cache.hits == hits + 1
+            t_end = time.time() + 0.5
+            while time.time() < t_end:
+                wx.Yield()
+                time.sleep(0.01)
+            assert ctrl.GetBitmap().GetSize() == (70, 70)
+
     def test_message_dlg(self):
         def abort(d):
             d.OnClose(None)
@@ -1,8 +1,7 @@
+import json
 import os
 import xml.etree.cElementTree as elTree
-from unittest import TestCase
-
-import wx
+from unittest import TestCase, mock
 
 import story_time
 import story_time.util
@@ -14,7 +13,23 @@ from story_time.XML_write import (
     save_entry,
     find_closest_entry_in_tree,
     find_closest_entry,
+    get_journal_file,
+    read_journal,
+    compact_journal,
+    compact_journals,
+    get_head_value,
+    get_head_summary,
+    read_head,
+    read_year_summary,
+    summarize_entries,
+    iter_year_records,
+    iter_all_records,
+    iter_entries,
+    EntryRecord,
+    save_entries,
+    is_sorted,
 )
+from story_time.timestamps import iso_to_stamp, date_to_stamp
 from tests.test_util import DATA_DIR, create_test_dirs
 
 XML_DIR = os.path.join(DATA_DIR, "XML")
@@ -37,17 +52,17 @@ class TestXML(TestCase):
         assert t == "Test"
 
     def test_text_entry(self):
-        wx_dt = wx.DateTime(2, 11, 2020, 5, 31)
+        dt = "2020-12-02T05:31:00"
         test_txt = "hoi"
         root = elTree.Element("root")
-        insert_text_entry(root, wx_dt, test_txt)
+        insert_text_entry(root, dt, test_txt)
         assert elTree.ElementTree(root).find("entry").text == test_txt
 
     def test_photo_entry(self):
-        wx_dt = wx.DateTime(2, 11, 2020, 5, 31)
+        dt = "2020-12-02T05:31:00"
         test_txt = "hoi"
         root = elTree.Element("root")
-        insert_photo_entry(root, wx_dt, "file.test", test_txt)
+        insert_photo_entry(root, dt, "file.test", test_txt)
         entry = elTree.ElementTree(root).find("entry")
         assert entry.find("text").text == test_txt
         assert entry.get("type") == "photo"
@@ -62,12 +77,12 @@ class TestXML(TestCase):
         with create_test_dirs():
             story_time.util.xml_folder = XML_DIR
             y = 2020
-            wx_dt = wx.DateTime(2, 11, y, 5, 31)
+            dt = f"{y:04d}-12-02T05:31:00"
 
-            save_entry("Test", wx_dt, "text")
-            save_entry("Test", wx_dt, "photo", "test_photo.jpg")
+            save_entry("Test", dt, "text")
+            save_entry("Test", dt, "photo", "test_photo.jpg")
             with self.assertRaises(ValueError):
-                save_entry("Test", wx_dt, "blah", "test_photo.jpg")
+                save_entry("Test", dt, "blah", "test_photo.jpg")
 
             tree, f = load_XML(y)
             assert os.path.isfile(f)
@@ -78,35 +93,269 @@ class TestXML(TestCase):
 
     def test_find_latest(self):
         el_tree = init_XML("Test", 2020)
-        wx_dt_find = wx.DateTime(2, 11, 2020, 6, 31)
+        dt_find = "2020-12-02T06:31:00"
         doc = el_tree.getroot().find("doc")
-        assert find_closest_entry_in_tree(el_tree, wx_dt_find, newer=False) is None
+        stamp = iso_to_stamp(dt_find)
+        assert find_closest_entry_in_tree(el_tree, stamp, newer=False) is None
         n = 3
         for k in range(n):
-            wx_dt = wx.DateTime(2, 11, 2020, k + 1, 31)
-            insert_text_entry(doc, wx_dt, f"Test_{k}")
-        wx_dt_found, t = find_closest_entry_in_tree(el_tree, wx_dt_find, newer=False)
-        assert wx.DateTime(2, 11, 2020, n, 31).IsEqualTo(wx_dt_found)
+            dt = f"2020-12-02T{k + 1:02d}:31:00"
+            insert_text_entry(doc, dt, f"Test_{k}")
+        found = find_closest_entry_in_tree(el_tree, stamp, newer=False)
+        assert found.get("date_time") == f"2020-12-02T{n:02d}:31:00"
 
     def test_get_last_entry(self):
         with create_test_dirs():
             story_time.util.xml_folder = XML_DIR
             n = 3
             for k in range(n):
-                wx_dt = wx.DateTime(2, 11, 2020 + k, 4, 31)
-                save_entry(f"Test{k}", wx_dt, "text")
-                wx_dt = wx.DateTime(2, 11, 2020 + k, 5, 31)
-                save_entry(f"Test{k}_photo", wx_dt, "photo", f"test_photo_{k}.jpg")
+                dt = f"{2020 + k:04d}-12-02T04:31:00"
+                save_entry(f"Test{k}", dt, "text")
+                dt = f"{2020 + k:04d}-12-02T05:31:00"
+                save_entry(f"Test{k}_photo", dt, "photo", f"test_photo_{k}.jpg")
 
-            search_dt = wx.DateTime(2, 11, 2021, 5, 11)
-            dt, ch_txt = find_closest_entry(search_dt, True)
+            search = iso_to_stamp("2021-12-02T05:11:00")
+            ch_txt = find_closest_entry(search, True)
             assert ch_txt.get("type") == "photo"
-            dt, ch_txt = find_closest_entry(search_dt, False)
+            ch_txt = find_closest_entry(search, False)
             assert ch_txt.text == "Test1"
-            dt, ch_txt = find_closest_entry(wx.DateTime(2, 11, 2021, 1, 11), False)
+            ch_txt = find_closest_entry(iso_to_stamp("2021-12-02T01:11:00"), False)
             assert ch_txt.get("type") == "photo"
-            dt, ch_txt = find_closest_entry(wx.DateTime(2, 11, 2021, 8, 11), True)
+            ch_txt = find_closest_entry(iso_to_stamp("2021-12-02T08:11:00"), True)
             assert ch_txt.get("type") == "text"
-            assert find_closest_entry(wx.DateTime(2, 11, 3000, 1, 11), True) is None
+            assert find_closest_entry(date_to_stamp(3000, 12, 2), True) is None
+
+    def test_journal(self):
+        with create_test_dirs():
+            story_time.util.xml_folder = XML_DIR
+            y = 2020
+            save_entry("First", f"{y:04d}-12-02T05:31:00")
+            xml_file = os.path.join(XML_DIR, f"{y}.xml")
+            j_file = get_journal_file(y)
+            assert os.path.isfile(xml_file) and not os.path.isfile(j_file)
+
+            # Further entries go to the journal
+            save_entry("Second\nline", f"{y:04d}-12-02T06:31:00")
+            save_entry("Photo", f"{y:04d}-12-02T07:31:00", "photo", "a/img.jpg")
+            j_id, entries = read_journal(j_file)
+            assert j_id is not None and len(entries) == 2
+            assert entries[0].text == "Second\nline"
+            assert len(elTree.parse(xml_file).getroot().find("doc")) == 1
+
+            # Readers see the merged entries, also with incomplete lines
+            with open(j_file, "a") as f:
+                f.write('{"entry": "<entry da')
+            save_entry("Third", f"{y:04d}-12-02T08:31:00")
+            assert len(read_journal(j_file)[1]) == 3
+            story_time.XML_write.year_store.invalidate()
+            tree, _ = load_XML(y)
+            assert len(tree.getroot().find("doc")) == 4
+
+            # Compaction
+            assert compact_journals() == [y]
+            assert not os.path.isfile(j_file)
+            assert not compact_journal(y)
+            tree = elTree.parse(xml_file)
+            assert len(tree.getroot().find("doc")) == 4
+            assert get_head_value(tree, "journal_id") == j_id
+
+    def test_compacted_journal_not_reapplied(self):
+        with create_test_dirs():
+            story_time.util.xml_folder = XML_DIR
+            y = 2020
+            save_entry("First", f"{y:04d}-12-02T05:31:00")
+            save_entry("Second", f"{y:04d}-12-02T06:31:00")
+            j_file = get_journal_file(y)
+            with open(j_file) as f:
+                j_content = f.read()
+            compact_journal(y)
+
+            # Simulate a crash before the journal was removed
+            with open(j_file, "w") as f:
+                f.write(j_content)
+            story_time.XML_write.year_store.invalidate()
+            tree, _ = load_XML(y)
+            assert len(tree.getroot().find("doc")) == 2
+            assert not os.path.isfile(j_file)
+            assert json.loads(j_content.split("\n")[0])["journal_id"]
+
+    def test_journal_not_removed(self):
+        with create_test_dirs():
+            story_time.util.xml_folder = XML_DIR
+            y = 2020
+            save_entry("First", f"{y:04d}-12-02T05:31:00")
+            save_entry("Second", f"{y:04d}-12-02T06:31:00")
+            j_file = get_journal_file(y)
+
+            # Simulate a journal that cannot be removed, e.g. on Windows
+            with mock.patch("os.remove", side_effect=PermissionError):
+                assert compact_journal(y)
+                assert os.path.isfile(j_file)
+                story_time.XML_write.year_store.invalidate()
+                tree, _ = load_XML(y)
+                assert len(tree.getroot().find("doc")) == 2
+
+                # Entries saved afterwards are not dropped with the journal
+                save_entry("Third", f"{y:04d}-12-02T07:31:00")
+            story_time.XML_write.year_store.invalidate()
+            tree, _ = load_XML(y)
+            doc = tree.getroot().find("doc")
+            assert [EntryRecord.from_element(e).text for e in doc] == [
+                "First",
+                "Second",
+                "Third",
+            ]
+
+    def test_head_summary(self):
+        with create_test_dirs():
+            story_time.util.xml_folder = XML_DIR
+            y = 2020
+            xml_file = os.path.join(XML_DIR, f"{y}.xml")
+            assert read_year_summary(y) is None
+            for k in [3, 1, 2]:
+                save_entry(f"Test {k}", f"{y:04d}-12-02T{k:02d}:31:00")
+            info = read_year_summary(y)
+            assert info.n_entries == 3
+            assert info.min_stamp == iso_to_stamp("2020-12-02T01:31:00")
+            assert info.max_stamp == iso_to_stamp("2020-12-02T03:31:00")
+            tree, _ = load_XML(y)
+            assert get_head_summary(tree) == info
+
+            # The checksum does not depend on the order
+            doc = tree.getroot().find("doc")
+            assert summarize_entries(reversed(list(doc))) == info
+
+            # After compaction, the head contains the summary
+            compact_journal(y)
+            assert read_head(xml_file)["count"] == "3"
+            assert read_year_summary(y) == info
+
+    def test_old_file_without_summary(self):
+        with create_test_dirs():
+            story_time.util.xml_folder = XML_DIR
+            y = 2020
+            xml_file = os.path.join(XML_DIR, f"{y}.xml")
+            tree = init_XML("Old", y)
+            head = tree.getroot().find("head")
+            for el in list(head)[2:]:
+                head.remove(el)
+            doc = tree.getroot().find("doc")
+            insert_text_entry(doc, f"{y:04d}-12-02T00:00:00", "Hoi")
+            tree.write(xml_file)
+            assert read_year_summary(y) is None
+
+            save_entry("Second", f"{y:04d}-12-03T00:00:00")
+            tree, _ = load_XML(y)
+            assert get_head_summary(tree).n_entries == 2
+            compact_journal(y)
+            assert read_year_summary(y).n_entries == 2
+
+    def test_streaming_reader(self):
+        with create_test_dirs():
+            story_time.util.xml_folder = XML_DIR
+            assert list(iter_year_records(2020)) == []
+            save_entry("First", "2020-12-02T05:31:00")
+            save_entry("Photo", "2020-12-02T06:31:00", "photo", "a/i.jpg")
+            compact_journal(2020)
+            save_entry("Journal\ntext", "2020-12-02T07:31:00")
+            save_entry("Next year", "2021-12-02T07:31:00")
+
+            recs = list(iter_year_records(2020))
+            assert recs == [
+                EntryRecord("2020-12-02T05:31:00", "text", "First"),
+                EntryRecord("2020-12-02T06:31:00", "photo", "Photo", "i.jpg"),
+                EntryRecord("2020-12-02T07:31:00", "text", "Journal\ntext"),
+            ]
+            assert recs[0].stamp == iso_to_stamp(recs[0].date_time)
+            texts = [r.text for r in iter_all_records(newer_first=True)]
+            assert texts == ["Next year", "First", "Photo", "Journal\ntext"]
+
+    def test_iter_entries(self):
+        with create_test_dirs():
+            story_time.util.xml_folder = XML_DIR
+            records = [
+                EntryRecord("2018-07-01T10:00:00", "text", "Old"),
+                EntryRecord("2019-03-02T10:00:00", "photo", "Photo", "i.jpg"),
+                EntryRecord("2019-03-20T08:00:00", "text", "March"),
+                EntryRecord("2019-04-01T00:00:00", "text", "April"),
+                EntryRecord("2021-01-05T12:00:00", "text", "New"),
+            ]
+            save_entries(records)
+            assert list(iter_entries()) == records
+            march = date_to_stamp(2019, 3, 1), date_to_stamp(2019, 4, 1)
+            assert list(iter_entries(*march)) == records[1:3]
+            assert list(iter_entries(*march, types=("text",))) == records[2:3]
+            assert list(iter_entries(march[0], newer_first=True)) == records[:0:-1]
+            assert list(iter_entries(end=march[0])) == records[:1]
+            assert list(iter_entries(date_to_stamp(2019, 5, 1), march[0])) == []
+
+    def test_journal_disabled(self):
+        with create_test_dirs():
+            story_time.util.xml_folder = XML_DIR
+            story_time.XML_write.use_journal = False
+            try:
+                for k in range(2):
+                    save_entry(f"Test {k}", f"2020-12-02T{5 + k:02d}:31:00")
+            finally:
+                story_time.XML_write.use_journal = True
+            assert not os.path.isfile(get_journal_file(2020))
+            tree = elTree.parse(os.path.join(XML_DIR, "2020.xml"))
+            assert len(tree.getroot().find("doc")) == 2
+
+    def test_save_entries(self):
+        with create_test_dirs():
+            story_time.util.xml_folder = XML_DIR
+            save_entry("Existing", "2020-12-02T05:31:00")
+            save_entry("Journal", "2020-12-02T06:31:00")
+            records = [
+                EntryRecord("2021-01-01T10:00:00", "text", "New year"),
+                EntryRecord("2020-12-24T18:00:00", "photo", "Tree", "tree.jpg"),
+                EntryRecord("2020-12-24T19:00:00", "blah", "Invalid"),
+                EntryRecord("not a date", "text", "Invalid"),
+            ]
+            results = save_entries(records)
+            assert results[:2] == [None, None]
+            assert results[2] is not None and results[3] is not None
+
+            assert not os.path.isfile(get_journal_file(2020))
+            texts = [r.text for r in iter_year_records(2020)]
+            assert texts == ["Existing", "Journal", "Tree"]
+            assert [r.text for r in iter_year_records(2021)] == ["New year"]
+            assert read_year_summary(2020).n_entries == 3
+
+    def test_sorted_entries(self):
+        with create_test_dirs():
+            story_time.util.xml_folder = XML_DIR
+            for h in [12, 8, 10, 8]:
+                save_entry(f"At {h}", f"2020-12-02T{h:02d}:00:00")
+            tree = load_XML(2020)[0]
+            assert is_sorted(tree)
+            texts = [ent.text for ent in tree.getroot().find("doc")]
+            assert texts == ["At 8", "At 8", "At 10", "At 12"]
+
+            # Streaming with a range stops early in sorted files
+            compact_journal(2020)
+            start = iso_to_stamp("2020-12-02T09:00:00")
+            end = iso_to_stamp("2020-12-02T12:00:00")
+            recs = list(iter_year_records(2020, start, end))
+            assert [r.text for r in recs] == ["At 10"]
+
+    def test_legacy_unsorted_file(self):
+        with create_test_dirs():
+            story_time.util.xml_folder = XML_DIR
+            tree = init_XML("Old", 2020)
+            doc = tree.getroot().find("doc")
+            for h in [12, 8, 10]:
+                ent = elTree.SubElement(doc, "entry", type="text")
+                ent.set("date_time", f"2020-12-02T{h:02d}:00:00")
+                ent.text = f"At {h}"
+            tree.getroot().find("head").remove(tree.getroot().find("head/sorted"))
+            xml_file = os.path.join(XML_DIR, "2020.xml")
+            tree.write(xml_file)
+
+            texts = [ent.text for ent in load_XML(2020)[0].getroot().find("doc")]
+            assert texts == ["At 8", "At 10", "At 12"]
+            assert read_head(xml_file)["sorted"] == "1"
+            assert [r.text for r in iter_year_records(2020)] == texts
 
     pass
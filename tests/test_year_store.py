@@ -0,0 +1,83 @@
+import os
+import xml.etree.cElementTree as elTree
+from unittest import TestCase
+
+import story_time.util
+from story_time.XML_write import init_XML, load_XML, save_entry
+from story_time.year_store import YearStore, file_signature, year_store
+from tests.test_util import create_test_dirs, xml_dir
+
+
+def write_tree(year: int) -> str:
+    f_name = os.path.join(xml_dir, f"{year}.xml")
+    init_XML(f"Year {year}", year).write(f_name)
+    return f_name
+
+
+class TestYearStore(TestCase):
+    def test_file_signature(self):
+        assert file_signature(os.path.join(xml_dir, "not_existing.xml")) is None
+
+    def test_caching(self):
+        with create_test_dirs():
+            store = YearStore()
+            f_name = write_tree(2020)
+            tree = store.get(f_name)
+            assert store.misses == 1
+            assert store.get(f_name) is tree
+            assert store.hits == 1
+
+            # Changing the file invalidates the cached tree
+            t = init_XML("Changed comment", 2020)
+            t.write(f_name)
+            tree_2 = store.get(f_name)
+            assert tree_2 is not tree
+            assert tree_2.getroot().find("head").find("text").text == "Changed comment"
+
+            # Removed files are not returned
+            os.remove(f_name)
+            assert store.get(f_name) is None
+            assert f_name not in store
+
+    def test_put_and_invalidate(self):
+        with create_test_dirs():
+            store = YearStore()
+            f_name = write_tree(2020)
+            tree = elTree.parse(f_name)
+            tree.getroot().find("head").find("text").text = "New"
+            tree.write(f_name)
+            store.put(f_name, tree)
+            assert store.get(f_name) is tree
+            assert store.misses == 0
+            store.invalidate(f_name)
+            assert f_name not in store
+            store.get(f_name)
+            store.invalidate()
+            assert len(store) == 0 and store.n_bytes == 0
+
+    def test_lru_eviction(self):
+        with create_test_dirs():
+            f_names = [write_tree(2020 + k) for k in range(3)]
+            one_size = YearStore()
+            one_size.get(f_names[0])
+            store = YearStore(max_bytes=2 * one_size.n_bytes)
+            store.get(f_names[0])
+            store.get(f_names[1])
+            store.get(f_names[0])
+            store.get(f_names[2])
+            assert f_names[0] in store and f_names[2] in store
+            assert f_names[1] not in store
+            store.set_max_bytes(0)
+            assert len(store) == 1 and f_names[2] in store
+
+    def test_used_by_load_and_save(self):
+        with create_test_dirs():
+            story_time.util.xml_folder = xml_dir
+            dt = "2020-12-02T05:31:00"
+            save_entry("Test", dt, "text")
+            tree, f = load_XML(2020)
+            assert f in year_store
+            assert load_XML(2020)[0] is tree
+            save_entry("Test 2", dt, "text")
+            tree_2, _ = load_XML(2020)
+            assert len(tree_2.getroot().find("doc")) == 2